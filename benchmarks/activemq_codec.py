@@ -0,0 +1,43 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Benchmark encoding and decoding a ReductionMessage with each installed codec, compared with
+the json.dumps and json.loads of a serialise_data dictionary done by producers and consumers
+
+Usage: python -m benchmarks.activemq_codec
+"""
+import json
+import timeit
+
+from src.activemq import ActiveMQClient
+from src.activemq.codec import available_codecs, ReductionMessage
+
+
+def main(repeats=100000):
+    """ Print the mean time to encode and decode a message """
+    fields = ActiveMQClient.serialise_data(1234567, 'WISH', '/archive/NDXWISH/WISH00012345.nxs',
+                                           12345, -1)
+    message = ReductionMessage.from_dict(fields)
+    body = json.dumps(fields)
+    approaches = [('dict + json', lambda: json.dumps(fields), lambda: json.loads(body))]
+    for name, codec in available_codecs().items():
+        encoded = codec.encode(fields)
+        approaches.append(
+            ('ReductionMessage + ' + name,
+             lambda codec=codec: codec.encode(message.to_dict()),
+             lambda codec=codec, encoded=encoded: ReductionMessage.from_dict(
+                 codec.decode(encoded))))
+    print('{:<30}{:>12}{:>12}{:>8}'.format('', 'encode us', 'decode us', 'bytes'))
+    for name, encode, decode in approaches:
+        print('{:<30}{:>12.2f}{:>12.2f}{:>8}'.format(
+            name,
+            timeit.timeit(encode, number=repeats) / repeats * 1e6,
+            timeit.timeit(decode, number=repeats) / repeats * 1e6,
+            len(encode())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Benchmark the latency of ActiveMQClient.connect() against a local STOMP broker stand-in,
+compared with the previous behaviour of sleeping for 0.5s after sending CONNECT
+
+Usage: python -m benchmarks.activemq_connect
+"""
+import statistics
+import time
+
+import stomp
+
+from src.activemq import ActiveMQClient, ActiveMQSettings
+from src.activemq.tests.stomp_stand_in import StompStandIn
+
+
+def fixed_sleep_connect(broker):
+    """ Connect as ActiveMQClient did before waiting for the CONNECTED frame """
+    connection = stomp.Connection(host_and_ports=[(broker.host, broker.port)])
+    connection.connect(username='user', passcode='pass', wait=False)
+    time.sleep(0.5)
+    return connection
+
+
+def client_connect(broker):
+    """ Connect using ActiveMQClient """
+    client = ActiveMQClient(ActiveMQSettings(username='user', password='pass',
+                                             host=broker.host, port=str(broker.port)))
+    client.connect()
+    return client
+
+
+def measure(connect, broker, repeats):
+    """ :return: list of the seconds taken by each connection """
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        connection = connect(broker)
+        latencies.append(time.perf_counter() - start)
+        connection.disconnect()
+    return latencies
+
+
+def main(repeats=10):
+    """ Print the median and maximum connection latency of each approach """
+    with StompStandIn() as broker:
+        for name, connect in [('fixed 0.5s sleep', fixed_sleep_connect),
+                              ('ActiveMQClient', client_connect)]:
+            latencies = measure(connect, broker, repeats)
+            print('{:<18} median {:>8.2f} ms  max {:>8.2f} ms'.format(
+                name, statistics.median(latencies) * 1e3, max(latencies) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Benchmark the consume throughput of ActiveMQClient against a local STOMP broker stand-in that
+adds a delay to every frame it handles, simulating a network round trip, for a range of ack
+modes, prefetch and ack batch sizes
+
+Usage: python -m benchmarks.activemq_consume
+"""
+import threading
+import time
+
+import stomp
+
+from src.activemq import ActiveMQClient, ActiveMQSettings
+from src.activemq.tests.stomp_stand_in import StompStandIn
+
+QUEUE = '/queue/DataReady'
+
+
+# Tuples of the ack mode, prefetch size and ack batch size measured
+SETTINGS = [('auto', 1, 1), ('client', 1, 1), ('client', 10, 1), ('client', 100, 1),
+            ('client', 10, 10), ('client', 100, 10), ('client', 100, 50), ('client', 1000, 100),
+            ('client-individual', 10, 1), ('client-individual', 100, 1)]
+
+
+class AcknowledgingListener(stomp.ConnectionListener):
+    """ Acknowledges each message as it is received, unless the ack mode is auto """
+
+    def __init__(self, client, expected, ack='client'):
+        self.client = client
+        self.expected = expected
+        self.ack = ack
+        self.received = 0
+        self.done = threading.Event()
+
+    def on_message(self, headers, body):
+        if self.ack != 'auto':
+            self.client.ack(headers['message-id'], headers['subscription'])
+        self.received += 1
+        if self.received == self.expected:
+            self.done.set()
+
+
+def measure(broker, messages, prefetch_size, ack_batch_size, ack='client'):
+    """ :return: messages consumed per second """
+    client = ActiveMQClient(ActiveMQSettings(username='user', password='pass',
+                                             host=broker.host, port=str(broker.port),
+                                             prefetch_size=prefetch_size,
+                                             ack_batch_size=ack_batch_size,
+                                             ack_batch_interval=0.05))
+    client.connect()
+    for index in range(messages):
+        client.send(QUEUE, str(index))
+    broker.wait_for(lambda: len(broker.queues.get(QUEUE, [])) == messages, timeout=60)
+    listener = AcknowledgingListener(client, messages, ack)
+    start = time.perf_counter()
+    client.subscribe_queues([QUEUE], 'consumer', listener, ack=ack)
+    listener.done.wait(120)
+    elapsed = time.perf_counter() - start
+    client.disconnect()
+    return listener.received / elapsed
+
+
+def main(messages=500, latency=0.001):
+    """ Print the throughput of each combination of ack mode, prefetch and ack batch size """
+    for ack, prefetch_size, ack_batch_size in SETTINGS:
+        with StompStandIn(latency=latency) as broker:
+            throughput = measure(broker, messages, prefetch_size, ack_batch_size, ack)
+            print('{:<17}  prefetch {:>5}  ack batch {:>4}  {:>9.0f} msg/s'.format(
+                ack, prefetch_size, ack_batch_size, throughput))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Benchmark publishing status messages from many threads against a local STOMP broker
+stand-in, comparing a new ActiveMQClient for each message with a shared ProducerPool
+
+Usage: python -m benchmarks.activemq_producer_pool
+"""
+import threading
+import time
+
+from src.activemq import ActiveMQClient, ActiveMQSettings
+from src.activemq.producer_pool import ProducerPool
+from src.activemq.tests.stomp_stand_in import StompStandIn
+
+QUEUE = '/queue/ReductionStarted'
+
+
+def client_per_message(settings):
+    """ :return: function sending each message with its own ActiveMQClient """
+    def send(message):
+        client = ActiveMQClient(settings)
+        client.send(QUEUE, message)
+        client.disconnect()
+    return send, lambda: None
+
+
+def pooled(settings, max_connections):
+    """ :return: function sending each message through a ProducerPool """
+    pool = ProducerPool(settings, max_connections=max_connections)
+    return lambda message: pool.send(QUEUE, message), pool.close
+
+
+def measure(broker, sender, threads, messages):
+    """ :return: messages published per second """
+    send, close = sender
+
+    def publish():
+        for index in range(messages):
+            send(str(index))
+
+    workers = [threading.Thread(target=publish) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    broker.wait_for(lambda: len(broker.sent.get(QUEUE, [])) == threads * messages, timeout=60)
+    elapsed = time.perf_counter() - start
+    close()
+    return threads * messages / elapsed
+
+
+def main(threads=8, messages=100):
+    """ Print the publish throughput of each approach """
+    approaches = [('ActiveMQClient per message', client_per_message),
+                  ('ProducerPool(1)', lambda settings: pooled(settings, 1)),
+                  ('ProducerPool(4)', lambda settings: pooled(settings, 4)),
+                  ('ProducerPool(8)', lambda settings: pooled(settings, 8))]
+    for name, create in approaches:
+        with StompStandIn() as broker:
+            settings = ActiveMQSettings(username='user', password='pass',
+                                        host=broker.host, port=str(broker.port))
+            throughput = measure(broker, create(settings), threads, messages)
+            print('{:<28} {:>9.0f} msg/s'.format(name, throughput))
+
+
+if __name__ == '__main__':
+    main()
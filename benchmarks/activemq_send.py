@@ -0,0 +1,61 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Benchmark publishing a backlog of messages with ActiveMQClient.send() compared with
+send_batch() against a local STOMP broker stand-in
+
+Usage: python -m benchmarks.activemq_send
+"""
+import time
+
+from src.activemq import ActiveMQClient, ActiveMQSettings
+from src.activemq.tests.stomp_stand_in import StompStandIn
+
+QUEUE = '/queue/DataReady'
+
+
+def send_each(client, messages):
+    """ Send each message with ActiveMQClient.send """
+    for message in messages:
+        client.send(QUEUE, message)
+
+
+APPROACHES = [('send()', send_each),
+              ('send_batch(chunk_size=100)',
+               lambda client, messages: client.send_batch(QUEUE, messages, chunk_size=100)),
+              ('send_batch(chunk_size=1000)',
+               lambda client, messages: client.send_batch(QUEUE, messages, chunk_size=1000)),
+              ('send_batch(receipts=False)',
+               lambda client, messages: client.send_batch(QUEUE, messages, receipts=False))]
+
+
+def measure(send, count):
+    """
+    :param send: Function sending a list of messages with an ActiveMQClient
+    :param count: The number of messages to send
+    :return: messages sent per second
+    """
+    messages = ['message {}'.format(index) for index in range(count)]
+    with StompStandIn() as broker:
+        client = ActiveMQClient(ActiveMQSettings(username='user', password='pass',
+                                                 host=broker.host, port=str(broker.port)))
+        client.connect()
+        start = time.perf_counter()
+        send(client, messages)
+        broker.wait_for(lambda: len(broker.sent.get(QUEUE, [])) == count, timeout=60)
+        elapsed = time.perf_counter() - start
+        client.disconnect()
+    return count / elapsed
+
+
+def main(count=5000):
+    """ Print the messages per second of each way of sending """
+    for name, send in APPROACHES:
+        print('{:<28} {:>9.0f} msg/s'.format(name, measure(send, count)))
+
+
+if __name__ == '__main__':
+    main()
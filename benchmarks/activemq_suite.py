@@ -0,0 +1,128 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Run the ActiveMQClient connect, send and consume benchmarks against local STOMP broker
+stand-ins, save the results to a JSON file and compare them with the results of an earlier
+version
+
+Usage: python -m benchmarks.activemq_suite [--label LABEL] [--output FILE] [--compare FILE]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+
+from benchmarks import activemq_connect, activemq_consume, activemq_send
+from src.activemq.tests.stomp_stand_in import StompStandIn
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def git_label():
+    """ :return: The abbreviated hash of the checked out commit or 'unknown' """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              check=True, text=True,
+                              cwd=os.path.dirname(RESULTS_DIRECTORY)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(repeats=20, send_count=5000, consume_count=500, latency=0.001):
+    """
+    Run every benchmark
+    :param repeats: The number of connections timed
+    :param send_count: The number of messages sent by each send benchmark
+    :param consume_count: The number of messages consumed by each consume benchmark
+    :param latency: Seconds the stand-in waits before handling each frame of the consume
+                    benchmarks
+    :return: dictionary of benchmark name to result, where connect latencies are in
+             milliseconds and throughputs in messages per second
+    """
+    results = {}
+    with StompStandIn() as broker:
+        latencies = activemq_connect.measure(activemq_connect.client_connect, broker, repeats)
+    results['connect median ms'] = statistics.median(latencies) * 1e3
+    results['connect max ms'] = max(latencies) * 1e3
+    for name, send in activemq_send.APPROACHES:
+        results['{} msg/s'.format(name)] = activemq_send.measure(send, send_count)
+    for ack, prefetch_size, ack_batch_size in activemq_consume.SETTINGS:
+        with StompStandIn(latency=latency) as broker:
+            results['consume {} prefetch {} ack batch {} msg/s'.format(
+                ack, prefetch_size, ack_batch_size)] = activemq_consume.measure(
+                    broker, consume_count, prefetch_size, ack_batch_size, ack)
+    return results
+
+
+def compare(results, baseline):
+    """
+    :param results: The results of this run
+    :param baseline: The results of an earlier run
+    :return: list of lines describing the change in each result measured by both runs
+    """
+    lines = []
+    for name, value in results.items():
+        if name not in baseline:
+            continue
+        previous = baseline[name]
+        change = (value - previous) / previous * 100 if previous else 0.0
+        # Lower latencies and higher throughputs are improvements
+        better = change < 0 if name.endswith(' ms') else change > 0
+        lines.append('{:<56} {:>10.2f} {:>10.2f} {:>+8.1f}% {}'.format(
+            name, previous, value, change, 'better' if better else 'worse'))
+    return lines
+
+
+def main(argv=None):
+    """
+    Command line entry point
+    """
+    parser = argparse.ArgumentParser(description='Benchmark ActiveMQClient against local '
+                                                 'STOMP broker stand-ins')
+    parser.add_argument('--label', default=None,
+                        help='name of the version benchmarked (default: the git commit)')
+    parser.add_argument('--output', default=None,
+                        help='file to save the results to (default: benchmarks/results/'
+                             'activemq-LABEL.json)')
+    parser.add_argument('--compare', default=None,
+                        help='results file of an earlier run to compare with')
+    parser.add_argument('--repeats', type=int, default=20,
+                        help='number of connections timed')
+    parser.add_argument('--messages', type=int, default=5000,
+                        help='number of messages sent by each send benchmark')
+    parser.add_argument('--consume-messages', type=int, default=500,
+                        help='number of messages consumed by each consume benchmark')
+    args = parser.parse_args(argv)
+
+    label = args.label or git_label()
+    results = run(args.repeats, args.messages, args.consume_messages)
+    for name, value in results.items():
+        print('{:<56} {:>10.2f}'.format(name, value))
+
+    output = args.output or os.path.join(RESULTS_DIRECTORY, 'activemq-{}.json'.format(label))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as results_file:
+        json.dump({'label': label,
+                   'python': platform.python_version(),
+                   'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                   'results': results}, results_file, indent=2)
+    print('Results saved to {}'.format(output))
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        print('\nCompared with {}'.format(baseline['label']))
+        print('{:<56} {:>10} {:>10} {:>9}'.format('', baseline['label'][:10], label[:10],
+                                                   'change'))
+        for line in compare(results, baseline['results']):
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Benchmark inserting reduction runs one ORM object at a time against the bulk insert API,
+with and without returning the ids of the new runs
+
+Usage: python -m benchmarks.sql_bulk
+"""
+import os
+import shutil
+import tempfile
+import time
+
+from src.sql_database import SQLDatabaseClient
+from src.sql_database.tests.sqlite_stand_in import (create_stand_in_database,
+                                                    QueryCounter, SQLiteSettings)
+
+
+def _runs(count, offset):
+    """ :return: list of dictionaries describing reduction runs """
+    return [{'run_number': offset + number, 'run_version': 0, 'instrument_id': 1,
+             'experiment_id': 1, 'status_id': 1} for number in range(count)]
+
+
+def per_object(client, runs):
+    """ Add and flush each run individually then commit """
+    reduction_run = client.reduction_run()
+    session = client.get_connection()
+    for run in runs:
+        session.add(reduction_run(**run))
+        session.flush()
+    session.commit()
+
+
+def main(count=5000, chunk_size=1000):
+    """ Print the time and statements used by each approach """
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'autoreduction.sqlite3')
+        create_stand_in_database(path)
+        client = SQLDatabaseClient(SQLiteSettings(path))
+        client.connect()
+        client.reduction_run()
+        # pylint:disable=protected-access
+        with QueryCounter(client._engine) as counter:
+            start = time.perf_counter()
+            per_object(client, _runs(count, 0))
+            elapsed = time.perf_counter() - start
+        print('per object: {:>8.3f}s {:>6} statements'.format(elapsed, counter.count))
+        for offset, (name, return_ids) in enumerate((('bulk:', False),
+                                                     ('bulk ids:', True)), 1):
+            with QueryCounter(client._engine) as counter:
+                start = time.perf_counter()
+                client.bulk_insert_runs(_runs(count, offset * count), chunk_size=chunk_size,
+                                        return_ids=return_ids)
+                elapsed = time.perf_counter() - start
+            print('{:<11} {:>8.3f}s {:>6} statements'.format(name, elapsed, counter.count))
+        client.disconnect()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Benchmark the hot path queries against building the equivalent ORM query on every call
+
+Usage: python -m benchmarks.sql_hot_path
+"""
+import os
+import shutil
+import tempfile
+import timeit
+
+from sqlalchemy import desc
+
+from src.sql_database import SQLDatabaseClient
+from src.sql_database.tests.sqlite_stand_in import create_stand_in_database, SQLiteSettings
+
+
+def main(runs=1000, repeats=2000):
+    """ Print the mean time per lookup of the latest version of a run """
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'autoreduction.sqlite3')
+        create_stand_in_database(path)
+        client = SQLDatabaseClient(SQLiteSettings(path))
+        session = client.connect()
+        client.bulk_insert_runs([{'run_number': number, 'run_version': version,
+                                  'instrument_id': 1, 'experiment_id': 1, 'status_id': 1}
+                                 for number in range(runs) for version in range(3)],
+                                return_ids=False)
+        reduction_run = client.reduction_run()
+        instrument = client.instrument()
+
+        def orm_query():
+            session.query(reduction_run).join(instrument, reduction_run.instrument) \
+                .filter(instrument.name == 'WISH', reduction_run.run_number == 500) \
+                .order_by(desc(reduction_run.run_version)).first()
+
+        def hot_path_query():
+            client.hot_path_query('latest_run_version', instrument='WISH', run_number=500)
+
+        for name, function in [('ORM query', orm_query), ('hot path query', hot_path_query)]:
+            function()
+            mean = timeit.timeit(function, number=repeats) / repeats
+            print('{:<16}{:>10.1f} us per call'.format(name, mean * 1e6))
+        client.disconnect()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
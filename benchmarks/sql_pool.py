@@ -0,0 +1,97 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Benchmark the throughput of worker threads using one SQLDatabaseClient each against
+worker threads sharing a single SQLDatabaseClient and its connection pool
+
+Usage: python -m benchmarks.sql_pool
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from src.sql_database import SQLDatabaseClient
+from src.sql_database.tests.sqlite_stand_in import create_stand_in_database, SQLiteSettings
+
+
+def _run_threads(threads, target):
+    """ Run target on the given number of threads and return the elapsed time """
+    workers = [threading.Thread(target=target) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def client_per_thread(path, threads, queries):
+    """ Each thread builds, connects and disconnects its own client """
+    def work():
+        client = SQLDatabaseClient(SQLiteSettings(path))
+        session = client.connect()
+        status = client.status()
+        for _ in range(queries):
+            session.query(status).filter_by(value='Queued').one()
+        client.disconnect()
+    return _run_threads(threads, work)
+
+
+def shared_client(path, threads, queries, pool_size):
+    """ All threads share one client and a bounded pool using their thread local session """
+    client = SQLDatabaseClient(SQLiteSettings(path, pool_size=pool_size, max_overflow=0))
+    client.connect()
+    status = client.status()
+
+    def work():
+        session = client.get_connection()
+        for _ in range(queries):
+            session.query(status).filter_by(value='Queued').one()
+        client.remove_session()
+    elapsed = _run_threads(threads, work)
+    client.disconnect()
+    return elapsed
+
+
+def shared_client_scoped(path, threads, queries, pool_size):
+    """ All threads share one client and a bounded pool using a session per query """
+    client = SQLDatabaseClient(SQLiteSettings(path, pool_size=pool_size, max_overflow=0))
+    client.connect()
+    status = client.status()
+
+    def work():
+        for _ in range(queries):
+            with client.session_scope() as session:
+                session.query(status).filter_by(value='Queued').one()
+    elapsed = _run_threads(threads, work)
+    client.disconnect()
+    return elapsed
+
+
+def main(threads=16, queries=200, pool_size=4):
+    """ Print the queries per second achieved by each approach """
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'autoreduction.sqlite3')
+        create_stand_in_database(path)
+        total = threads * queries
+        elapsed = client_per_thread(path, threads, queries)
+        print('client per thread ({} engines): {:>10.0f} queries/s'.format(threads,
+                                                                         total / elapsed))
+        elapsed = shared_client(path, threads, queries, pool_size)
+        print('shared client ({} connections): {:>10.0f} queries/s'.format(pool_size,
+                                                                         total / elapsed))
+        elapsed = shared_client_scoped(path, threads, queries, pool_size)
+        print('session_scope ({} connections): {:>10.0f} queries/s'.format(pool_size,
+                                                                         total / elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Benchmark the number of reflection queries issued by the SQLDatabaseClient table functions
+
+Usage: python -m benchmarks.sql_reflection
+"""
+import os
+import shutil
+import tempfile
+import timeit
+
+from src.sql_database import SQLDatabaseClient
+from src.sql_database.tests.sqlite_stand_in import (create_stand_in_database,
+                                                    QueryCounter, SQLiteSettings)
+
+TABLE_FUNCTIONS = ['instrument', 'status', 'experiment', 'reduction_run',
+                   'reduction_data_location', 'reduction_location', 'run_variables']
+
+
+def main(repeats=100):
+    """
+    Print the queries issued and mean time taken by the first and subsequent calls to
+    each of the table functions
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'autoreduction.sqlite3')
+        create_stand_in_database(path)
+        client = SQLDatabaseClient(SQLiteSettings(path))
+        client.connect()
+        print('{:<25}{:>15}{:>15}{:>18}'.format('table', 'cold queries',
+                                                 'warm queries', 'warm mean (us)'))
+        for name in TABLE_FUNCTIONS:
+            table_function = getattr(client, name)
+            with QueryCounter(client._engine) as cold:  # pylint:disable=protected-access
+                table_function()
+            with QueryCounter(client._engine) as warm:  # pylint:disable=protected-access
+                table_function()
+            mean = timeit.timeit(table_function, number=repeats) / repeats
+            print('{:<25}{:>15}{:>15}{:>18.2f}'.format(name, cold.count, warm.count,
+                                                       mean * 1e6))
+        client.disconnect()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,7 +12,7 @@ setup_requires = ['mysqlclient',
                   'PyMySQL',
                   'pysftp',
                   'SQLAlchemy',
-                  'stomp.py',
+                  'stomp.py>=6.0,<6.1',
                   'suds-py3']
 
 
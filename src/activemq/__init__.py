@@ -4,4 +4,5 @@
 # Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
 # ################################################################################# #
 from src.activemq.client import ActiveMQClient
+from src.activemq.async_client import AsyncActiveMQClient
 from src.activemq.settings import ActiveMQSettings
@@ -0,0 +1,172 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Batched cumulative acknowledgement of messages received in client ack mode
+"""
+import logging
+import threading
+import time
+
+import stomp
+
+
+class BatchAcknowledger(stomp.ConnectionListener):
+    """
+    Acknowledges the messages of client ack mode subscriptions in batches. In client mode an
+    ACK acknowledges the message and every earlier message delivered to the subscription, so
+    only the latest message of a batch is acknowledged, once batch_size messages have been
+    acknowledged or interval seconds have passed since the oldest, whichever is first.
+    Messages must therefore be acknowledged in the order they were delivered.
+
+    The batch size of a subscription is limited to its prefetch size, as the broker stops
+    dispatching once that many messages are unacknowledged. Pending acknowledgements are
+    discarded if the connection is lost, so the broker redelivers those messages.
+    """
+
+    def __init__(self, send_ack, batch_size=100, interval=0.1):
+        """
+        :param send_ack: Function called with the message id and subscription id to send
+                         a cumulative ACK frame
+        :param batch_size: The number of messages acknowledged by each ACK frame
+        :param interval: The maximum seconds a message waits to be acknowledged
+        """
+        self._send_ack = send_ack
+        self._batch_size = batch_size
+        self._interval = interval
+        self._limits = {}
+        # subscription id -> [latest message id, number of messages, time of the oldest]
+        self._pending = {}
+        self._closed = False
+        self._condition = threading.Condition()
+        self._send_lock = threading.Lock()
+        self.frames_sent = 0
+        self._thread = threading.Thread(target=self._run, name='BatchAcknowledger',
+                                        daemon=True)
+        self._thread.start()
+
+    def track(self, subscription, prefetch):
+        """
+        Batch the acknowledgements of a client ack mode subscription
+        :param subscription: The subscription id
+        :param prefetch: The prefetch size of the subscription
+        """
+        with self._condition:
+            self._limits[subscription] = max(1, min(self._batch_size, prefetch,
+                                                    self._limits.get(subscription, prefetch)))
+
+    def untrack(self, subscription):
+        """
+        Send any pending acknowledgement of a subscription and stop batching it
+        :param subscription: The subscription id
+        """
+        self._send(subscription)
+        with self._condition:
+            self._limits.pop(subscription, None)
+
+    def is_tracked(self, subscription):
+        """ :return: True if acknowledgements of the subscription are batched """
+        with self._condition:
+            return subscription in self._limits
+
+    def ack(self, message_id, subscription):
+        """
+        Acknowledge a message and, cumulatively, the messages delivered before it
+        :param message_id: The message-id header of the message
+        :param subscription: The subscription header of the message
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Messages can not be acknowledged after the "
+                                   "acknowledger is closed")
+            pending = self._pending.get(subscription)
+            if pending is None:
+                pending = self._pending[subscription] = [message_id, 0, time.monotonic()]
+                self._condition.notify()
+            pending[0] = message_id
+            pending[1] += 1
+            due = pending[1] >= self._limits.get(subscription, 1)
+        if due:
+            self._send(subscription)
+
+    def flush(self):
+        """
+        Send every pending acknowledgement now
+        """
+        with self._condition:
+            subscriptions = list(self._pending)
+        for subscription in subscriptions:
+            self._send(subscription)
+
+    def reset(self):
+        """
+        Discard the pending acknowledgements so the broker redelivers their messages
+        :return: The number of messages whose acknowledgement was discarded
+        """
+        with self._condition:
+            discarded = sum(pending[1] for pending in self._pending.values())
+            self._pending = {}
+        if discarded:
+            logging.warning("Discarded %s unsent acknowledgements", discarded)
+        return discarded
+
+    def close(self):
+        """
+        Send every pending acknowledgement and stop the background thread
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+
+    def pending(self):
+        """ :return: The number of messages waiting to be acknowledged """
+        with self._condition:
+            return sum(pending[1] for pending in self._pending.values())
+
+    def on_disconnected(self):
+        """ Called when the connection to the broker is lost or closed """
+        self.reset()
+
+    def _send(self, subscription):
+        """ Send an ACK frame for the pending acknowledgement of a subscription, if any """
+        # Taking and sending under one lock keeps the ACK frames of a subscription in order
+        with self._send_lock:
+            with self._condition:
+                pending = self._pending.pop(subscription, None)
+            if pending is None:
+                return
+            try:
+                self._send_ack(pending[0], subscription)
+                self.frames_sent += 1
+            # pylint:disable=broad-except
+            except Exception as exp:
+                logging.error("Unable to acknowledge message %s: %s", pending[0], exp)
+
+    def _due(self):
+        """ :return: list of subscriptions whose oldest pending acknowledgement is due """
+        now = time.monotonic()
+        return [subscription for subscription, pending in self._pending.items()
+                if pending[2] + self._interval <= now]
+
+    def _run(self):
+        """ Send acknowledgements as they become due until the acknowledger is closed """
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if self._due():
+                        break
+                    if self._pending:
+                        oldest = min(pending[2] for pending in self._pending.values())
+                        self._condition.wait(max(0.0, oldest + self._interval -
+                                                 time.monotonic()))
+                    else:
+                        self._condition.wait()
+                if self._closed:
+                    return
+                due = self._due()
+            for subscription in due:
+                self._send(subscription)
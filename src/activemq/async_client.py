@@ -0,0 +1,372 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Client class for accessing the queuing service from asyncio
+"""
+import asyncio
+import itertools
+import logging
+
+from src.abstract_client import AbstractClient
+from src.activemq.codec import encode_message, get_codec
+from src.activemq.connection_state import CLOSED, CONNECTED, CONNECTING
+from src.activemq.frames import encode_frame, Frame, HEARTBEAT, parse_frames
+from src.activemq.statistics import SENT_HEADER, sent_timestamp
+from src.connection_exception import ConnectionException
+
+
+class AsyncSubscription:
+    """
+    Async iterator of the MESSAGE frames delivered to a subscription. Iteration stops when
+    the subscription is ended and raises ConnectionException if the connection is lost.
+    """
+
+    def __init__(self, client, subscription_id, destination, ack):
+        self.client = client
+        self.id = subscription_id
+        self.destination = destination
+        self.ack_mode = ack
+        self._frames = asyncio.Queue()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        frame = await self._frames.get()
+        if frame is None:
+            # Leave the end marker for any other consumer of the subscription
+            self._frames.put_nowait(None)
+            raise StopAsyncIteration
+        if isinstance(frame, Exception):
+            self._frames.put_nowait(frame)
+            raise frame
+        return frame
+
+    async def ack(self, frame):
+        """ Acknowledge a message received from this subscription """
+        await self.client.ack(frame)
+
+    async def nack(self, frame):
+        """ Reject a message received from this subscription """
+        await self.client.nack(frame)
+
+    async def unsubscribe(self):
+        """ End the subscription """
+        await self.client.unsubscribe(self)
+
+    def pending(self):
+        """ :return: The number of messages received but not yet iterated over """
+        return self._frames.qsize()
+
+    def _deliver(self, item):
+        """ Queue a frame, the end marker None or the exception that ended the subscription """
+        self._frames.put_nowait(item)
+
+
+# pylint:disable=too-many-instance-attributes
+class AsyncActiveMQClient(AbstractClient):
+    """
+    Class for client to access messaging service from asyncio, speaking STOMP 1.1 directly
+    over asyncio streams so no threads are needed
+    """
+
+    def __init__(self, credentials, receipt_timeout=10.0):
+        """
+        :param credentials: ActiveMQSettings of the broker, including the heartbeat interval
+                            and tolerance
+        :param receipt_timeout: The maximum seconds to wait for the broker to confirm a frame
+        """
+        super(AsyncActiveMQClient, self).__init__(credentials)
+        self._heartbeat = int(self.credentials.heartbeat * 1000)
+        self._receipt_timeout = receipt_timeout
+        self._codec = get_codec(self.credentials.codec)
+        self._state = CLOSED
+        self._disconnecting = False
+        self._reader = None
+        self._writer = None
+        self._tasks = []
+        self._connected = None
+        self._receipts = {}
+        self._receipt_ids = itertools.count(1)
+        self._subscriptions = {}
+        self._subscription_ids = itertools.count(1)
+        self._last_received = 0.0
+        self._last_sent = 0.0
+
+    @property
+    def state(self):
+        """
+        :return: The state of the connection: connecting, connected or closed
+        """
+        return self._state
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.disconnect()
+
+    # pylint:disable=invalid-overridden-method
+    async def connect(self):
+        """
+        Open the connection if it is not open and wait for the broker to accept it
+        :return: This client
+        """
+        if self._state == CONNECTED:
+            return self
+        loop = asyncio.get_running_loop()
+        host, port = self.credentials.host, int(self.credentials.port)
+        self._state = CONNECTING
+        self._disconnecting = False
+        self._connected = loop.create_future()
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port), self.credentials.connect_timeout)
+        except (OSError, asyncio.TimeoutError) as exp:
+            logging.error("Unable to connect to %s:%s: %s", host, port, exp)
+            self._state = CLOSED
+            raise ConnectionException("ActiveMQ") from exp
+        self._last_received = self._last_sent = loop.time()
+        self._tasks = [loop.create_task(self._read_loop())]
+        self._write_frame('CONNECT', {'accept-version': '1.1',
+                                      'host': host,
+                                      'login': self.credentials.username,
+                                      'passcode': self.credentials.password,
+                                      'heart-beat': '{0},{0}'.format(self._heartbeat)})
+        try:
+            frame = await asyncio.wait_for(asyncio.shield(self._connected),
+                                           self.credentials.connect_timeout)
+        except (ConnectionException, asyncio.TimeoutError) as exp:
+            logging.error("No CONNECTED frame received from %s:%s: %s", host, port, exp)
+            self._connected.cancel()
+            self._shutdown(None)
+            raise ConnectionException("ActiveMQ") from exp
+        self._state = CONNECTED
+        self._start_heartbeats(frame.headers.get('heart-beat', '0,0'))
+        logging.info("Connected to %s:%s", host, port)
+        return self
+
+    def _test_connection(self):
+        if self._state != CONNECTED:
+            raise ConnectionException("ActiveMQ")
+        return True
+
+    # pylint:disable=invalid-overridden-method
+    async def disconnect(self):
+        """
+        Close the connection, ending every subscription
+        """
+        if self._state == CONNECTED:
+            # The broker closes the connection after the receipt, which is not an error
+            self._disconnecting = True
+            try:
+                await self._send_frame('DISCONNECT', {}, receipt=True)
+            except ConnectionException:
+                pass
+        self._shutdown(None)
+
+    # pylint:disable=too-many-arguments
+    async def send(self, destination, message, persistent='true', priority='4', headers=None,
+                   receipt=False):
+        """
+        Send a message to a queue, setting the time it was sent in its sent-timestamp header
+        :param destination: Queue to send to
+        :param message: contents of the message. A dictionary or ReductionMessage is encoded
+                        with the codec of the settings and sent with its content-type.
+        :param persistent: should to message be persistent
+        :param priority: priority rating of the message
+        :param headers: Optional dictionary of additional headers
+        :param receipt: If True, wait for the broker to confirm it has received the message
+        :raises ConnectionException: If the message can not be sent or, when a receipt is
+                                     requested, the broker does not confirm it in time
+        """
+        message, content_type = encode_message(message, self._codec)
+        frame_headers = {'destination': destination,
+                         'persistent': persistent,
+                         'priority': priority,
+                         SENT_HEADER: sent_timestamp()}
+        if content_type is not None:
+            frame_headers['content-type'] = content_type
+        frame_headers.update(headers or {})
+        await self._send_frame('SEND', frame_headers, message, receipt)
+
+    async def subscribe(self, queue, ack='auto', prefetch=None):
+        """
+        Subscribe to a queue
+        :param queue: The queue to subscribe to
+        :param ack: The ack mode of the subscription: auto, client or client-individual
+        :param prefetch: The prefetch size, if not the one configured for the queue
+        :return: AsyncSubscription to iterate over the messages with
+        """
+        if prefetch is None:
+            prefetch = self.credentials.get_prefetch(queue)
+        subscription = AsyncSubscription(self, str(next(self._subscription_ids)), queue, ack)
+        self._subscriptions[subscription.id] = subscription
+        await self._send_frame('SUBSCRIBE', {'destination': queue,
+                                             'id': subscription.id,
+                                             'ack': ack,
+                                             'activemq.prefetchSize': str(prefetch)})
+        logging.info("Subscribing to %s", queue)
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        """
+        End a subscription. Iterating over it stops once the messages already received
+        have been returned.
+        """
+        if self._subscriptions.pop(subscription.id, None) is None:
+            raise KeyError("Not subscribed to {}".format(subscription.destination))
+        subscription._deliver(None)  # pylint:disable=protected-access
+        await self._send_frame('UNSUBSCRIBE', {'id': subscription.id})
+
+    async def ack(self, frame):
+        """ Acknowledge a message """
+        await self._send_frame('ACK', {'message-id': frame.headers['message-id'],
+                                       'subscription': frame.headers['subscription']})
+
+    async def nack(self, frame):
+        """ Reject a message so the broker redelivers it """
+        await self._send_frame('NACK', {'message-id': frame.headers['message-id'],
+                                        'subscription': frame.headers['subscription']})
+
+    def _write_frame(self, command, headers, body=b''):
+        """ Write a frame to the stream without waiting for it to be sent """
+        self._writer.write(encode_frame(command, headers, body))
+        self._last_sent = asyncio.get_running_loop().time()
+
+    async def _send_frame(self, command, headers, body=b'', receipt=False):
+        """
+        Send a frame, waiting if the stream's buffer is full
+        :param receipt: If True, wait for the broker to confirm the frame with a RECEIPT
+        :raises ConnectionException: If the frame can not be sent or is not confirmed in time
+        """
+        self._test_connection()
+        future = None
+        if receipt:
+            receipt_id = 'receipt-{}'.format(next(self._receipt_ids))
+            headers = dict(headers, receipt=receipt_id)
+            future = self._receipts[receipt_id] = asyncio.get_running_loop().create_future()
+        self._write_frame(command, headers, body)
+        try:
+            await self._writer.drain()
+        except OSError as exp:
+            self._shutdown(exp)
+            raise ConnectionException("ActiveMQ") from exp
+        if future is not None:
+            try:
+                await asyncio.wait_for(future, self._receipt_timeout)
+            except asyncio.TimeoutError as exp:
+                self._receipts.pop(receipt_id, None)
+                logging.warning("No receipt received from ActiveMQ for %s within %ss", command,
+                                self._receipt_timeout)
+                raise ConnectionException("ActiveMQ") from exp
+
+    async def _read_loop(self):
+        """ Read and dispatch frames until the connection closes """
+        buffer = bytearray()
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                data = await self._reader.read(65536)
+            except OSError as exp:
+                self._shutdown(exp)
+                return
+            if not data:
+                self._shutdown(ConnectionError("Connection closed by the broker"))
+                return
+            self._last_received = loop.time()
+            buffer.extend(data)
+            try:
+                frames = parse_frames(buffer)
+            except ValueError as exp:
+                # The stream can not be read past a malformed frame
+                self._shutdown(exp)
+                return
+            for frame in frames:
+                self._dispatch(frame)
+
+    def _dispatch(self, frame):
+        """ Act on a frame received from the broker """
+        if frame.command == 'MESSAGE':
+            subscription = self._subscriptions.get(frame.headers.get('subscription'))
+            if subscription is not None:
+                # Bodies encoded by a binary codec are kept as bytes rather than decoded as text
+                body = frame.body if self._codec.binary else frame.body.decode('utf-8', 'replace')
+                # pylint:disable=protected-access
+                subscription._deliver(Frame(frame.command, frame.headers, body))
+        elif frame.command == 'RECEIPT':
+            future = self._receipts.pop(frame.headers.get('receipt-id'), None)
+            if future is not None and not future.done():
+                future.set_result(frame)
+        elif frame.command == 'CONNECTED':
+            if not self._connected.done():
+                self._connected.set_result(frame)
+        elif frame.command == 'ERROR':
+            message = frame.headers.get('message', frame.body.decode('utf-8', 'replace'))
+            logging.error("ActiveMQ error: %s", message)
+            # The broker closes the connection after sending an ERROR
+            self._shutdown(ConnectionError(message))
+
+    def _start_heartbeats(self, server_heart_beat):
+        """
+        Start sending and checking heartbeats at the intervals agreed with the broker
+        :param server_heart_beat: The heart-beat header of the CONNECTED frame
+        """
+        server_send, server_receive = (int(value) for value in server_heart_beat.split(','))
+        send_interval = max(self._heartbeat, server_receive) if self._heartbeat and \
+            server_receive else 0
+        receive_interval = max(self._heartbeat, server_send) if self._heartbeat and \
+            server_send else 0
+        if send_interval or receive_interval:
+            self._tasks.append(asyncio.get_running_loop().create_task(
+                self._heartbeat_loop(send_interval / 1000, receive_interval / 1000)))
+
+    async def _heartbeat_loop(self, send_interval, receive_interval):
+        """ Send heartbeats and close the connection if the broker's heartbeats stop """
+        loop = asyncio.get_running_loop()
+        period = min(interval for interval in (send_interval, receive_interval) if interval)
+        allowed_silence = receive_interval * self.credentials.heartbeat_tolerance
+        while self._state == CONNECTED:
+            await asyncio.sleep(period / 2)
+            now = loop.time()
+            if send_interval and now - self._last_sent >= send_interval:
+                self._writer.write(HEARTBEAT)
+                self._last_sent = now
+            if receive_interval and now - self._last_received > allowed_silence:
+                self._shutdown(ConnectionError("No heartbeat for {:.3f}s".format(
+                    now - self._last_received)))
+
+    def _shutdown(self, error):
+        """
+        Close the connection and end every subscription
+        :param error: The exception that closed the connection or None if it was closed
+                      deliberately
+        """
+        if self._writer is None:
+            return
+        if self._disconnecting:
+            error = None
+        if error is not None:
+            logging.warning("ActiveMQ connection lost: %s", error)
+        self._state = CLOSED
+        self._writer.close()
+        self._writer = self._reader = None
+        exception = ConnectionException("ActiveMQ")
+        exception.__cause__ = error
+        for future in list(self._receipts.values()) + [self._connected]:
+            if future is not None and not future.done():
+                future.set_exception(exception)
+        self._receipts = {}
+        for subscription in self._subscriptions.values():
+            # pylint:disable=protected-access
+            subscription._deliver(None if error is None else exception)
+        self._subscriptions = {}
+        current = asyncio.current_task()
+        for task in self._tasks:
+            if task is not current:
+                task.cancel()
+        self._tasks = []
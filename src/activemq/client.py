@@ -6,38 +6,138 @@
 """
 Client class for accessing queuing service
 """
+import itertools
 import logging
+import socket
+import threading
 import time
 
 import stomp
 from stomp.exception import ConnectFailedException
+from stomp.utils import Frame
 
 from src.abstract_client import AbstractClient
+from src.activemq.acknowledger import BatchAcknowledger
+from src.activemq.codec import encode_message, get_codec
+from src.activemq.connection_state import CONNECTED, ConnectionStateListener
+from src.activemq.deduplication import DeduplicatingListener
+from src.activemq.heartbeats import HeartbeatMonitor
+from src.activemq.receipts import ReceiptListener
+from src.activemq.statistics import (InstrumentedListener, MessageStatistics,
+                                     prometheus_counters, SENT_HEADER, sent_timestamp)
+from src.activemq.subscriptions import Subscription, SubscriptionRouter
 from src.connection_exception import ConnectionException
 
 
+# pylint:disable=too-many-arguments
+def open_connection(credentials, state, listeners=None, heart_beats=(0, 0), broker=None,
+                    binary=False):
+    """
+    Open a STOMP connection and wait for the broker to answer with a CONNECTED frame
+    :param credentials: ActiveMQSettings of the broker to connect to
+    :param state: The ConnectionStateListener to track the connection with
+    :param listeners: Optional dictionary of names to other listeners to register
+    :param heart_beats: Tuple of the milliseconds between heartbeats sent and expected
+    :param broker: Optional (host, port) to connect to instead of the host and port of the
+                   credentials
+    :param binary: If True, pass message bodies to the listeners as bytes rather than
+                   decoding them as UTF-8 text
+    :return: The connected stomp.Connection
+    """
+    host_port = [broker or (credentials.host, int(credentials.port))]
+    try:
+        # Connect once without stomp.py's own retries, which would delay failing over
+        connection = stomp.Connection(host_and_ports=host_port,
+                                      use_ssl=False,
+                                      heartbeats=heart_beats,
+                                      reconnect_attempts_max=1,
+                                      reconnect_sleep_max=0.0,
+                                      auto_decode=not binary)
+        connection.set_listener('connection_state', state)
+        for name, listener in (listeners or {}).items():
+            connection.set_listener(name, listener)
+
+        logging.info("Starting connection to %s", host_port)
+        connection.connect(username=credentials.username,
+                           passcode=credentials.password,
+                           wait=False)
+        # A COMMIT or ACK often waits for a reply so send frames without delay
+        try:
+            connection.transport.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (AttributeError, OSError):
+            # The broker has already closed the connection, which is reported below
+            pass
+    except ConnectFailedException:
+        raise ConnectionException("ActiveMQ")
+    # The connection can only be used once the broker has answered with CONNECTED
+    if not state.wait_until_connected(credentials.connect_timeout):
+        logging.error("No CONNECTED frame received from %s: %s", host_port, state.error)
+        state.closing()
+        connection.transport.disconnect_socket()
+        raise ConnectionException("ActiveMQ")
+    return connection
+
+
+# pylint:disable=too-many-instance-attributes,too-many-public-methods
 class ActiveMQClient(AbstractClient):
     """
-    Class for client to access messaging service via python
+    Class for client to access messaging service via python. If the connection is lost the
+    client reconnects in the background, trying each of the configured brokers in turn with
+    a growing random delay between rounds, and restores every subscription. A connection is
+    also treated as lost when the broker stops sending STOMP heartbeats, so a half-open
+    connection is replaced without waiting for a write to fail.
     """
     def __init__(self, credentials, consumer_name='QueueProcessor'):
         super(ActiveMQClient, self).__init__(credentials)
         self._connection = None
         self._consumer_name = consumer_name
         self._autoreduce_queues = self.credentials.all_subscriptions
+        self._state = ConnectionStateListener(on_lost=self._connection_lost)
+        self._acknowledger = None
+        self._router = SubscriptionRouter()
+        self._receipts = ReceiptListener()
+        self._subscriptions = {}
+        self._subscription_ids = itertools.count(1)
+        self._codec = get_codec(self.credentials.codec)
+        self._statistics = None
+        if self.credentials.record_statistics:
+            self._statistics = MessageStatistics()
+        self._broker = None
+        self._closing = threading.Event()
+        self._reconnect_thread = None
+        self._reconnect_lock = threading.Lock()
+        self._failovers = 0
+        self._last_recovery = None
+        self._outages = 0
+        self._heartbeats = HeartbeatMonitor(self._send_heartbeat, self._heartbeat_missed,
+                                            self.credentials.heartbeat,
+                                            self.credentials.heartbeat_tolerance)
+        self._dispatcher = self._heartbeats.tracking(self._router)
+
+    @property
+    def state(self):
+        """
+        :return: The state of the connection: connecting, connected, reconnecting or closed
+        """
+        return self._state.state
 
     def connect(self):
         """
         Create the connection if the connection has not been created
         :return: connection object
         """
-        if self._connection is None or not self._connection.is_connected():
+        reconnect_thread = self._reconnecting()
+        if reconnect_thread is not None:
+            reconnect_thread.join()
+        # The state is kept up to date by the events of the connection and its heartbeats, so
+        # it is not necessary to ask the connection whether it is still connected
+        if self._connection is None or self._state.state != CONNECTED:
             self.disconnect()
             return self._create_connection()
         return self._connection
 
     def _test_connection(self):
-        if not self._connection.is_connected():
+        if self._state.state != CONNECTED:
             raise ConnectionException("ActiveMQ")
         return True
 
@@ -46,46 +146,256 @@ class ActiveMQClient(AbstractClient):
         disconnect from queue service
         """
         logging.info("Disconnecting from activemq")
+        self._closing.set()
+        reconnect_thread = self._reconnecting()
+        if reconnect_thread is not None and reconnect_thread is not threading.current_thread():
+            reconnect_thread.join()
+        self._state.closing()
+        self._heartbeats.stop()
+        if self._acknowledger is not None:
+            # Acknowledge the messages already processed before the connection closes
+            self._acknowledger.close()
+            self._acknowledger = None
         if self._connection is not None and self._connection.is_connected():
             self._connection.disconnect()
         self._connection = None
+        self._subscriptions = {}
+        self._router.clear()
 
     def _create_connection(self):
         """
         Get the connection to the queuing service
         :return: The connection to the queue
         """
-        if self._connection is None or not self._connection.is_connected():
-            try:
-                host_port = [(self.credentials.host, int(self.credentials.port))]
-                connection = stomp.Connection(host_and_ports=host_port,
-                                              use_ssl=False)
-
-                logging.info("Starting connection to %s", host_port)
-                connection.connect(username=self.credentials.username,
-                                   passcode=self.credentials.password,
-                                   wait=False,
-                                   header={'activemq.prefetchSize': '1'})
-            except ConnectFailedException:
-                raise ConnectionException("ActiveMQ")
-            # Sleep required to avoid using the service too quickly after establishing connection
-            time.sleep(0.5)
-            self._connection = connection
+        if self._connection is None or self._state.state != CONNECTED:
+            self._closing.clear()
+            if self.credentials.ack_batch_size > 1 and self._acknowledger is None:
+                self._acknowledger = BatchAcknowledger(self._send_ack,
+                                                       self.credentials.ack_batch_size,
+                                                       self.credentials.ack_batch_interval)
+            self._connection = self._open_connection(attempts=1)
         return self._connection
 
-    def subscribe_queues(self, queue_list, consumer_name, listener, ack='auto'):
+    def _open_connection(self, attempts, start=0):
+        """
+        Connect to the first of the brokers that accepts the connection
+        :param attempts: The number of times every broker is tried
+        :param start: The index of the broker to try first
+        :return: The connected stomp.Connection
+        """
+        brokers = self.credentials.get_brokers()
+        listeners = {'subscriptions': self._dispatcher, 'receipts': self._receipts,
+                     'heartbeat_monitor': self._heartbeats}
+        if self._acknowledger is not None:
+            listeners['batch_acknowledger'] = self._acknowledger
+        for attempt in range(attempts):
+            if attempt and self._closing.wait(self.credentials.get_reconnect_delay(attempt)):
+                break
+            for offset in range(len(brokers)):
+                index = (start + offset) % len(brokers)
+                try:
+                    connection = open_connection(self.credentials, self._state, listeners,
+                                                 broker=brokers[index],
+                                                 binary=self._codec.binary)
+                except ConnectionException:
+                    logging.warning("Unable to connect to ActiveMQ at %s:%s", *brokers[index])
+                    continue
+                self._broker = index
+                return connection
+        raise ConnectionException("ActiveMQ")
+
+    def _connection_lost(self):
+        """
+        Called on stomp.py's receiver thread when the connection is lost. Reconnects in the
+        background so the receiver thread can finish.
+        """
+        if self._closing.is_set():
+            return
+        self._outages += 1
+        if not self.credentials.auto_reconnect:
+            return
+        logging.warning("Lost connection to ActiveMQ, reconnecting")
+        with self._reconnect_lock:
+            self._reconnect_thread = threading.Thread(target=self._reconnect,
+                                                      name='Reconnect', daemon=True)
+            self._reconnect_thread.start()
+
+    def _send_heartbeat(self):
+        """ Send a heartbeat on the current connection for the HeartbeatMonitor """
+        self._connection.transport.transmit(Frame(None, {}, None))
+
+    def _heartbeat_missed(self):
+        """
+        Called by the HeartbeatMonitor when the broker has stopped sending heartbeats, which
+        happens when the connection is half-open. The connection is treated as lost at once.
+        """
+        connection = self._connection
+        if connection is not None and self.credentials.auto_reconnect:
+            # The listeners are detached from the connection before its socket is closed, so
+            # stomp.py never tells them it was lost
+            for name, listener in sorted(connection.transport.listeners.items()):
+                if name != 'connection_state':
+                    listener.on_disconnected()
+        self._state.on_heartbeat_timeout()
+        if connection is not None and not self.credentials.auto_reconnect:
+            connection.transport.disconnect_socket()
+
+    def _reconnecting(self):
+        """ :return: The thread reconnecting in the background or None """
+        with self._reconnect_lock:
+            return self._reconnect_thread
+
+    def _reconnect(self):
+        """
+        Connect to the next broker that accepts the connection and restore the subscriptions
+        """
+        start = time.monotonic()
+        lost = self._connection
+        if lost is not None:
+            for name in list(lost.transport.listeners):
+                lost.remove_listener(name)
+            lost.transport.disconnect_socket()
+        try:
+            self._connection = self._open_connection(self.credentials.reconnect_attempts,
+                                                     start=(self._broker or 0) + 1)
+            for subscription in list(self._subscriptions.values()):
+                self._send_subscribe(subscription)
+            self._failovers += 1
+            self._last_recovery = time.monotonic() - start
+        except ConnectionException:
+            logging.error("Unable to reconnect to ActiveMQ")
+            self._state.closing()
+            self._connection = None
+            return
+        # pylint:disable=broad-except
+        except Exception as exp:
+            # The new connection was lost too, which starts another reconnection
+            logging.error("Unable to restore the subscriptions: %s", exp)
+            return
+        finally:
+            with self._reconnect_lock:
+                if self._reconnect_thread is threading.current_thread():
+                    self._reconnect_thread = None
+        logging.info("Reconnected to ActiveMQ at %s:%s in %.3fs",
+                     *self.credentials.get_brokers()[self._broker], self._last_recovery)
+
+    def connection_stats(self):
+        """
+        :return: dictionary of the (host, port) of the broker connected to, the number of
+                 times the connection was lost, how many of those were detected by missed
+                 heartbeats, the number of times the client has reconnected and the seconds
+                 the last reconnection took
+        """
+        return {'broker': None if self._broker is None
+                          else self.credentials.get_brokers()[self._broker],
+                'outages': self._outages,
+                'heartbeat_timeouts': self._heartbeats.timeouts,
+                'failovers': self._failovers,
+                'last_recovery': self._last_recovery}
+
+    def get_stats(self):
+        """
+        Snapshot of the messages sent, received and failed and the message rates, receive
+        lag histograms and listener latency histograms of each queue recorded since the
+        client was created. Recording is enabled with ActiveMQSettings(record_statistics=True).
+        :return: dictionary of statistics or None if recording is disabled
+        """
+        if self._statistics is None:
+            return None
+        return self._statistics.snapshot()
+
+    def get_prometheus_stats(self):
         """
-        Subscribe a listener to the provided queues
+        :return: The statistics of get_stats and the connection outages in the Prometheus
+                 text exposition format or None if recording is disabled
+        """
+        if self._statistics is None:
+            return None
+        return self._statistics.prometheus() + prometheus_counters([
+            ('activemq_connection_outages_total', 'Connections to the broker lost',
+             self._outages),
+            ('activemq_heartbeat_timeouts_total',
+             'Connections lost because the broker stopped sending heartbeats',
+             self._heartbeats.timeouts),
+            ('activemq_reconnections_total', 'Reconnections to a broker', self._failovers)])
+
+    def subscribe_queues(self, queue_list, consumer_name, listener, ack='auto',
+                         deduplicator=None):
         """
-        self._connection.set_listener(consumer_name, listener)
+        Subscribe a listener to the provided queues. Each subscription requests the prefetch
+        size configured for its queue in the settings.
+        """
+        if isinstance(queue_list, str):
+            queue_list = [queue_list]
         for queue in queue_list:
-            self._connection.subscribe(destination=queue,
-                                       id='1',
-                                       ack=ack,
-                                       header={'activemq.prefetchSize': '1'})
-            logging.info("[%s] Subscribing to %s", consumer_name, queue)
+            self.subscribe(queue, listener, ack=ack, consumer_name=consumer_name,
+                           deduplicator=deduplicator)
         logging.info("Successfully subscribed to all of the queues")
 
+    # pylint:disable=too-many-arguments
+    def subscribe(self, queue, listener, ack='auto', prefetch=None, consumer_name=None,
+                  deduplicator=None):
+        """
+        Subscribe a listener to a single queue, replacing any existing subscription to it.
+        Only the messages from this queue are passed to the listener's on_message.
+        :param queue: The queue to subscribe to
+        :param listener: The stomp.ConnectionListener to pass the messages to
+        :param ack: The ack mode of the subscription: auto, client or client-individual
+        :param prefetch: The prefetch size, if not the one configured for the queue
+        :param consumer_name: Name used when logging the subscription
+        :param deduplicator: Optional Deduplicator to drop the messages it has seen before
+                             instead of passing them to the listener. Duplicates are
+                             acknowledged unless ack is auto.
+        :return: The id of the subscription
+        """
+        if queue in self._subscriptions:
+            self.unsubscribe(queue)
+        if prefetch is None:
+            prefetch = self.credentials.get_prefetch(queue)
+        subscription = Subscription(str(next(self._subscription_ids)), queue, listener, ack,
+                                    prefetch, consumer_name)
+        if deduplicator is not None:
+            listener = DeduplicatingListener(listener, deduplicator,
+                                             None if ack == 'auto' else self.ack)
+        if self._statistics is not None:
+            listener = InstrumentedListener(listener, self._statistics, queue)
+        self._router.add(subscription.id, listener)
+        if ack == 'client' and self._acknowledger is not None:
+            self._acknowledger.track(subscription.id, prefetch)
+        self._send_subscribe(subscription)
+        self._subscriptions[queue] = subscription
+        return subscription.id
+
+    def _send_subscribe(self, subscription):
+        """ Send the SUBSCRIBE frame of a subscription """
+        self._connection.subscribe(destination=subscription.destination,
+                                   id=subscription.id,
+                                   ack=subscription.ack,
+                                   headers={'activemq.prefetchSize': str(subscription.prefetch)})
+        logging.info("[%s] Subscribing to %s", subscription.consumer_name,
+                     subscription.destination)
+
+    def unsubscribe(self, queue):
+        """
+        Stop the subscription to a queue. Pending batched acknowledgements are sent first and
+        the broker redelivers any message that has not been acknowledged.
+        :param queue: The queue to unsubscribe from
+        """
+        subscription = self._subscriptions.pop(queue, None)
+        if subscription is None:
+            raise KeyError("Not subscribed to {}".format(queue))
+        if self._acknowledger is not None:
+            self._acknowledger.untrack(subscription.id)
+        self._connection.unsubscribe(id=subscription.id)
+        self._router.remove(subscription.id)
+        logging.info("[%s] Unsubscribed from %s", subscription.consumer_name, queue)
+
+    def subscriptions(self):
+        """
+        :return: dictionary of the subscribed queues to their Subscription
+        """
+        return dict(self._subscriptions)
+
     def subscribe_autoreduce(self, consumer_name, listener, ack='auto'):
         """
         Subscribe to queues including DataReady
@@ -104,12 +414,25 @@ class ActiveMQClient(AbstractClient):
                               listener=listener,
                               ack=ack)
 
-    def ack(self, frame):
+    def ack(self, frame, subscription=None):
         """
-        Acknowledge receipt of a message
+        Acknowledge receipt of a message. Messages of client ack mode subscriptions are
+        acknowledged in batches if ack_batch_size is set, in which case they must be
+        acknowledged in the order they were received.
+        :param frame: The message-id header of the message
+        :param subscription: The subscription header of the message
         """
-        # pylint:disable=no-value-for-parameter
-        self._connection.ack(frame)
+        if subscription is None:
+            # pylint:disable=no-value-for-parameter
+            self._connection.ack(frame)
+        elif self._acknowledger is not None and self._acknowledger.is_tracked(subscription):
+            self._acknowledger.ack(frame, subscription)
+        else:
+            self._connection.ack(frame, subscription)
+
+    def _send_ack(self, message_id, subscription):
+        """ Send an ACK frame on the current connection for the batch acknowledger """
+        self._connection.ack(message_id, subscription)
 
     @staticmethod
     def serialise_data(rb_number, instrument, location, run_number, started_by):
@@ -126,15 +449,95 @@ class ActiveMQClient(AbstractClient):
     # pylint:disable=too-many-arguments
     def send(self, destination, message, persistent='true', priority='4', delay=None):
         """
-        Send a message via the open connection to a queue
+        Send a message via the open connection to a queue. The time it was sent is set in its
+        sent-timestamp header so consumers can measure how long it waited in the queue.
         :param destination: Queue to send to
-        :param message: contents of the message
+        :param message: contents of the message. A dictionary or ReductionMessage is encoded
+                        with the codec of the settings and sent with its content-type.
         :param persistent: should to message be persistent
         :param priority: priority rating of the message
         :param delay: time to wait before send
         """
+        message, content_type = encode_message(message, self._codec)
         self.connect()
         self._connection.send(destination, message,
+                              content_type=content_type,
+                              headers={SENT_HEADER: sent_timestamp()},
                               persistent=persistent,
                               priority=priority,
                               delay=delay)
+        if self._statistics is not None:
+            self._statistics.record_sent(destination)
+
+    # pylint:disable=too-many-arguments
+    def send_batch(self, destination, messages, chunk_size=500, receipts=True,
+                   persistent='true', priority='4', receipt_timeout=10.0):
+        """
+        Send messages to a queue in transactions of chunk_size messages. A chunk is either
+        committed in full or aborted, so a failure never leaves part of a chunk published.
+        :param destination: Queue to send to
+        :param messages: iterable of the contents of the messages, encoded as by send()
+        :param chunk_size: The number of messages sent in each transaction
+        :param receipts: If True, wait for the broker to confirm each COMMIT with a receipt
+        :param persistent: should the messages be persistent
+        :param priority: priority rating of the messages
+        :param receipt_timeout: The maximum seconds to wait for each receipt
+        :return: dictionary of the number of messages and transactions committed, the seconds
+                 taken and the messages sent per second
+        """
+        connection = self.connect()
+        start = time.perf_counter()
+        sent = transactions = 0
+        messages = iter(messages)
+        chunk = list(itertools.islice(messages, chunk_size))
+        while chunk:
+            self._send_transaction(connection, destination, chunk,
+                                   receipt_timeout if receipts else None,
+                                   persistent=persistent, priority=priority)
+            sent += len(chunk)
+            if self._statistics is not None:
+                self._statistics.record_sent(destination, len(chunk))
+            transactions += 1
+            chunk = list(itertools.islice(messages, chunk_size))
+        elapsed = time.perf_counter() - start
+        logging.info("Sent %s messages to %s in %s transactions in %.3fs",
+                     sent, destination, transactions, elapsed)
+        return {'messages': sent,
+                'transactions': transactions,
+                'seconds': elapsed,
+                'messages_per_second': sent / elapsed if elapsed else 0.0}
+
+    def _send_transaction(self, connection, destination, chunk, receipt_timeout, **headers):
+        """
+        Send a chunk of messages in a single transaction
+        :param receipt_timeout: Seconds to wait for the receipt of the COMMIT or None to
+                                commit without a receipt
+        """
+        transaction = connection.begin()
+        try:
+            for message in chunk:
+                body, content_type = encode_message(message, self._codec)
+                connection.send(destination, body, content_type=content_type,
+                                headers={SENT_HEADER: sent_timestamp()},
+                                transaction=transaction, **headers)
+            if receipt_timeout is None:
+                connection.commit(transaction)
+                return
+            receipt = self._receipts.new_receipt()
+            connection.commit(transaction, receipt=receipt)
+        # pylint:disable=broad-except
+        except Exception as exp:
+            logging.error("Aborting transaction of %s messages to %s: %s",
+                          len(chunk), destination, exp)
+            try:
+                connection.abort(transaction)
+            # pylint:disable=broad-except
+            except Exception:
+                # The broker discards open transactions when the connection closes
+                pass
+            raise ConnectionException("ActiveMQ") from exp
+        failure = self._receipts.wait(receipt, receipt_timeout)
+        if failure is not None:
+            logging.error("Commit of %s messages to %s was not confirmed: %s",
+                          len(chunk), destination, failure)
+            raise ConnectionException("ActiveMQ")
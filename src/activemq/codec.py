@@ -0,0 +1,269 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Encoding and validation of the messages passed between the autoreduction services
+"""
+import json
+import logging
+
+import stomp
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+
+
+class ReductionMessage:
+    """
+    The message describing a run to reduce, as sent to and between the processing queues.
+    Every field is checked when a message is created, so a message that has been created or
+    decoded is known to be valid.
+    """
+    # (name, accepted types, required) of each field in the order they are encoded
+    SCHEMA = (('rb_number', (int, str), True),
+              ('instrument', (str,), True),
+              ('data', (str,), True),
+              ('run_number', (int, str), True),
+              ('facility', (str,), True),
+              ('started_by', (int, str), False))
+    __slots__ = tuple(name for name, _, _ in SCHEMA)
+    # The exact types accepted for each field, looked up once per field when validating.
+    # Exact types exclude bool, which is a subclass of int but is never a valid number here.
+    _TYPES = tuple(frozenset(types if required else types + (type(None),))
+                   for _, types, required in SCHEMA)
+
+    # pylint:disable=too-many-arguments
+    def __init__(self, rb_number, instrument, data, run_number, facility='ISIS',
+                 started_by=None):
+        """
+        :raises ValueError: If a field is missing or has the wrong type
+        """
+        values = (rb_number, instrument, data, run_number, facility, started_by)
+        for value, types in zip(values, self._TYPES):
+            if type(value) not in types:  # pylint:disable=unidiomatic-typecheck
+                raise self._invalid(values)
+        self.rb_number = rb_number
+        self.instrument = instrument
+        self.data = data
+        self.run_number = run_number
+        self.facility = facility
+        self.started_by = started_by
+
+    @classmethod
+    def _invalid(cls, values):
+        """ :return: ValueError describing the first invalid field """
+        for (name, types, _), value, accepted in zip(cls.SCHEMA, values, cls._TYPES):
+            if type(value) not in accepted:  # pylint:disable=unidiomatic-typecheck
+                if value is None:
+                    return ValueError("{} is required".format(name))
+                return ValueError("{} must be {}, not {!r}".format(
+                    name, ' or '.join(type_.__name__ for type_ in types), value))
+        return ValueError("Invalid {}".format(cls.__name__))
+
+    @classmethod
+    def from_dict(cls, fields):
+        """
+        :param fields: dictionary of the fields of the message. Fields outside the schema
+                       are ignored.
+        :return: The ReductionMessage
+        :raises ValueError: If a field is missing or has the wrong type
+        """
+        try:
+            get = fields.get
+        except AttributeError as exp:
+            raise ValueError("Invalid {}: {!r}".format(cls.__name__, fields)) from exp
+        return cls(get('rb_number'), get('instrument'), get('data'), get('run_number'),
+                   get('facility', 'ISIS'), get('started_by'))
+
+    def to_dict(self):
+        """ :return: dictionary of the fields of the message """
+        return {'rb_number': self.rb_number,
+                'instrument': self.instrument,
+                'data': self.data,
+                'run_number': self.run_number,
+                'facility': self.facility,
+                'started_by': self.started_by}
+
+    def __eq__(self, other):
+        return isinstance(other, ReductionMessage) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__))
+
+
+class JsonCodec:
+    """ Encodes messages as JSON with the standard library """
+    name = 'json'
+    content_type = JSON
+    binary = False
+
+    @staticmethod
+    def encode(fields):
+        """
+        :param fields: dictionary to encode
+        :return: The encoded message body
+        """
+        return json.dumps(fields, separators=(',', ':'))
+
+    @staticmethod
+    def decode(body):
+        """
+        :param body: The message body as str or bytes
+        :return: The decoded dictionary
+        :raises ValueError: If the body is not valid
+        """
+        return json.loads(body)
+
+
+class OrjsonCodec:
+    """ Encodes messages as JSON with orjson, which is several times faster than json """
+    name = 'orjson'
+    content_type = JSON
+    binary = False
+
+    @staticmethod
+    def encode(fields):
+        """
+        :param fields: dictionary to encode
+        :return: The encoded message body
+        """
+        return orjson.dumps(fields)
+
+    @staticmethod
+    def decode(body):
+        """
+        :param body: The message body as str or bytes
+        :return: The decoded dictionary
+        :raises ValueError: If the body is not valid
+        """
+        return orjson.loads(body)
+
+
+class MsgpackCodec:
+    """
+    Encodes messages as MessagePack. The body is binary, so clients using this codec keep
+    the bodies of the messages they receive as bytes rather than decoding them as text.
+    """
+    name = 'msgpack'
+    content_type = MSGPACK
+    binary = True
+
+    @staticmethod
+    def encode(fields):
+        """
+        :param fields: dictionary to encode
+        :return: The encoded message body
+        """
+        return msgpack.packb(fields)
+
+    @staticmethod
+    def decode(body):
+        """
+        :param body: The message body as bytes
+        :return: The decoded dictionary
+        :raises ValueError: If the body is not valid
+        """
+        try:
+            return msgpack.unpackb(body)
+        # pylint:disable=broad-except
+        except Exception as exp:
+            raise ValueError("Invalid MessagePack body: {}".format(exp)) from exp
+
+
+def available_codecs():
+    """ :return: dictionary of the names of the codecs whose libraries are installed """
+    codecs = {JsonCodec.name: JsonCodec}
+    if orjson is not None:
+        codecs[OrjsonCodec.name] = OrjsonCodec
+    if msgpack is not None:
+        codecs[MsgpackCodec.name] = MsgpackCodec
+    return codecs
+
+
+def get_codec(name):
+    """
+    :param name: The name of the codec: json, orjson or msgpack
+    :return: The codec
+    :raises ValueError: If the codec is unknown or its library is not installed
+    """
+    codec = available_codecs().get(name)
+    if codec is None:
+        raise ValueError("Codec {} is unknown or its library is not installed".format(name))
+    return codec
+
+
+def codec_for(content_type):
+    """
+    :param content_type: The content-type header of a message or None
+    :return: The fastest codec installed that decodes the content type, assuming JSON if
+             the message has no content type
+    :raises ValueError: If the content type can not be decoded
+    """
+    if content_type is not None:
+        # Ignore parameters such as charset
+        content_type = content_type.split(';')[0].strip()
+    if content_type in (None, JSON):
+        return OrjsonCodec if orjson is not None else JsonCodec
+    if content_type == MSGPACK and msgpack is not None:
+        return MsgpackCodec
+    raise ValueError("No codec installed for content type {}".format(content_type))
+
+
+def encode_message(message, codec):
+    """
+    :param message: A dictionary, a ReductionMessage or a message body that is already
+                    encoded
+    :param codec: The codec to encode dictionaries and ReductionMessages with
+    :return: tuple of the message body and its content type, which is None if the message
+             was already encoded
+    """
+    if isinstance(message, ReductionMessage):
+        message = message.to_dict()
+    elif not isinstance(message, dict):
+        return message, None
+    return codec.encode(message), codec.content_type
+
+
+class DecodingListener(stomp.ConnectionListener):
+    """
+    Decodes the body of each message with the codec matching its content-type header and
+    passes the headers and decoded message to a handler
+    """
+
+    def __init__(self, handler, message_type=ReductionMessage, on_invalid=None):
+        """
+        :param handler: Function called with the headers and decoded message
+        :param message_type: Class created from the decoded dictionary with from_dict, or
+                             None to pass the dictionary itself
+        :param on_invalid: Optional function called with the headers, body and ValueError of
+                           messages that can not be decoded. Otherwise they are logged and
+                           dropped.
+        """
+        self._handler = handler
+        self._message_type = message_type
+        self._on_invalid = on_invalid
+
+    def on_message(self, headers, body):
+        try:
+            message = codec_for(headers.get('content-type')).decode(body)
+            if self._message_type is not None:
+                message = self._message_type.from_dict(message)
+        except ValueError as exp:
+            if self._on_invalid is None:
+                logging.error("Unable to decode message %s: %s", headers.get('message-id'), exp)
+            else:
+                self._on_invalid(headers, body, exp)
+            return
+        self._handler(headers, message)
@@ -0,0 +1,90 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Listener tracking the state of a STOMP connection
+"""
+import logging
+import threading
+
+import stomp
+
+CONNECTING = 'connecting'
+CONNECTED = 'connected'
+RECONNECTING = 'reconnecting'
+CLOSED = 'closed'
+
+
+class ConnectionStateListener(stomp.ConnectionListener):
+    """
+    Tracks whether a connection is connecting, connected, reconnecting or closed from the
+    events reported by stomp.py. The connection is only connected once the broker has
+    answered with a CONNECTED frame.
+    """
+
+    def __init__(self, on_lost=None):
+        """
+        :param on_lost: Optional function called when an established connection is lost
+        """
+        self.state = CLOSED
+        self.error = None
+        self._on_lost = on_lost
+        self._has_connected = False
+        self._condition = threading.Condition()
+
+    def _set_state(self, state):
+        """ Change the state and wake any threads waiting for it. The condition must be held """
+        if state != self.state:
+            logging.debug("ActiveMQ connection %s -> %s", self.state, state)
+        self.state = state
+        self._condition.notify_all()
+
+    def on_connecting(self, host_and_port):
+        """ Called when the socket to the broker is opened """
+        with self._condition:
+            self.error = None
+            self._set_state(RECONNECTING if self._has_connected else CONNECTING)
+
+    def on_connected(self, headers, body):
+        """ Called when the broker answers with a CONNECTED frame """
+        with self._condition:
+            self._has_connected = True
+            self._set_state(CONNECTED)
+
+    def on_error(self, headers, body):
+        """ Called when the broker sends an ERROR frame """
+        with self._condition:
+            if self.state != CONNECTED:
+                self.error = headers.get('message', body)
+                self._condition.notify_all()
+
+    def on_disconnected(self):
+        """ Called when the connection to the broker is lost or closed """
+        with self._condition:
+            lost = self.state == CONNECTED
+            if self.state != CLOSED:
+                self._set_state(RECONNECTING if self._has_connected else CLOSED)
+        if lost and self._on_lost is not None:
+            self._on_lost()
+
+    def on_heartbeat_timeout(self):
+        """ Called when the broker has not sent a heartbeat within the negotiated interval """
+        self.on_disconnected()
+
+    def closing(self):
+        """ Record that the client is closing the connection deliberately """
+        with self._condition:
+            self._set_state(CLOSED)
+
+    def wait_until_connected(self, timeout):
+        """
+        Block until the broker has answered with a CONNECTED frame
+        :param timeout: The maximum seconds to wait
+        :return: True if connected, False if the timeout passed or the broker sent an error
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.state == CONNECTED or self.error is not None,
+                                     timeout)
+            return self.state == CONNECTED
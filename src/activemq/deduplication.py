@@ -0,0 +1,246 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Dropping messages that are delivered more than once
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from src.activemq.codec import codec_for
+from src.activemq.subscriptions import ListenerWrapper
+
+# Values returned by Deduplicator.seen() for a duplicate of a message that has been handled
+# or is still being handled
+HANDLED = 'handled'
+IN_FLIGHT = 'in-flight'
+
+
+def message_id_key(headers, _):
+    """
+    Deduplication key of a message that is redelivered by the broker, which keeps its id
+    :return: The message-id header of the message
+    """
+    return headers.get('message-id')
+
+
+def run_key(headers, body):
+    """
+    Deduplication key of messages about the same run, including those sent more than once
+    :return: tuple of the instrument, run number and RB number of the message body or None if
+             the body is not a message about a run
+    """
+    try:
+        fields = codec_for(headers.get('content-type')).decode(body)
+        return fields['instrument'], fields['run_number'], fields['rb_number']
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+class Deduplicator:
+    """
+    Remembers the keys of the messages handled in the last ttl seconds, up to max_size keys,
+    forgetting the least recently seen first. If a path is given, the keys are appended to
+    that file as messages are handled and loaded again when the next Deduplicator is created,
+    so duplicates are caught across restarts. A key is only remembered once its message has
+    been handled, so a message that was being handled when the process stopped is handled
+    again when the broker redelivers it.
+    """
+
+    def __init__(self, key=message_id_key, max_size=10000, ttl=3600.0, path=None):
+        """
+        :param key: Function of the headers and body of a message returning its key, such as
+                    message_id_key or run_key. Messages whose key is None are never dropped.
+        :param max_size: The maximum number of keys remembered
+        :param ttl: Seconds a key is remembered for after it was last seen
+        :param path: Optional file to persist the keys to
+        """
+        self.key = key
+        self._max_size = max_size
+        self._ttl = ttl
+        self._path = path
+        # key -> wall clock time the key expires, oldest first
+        self._seen = OrderedDict()
+        # Keys of the messages being handled, which are not persisted
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._file = None
+        self._logged = 0
+        self.duplicates = 0
+        if path is not None:
+            self._load()
+
+    def seen(self, headers, body):
+        """
+        Record that a message has been received and is about to be handled. Call done() once
+        it has been handled or forget() if handling it failed.
+        :return: HANDLED if a message with the same key was handled within the ttl, IN_FLIGHT
+                 if one is being handled or False if the message is not a duplicate
+        """
+        key = self.key(headers, body)
+        if key is None:
+            return False
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if key in self._seen:
+                self.duplicates += 1
+                self._seen.move_to_end(key)
+                self._seen[key] = now + self._ttl
+                self._append(key, now + self._ttl)
+                return HANDLED
+            if key in self._in_flight:
+                self.duplicates += 1
+                return IN_FLIGHT
+            self._in_flight.add(key)
+        return False
+
+    def done(self, headers, body):
+        """
+        Record that a message has been handled, remembering its key for the ttl
+        """
+        key = self.key(headers, body)
+        if key is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._in_flight.discard(key)
+            if key not in self._seen and len(self._seen) >= self._max_size:
+                self._seen.popitem(last=False)
+            self._seen[key] = now + self._ttl
+            self._seen.move_to_end(key)
+            self._append(key, now + self._ttl)
+
+    def forget(self, headers, body):
+        """
+        Forget a message, so that it is handled if it is delivered again, for example
+        because handling it failed
+        """
+        key = self.key(headers, body)
+        with self._lock:
+            self._in_flight.discard(key)
+            if self._seen.pop(key, None) is not None:
+                self._append(key, 0)
+
+    def wrap(self, handler):
+        """
+        :param handler: Function called with the headers and body of each message, such as
+                        the handler of a ConcurrentDispatcher
+        :return: Function calling the handler for the first delivery of each message only
+        """
+        def deduplicated(headers, body):
+            if self.seen(headers, body):
+                logging.info("Dropping duplicate message %s", headers.get('message-id'))
+                return
+            try:
+                handler(headers, body)
+            except Exception:
+                self.forget(headers, body)
+                raise
+            self.done(headers, body)
+        return deduplicated
+
+    def __len__(self):
+        with self._lock:
+            self._expire(time.time())
+            return len(self._seen)
+
+    def close(self):
+        """ Close the file the keys are persisted to """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _expire(self, now):
+        """ Forget the keys that have expired. The lock must be held. """
+        while self._seen:
+            key, expires = next(iter(self._seen.items()))
+            if expires > now:
+                return
+            del self._seen[key]
+
+    def _append(self, key, expires):
+        """
+        Persist a key, rewriting the file once it holds more than twice the number of keys
+        remembered. The lock must be held.
+        """
+        if self._file is None:
+            return
+        self._file.write(json.dumps([key, expires]) + '\n')
+        self._file.flush()
+        self._logged += 1
+        if self._logged > 2 * max(len(self._seen), 1) + 100:
+            self._rewrite()
+
+    def _load(self):
+        """ Load the keys persisted by earlier instances and reopen the file for appending """
+        now = time.time()
+        if os.path.exists(self._path):
+            with open(self._path) as keys:
+                for line in keys:
+                    try:
+                        key, expires = json.loads(line)
+                    except ValueError:
+                        # The last line is incomplete if the process stopped while writing it
+                        continue
+                    key = tuple(key) if isinstance(key, list) else key
+                    self._seen.pop(key, None)
+                    if expires > now:
+                        self._seen[key] = expires
+            while len(self._seen) > self._max_size:
+                self._seen.popitem(last=False)
+            self._expire(now)
+        self._rewrite()
+
+    def _rewrite(self):
+        """ Replace the file with one holding only the keys remembered """
+        temporary = self._path + '.tmp'
+        with open(temporary, 'w') as keys:
+            for key, expires in self._seen.items():
+                keys.write(json.dumps([key, expires]) + '\n')
+        if self._file is not None:
+            self._file.close()
+        os.replace(temporary, self._path)
+        self._file = open(self._path, 'a')
+        self._logged = len(self._seen)
+
+
+class DeduplicatingListener(ListenerWrapper):
+    """
+    Passes each message to a listener unless a Deduplicator has seen it before. Duplicates
+    of messages that have been handled must be acknowledged in client or client-individual
+    ack mode, so pass an ack function for those subscriptions. Duplicates of a message that
+    is still being handled are dropped without an ack, which is left to its listener.
+    """
+
+    def __init__(self, listener, deduplicator, ack=None):
+        """
+        :param listener: The stomp.ConnectionListener to pass the messages to
+        :param deduplicator: The Deduplicator recording the messages seen
+        :param ack: Optional function called with the message-id and subscription headers of
+                    each duplicate of a handled message dropped, such as ActiveMQClient.ack
+        """
+        super(DeduplicatingListener, self).__init__(listener)
+        self.deduplicator = deduplicator
+        self._ack = ack
+
+    def on_message(self, headers, body):
+        duplicate = self.deduplicator.seen(headers, body)
+        if duplicate:
+            logging.info("Dropping duplicate message %s", headers.get('message-id'))
+            if duplicate == HANDLED and self._ack is not None:
+                self._ack(headers['message-id'], headers['subscription'])
+            return
+        try:
+            self.listener.on_message(headers, body)
+        except Exception:
+            self.deduplicator.forget(headers, body)
+            raise
+        self.deduplicator.done(headers, body)
@@ -0,0 +1,227 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Listener that handles messages concurrently on a pool of workers
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import stomp
+
+from src.activemq.codec import codec_for
+from src.histogram import Histogram
+
+
+def instrument_key(headers, body):
+    """
+    Ordering key for messages whose body contains an instrument, such as those created by
+    ActiveMQClient.serialise_data, decoded with the codec matching their content-type
+    :return: The instrument of the message or None if it has none
+    """
+    try:
+        return codec_for(headers.get('content-type')).decode(body).get('instrument')
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def _run_handler(handler, headers, body):
+    """
+    Call a handler on a worker
+    :return: The seconds the handler took
+    """
+    start = time.perf_counter()
+    handler(headers, body)
+    return time.perf_counter() - start
+
+
+# pylint:disable=too-many-instance-attributes
+class ConcurrentDispatcher(stomp.ConnectionListener):
+    """
+    Hands the messages received by stomp.py's receiver thread to a pool of workers so one
+    slow message does not hold up the others. Messages with the same key are handled one at
+    a time in the order they were received; messages without a key are handled as soon as a
+    worker is free.
+
+    Each message is acknowledged once its handler has returned. Subscribe with the
+    client-individual ack mode so that the broker stops dispatching once prefetch size
+    messages are being handled, which applies backpressure without blocking the connection.
+    If max_pending messages are waiting anyway, the receiver thread is blocked until a
+    worker finishes.
+    """
+
+    # pylint:disable=too-many-arguments
+    def __init__(self, handler, ack=None, nack=None, workers=4, max_pending=100, key=None,
+                 executor=None):
+        """
+        :param handler: Function called with the headers and body of each message.
+                        With a ProcessPoolExecutor it must be picklable.
+        :param ack: Optional function called with the message-id and subscription headers
+                    once a message has been handled, such as ActiveMQClient.ack
+        :param nack: Optional function called with the message-id and subscription headers
+                     if the handler raised an exception. Otherwise failed messages are left
+                     unacknowledged.
+        :param workers: The number of worker threads, if executor is not given
+        :param max_pending: The number of messages waiting or being handled at which the
+                            receiver thread is blocked
+        :param key: Optional function of the headers and body returning the key messages are
+                    ordered by, for example instrument_key
+        :param executor: Optional concurrent.futures.Executor to run handlers on. It is not
+                         shut down by close().
+        """
+        self._handler = handler
+        self._ack = ack
+        self._nack = nack
+        self._max_pending = max_pending
+        self._key = key
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(workers,
+                                                        thread_name_prefix='Dispatcher')
+        self._condition = threading.Condition()
+        # key -> deque of the messages waiting for the message being handled
+        self._active = {}
+        self._pending = 0
+        self._generation = 0
+        self._closed = False
+        self._handler_latency = Histogram()
+        self._queue_wait = Histogram()
+        self._max_depth = 0
+        self._handled = 0
+        self._failed = 0
+        self._saturated = 0
+
+    def on_message(self, headers, body):
+        """ Called on the receiver thread when a message arrives """
+        key = None if self._key is None else self._key(headers, body)
+        with self._condition:
+            if self._pending >= self._max_pending:
+                self._saturated += 1
+                logging.warning("All %s dispatcher slots are in use, waiting for a worker",
+                                self._max_pending)
+            self._condition.wait_for(lambda: self._pending < self._max_pending or
+                                     self._closed)
+            if self._closed:
+                return
+            self._pending += 1
+            self._max_depth = max(self._max_depth, self._pending)
+            item = (headers, body, time.monotonic(), self._generation)
+            if key is not None:
+                if key in self._active:
+                    self._active[key].append(item)
+                    return
+                self._active[key] = deque()
+        self._submit(key, item)
+
+    def on_disconnected(self):
+        """
+        Called when the connection to the broker is lost or closed. The broker redelivers
+        the messages that have not been acknowledged, so waiting messages are dropped and
+        messages being handled are not acknowledged when they finish.
+        """
+        with self._condition:
+            self._generation += 1
+            dropped = sum(len(waiting) for waiting in self._active.values())
+            for waiting in self._active.values():
+                waiting.clear()
+            self._pending -= dropped
+            self._condition.notify_all()
+
+    def _submit(self, key, item):
+        """ Hand a message to the executor """
+        headers, body, _, _ = item
+        future = self._executor.submit(_run_handler, self._handler, headers, body)
+        future.add_done_callback(partial(self._done, key, item))
+
+    def _done(self, key, item, future):
+        """ Acknowledge a handled message and submit the next message with the same key """
+        headers, _, received, generation = item
+        try:
+            elapsed = future.result()
+            error = None
+        # pylint:disable=broad-except
+        except Exception as exp:
+            logging.error("Handler failed for message %s: %s", headers.get('message-id'), exp)
+            elapsed = None
+            error = exp
+        with self._condition:
+            current = generation == self._generation
+        if current:
+            self._settle(headers, error)
+        with self._condition:
+            total = time.monotonic() - received
+            if error is None:
+                self._handled += 1
+                self._handler_latency.observe(elapsed)
+                self._queue_wait.observe(max(0.0, total - elapsed))
+            else:
+                self._failed += 1
+            self._pending -= 1
+            next_item = None
+            if key is not None:
+                waiting = self._active[key]
+                if waiting:
+                    next_item = waiting.popleft()
+                else:
+                    del self._active[key]
+            self._condition.notify_all()
+        if next_item is not None:
+            self._submit(key, next_item)
+
+    def _settle(self, headers, error):
+        """ Acknowledge a message if it was handled or reject it if the handler failed """
+        settle = self._ack if error is None else self._nack
+        if settle is None:
+            return
+        try:
+            settle(headers['message-id'], headers['subscription'])
+        # pylint:disable=broad-except
+        except Exception as exp:
+            logging.error("Unable to acknowledge message %s: %s",
+                          headers.get('message-id'), exp)
+
+    def pending(self):
+        """ :return: The number of messages waiting or being handled """
+        with self._condition:
+            return self._pending
+
+    def wait_until_idle(self, timeout=None):
+        """
+        Block until every message received has been handled
+        :param timeout: The maximum seconds to wait
+        :return: True if the dispatcher is idle
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout=None):
+        """
+        Stop accepting messages and wait for the messages already received to be handled
+        :param timeout: The maximum seconds to wait
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self.wait_until_idle(timeout)
+        if self._owns_executor:
+            self._executor.shutdown(wait=False)
+
+    def snapshot(self):
+        """
+        :return: dictionary of the current and maximum queue depth, the number of messages
+                 handled and failed, how often the receiver thread was blocked and histograms
+                 of the handler latency and the time messages waited for a worker
+        """
+        with self._condition:
+            return {'pending': self._pending,
+                    'max_pending': self._max_depth,
+                    'handled': self._handled,
+                    'failed': self._failed,
+                    'saturated': self._saturated,
+                    'handler_latency': self._handler_latency.snapshot(),
+                    'queue_wait': self._queue_wait.snapshot()}
@@ -0,0 +1,89 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Encoding and parsing of STOMP 1.1 frames
+"""
+from collections import namedtuple
+
+# A STOMP frame. Heartbeats are parsed as frames with a command of None.
+Frame = namedtuple('Frame', 'command headers body')
+
+HEARTBEAT = b'\n'
+
+_ESCAPES = {'\\': '\\\\', '\n': '\\n', ':': '\\c', '\r': '\\r'}
+_UNESCAPES = {'\\\\': '\\', '\\n': '\n', '\\c': ':', '\\r': '\r'}
+# Header values of the frames that open a connection are not escaped
+_UNESCAPED_COMMANDS = ('CONNECT', 'STOMP', 'CONNECTED')
+
+
+def _escape(value):
+    """ Escape a header value """
+    return ''.join(_ESCAPES.get(character, character) for character in str(value))
+
+
+def _unescape(value):
+    """ Unescape a header value """
+    result = []
+    characters = iter(value)
+    for character in characters:
+        if character == '\\':
+            character += next(characters, '')
+            character = _UNESCAPES.get(character, character)
+        result.append(character)
+    return ''.join(result)
+
+
+def encode_frame(command, headers=None, body=b''):
+    """
+    :param command: The STOMP command
+    :param headers: Optional dictionary of the frame headers
+    :param body: The bytes or string of the frame body
+    :return: bytes of a STOMP frame
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    escape = str if command in _UNESCAPED_COMMANDS else _escape
+    lines = [command]
+    for key, value in (headers or {}).items():
+        lines.append('{}:{}'.format(escape(key), escape(value)))
+    if body:
+        lines.append('content-length:{}'.format(len(body)))
+    return ('\n'.join(lines) + '\n\n').encode('utf-8') + body + b'\x00'
+
+
+def parse_frames(buffer):
+    """
+    Parse the complete frames at the start of a buffer
+    :param buffer: bytearray of received data. Parsed frames are removed from it.
+    :return: list of Frames. Heartbeats have a command of None.
+    """
+    frames = []
+    while buffer:
+        if buffer[:1] in (b'\n', b'\r'):
+            del buffer[:1]
+            frames.append(Frame(None, {}, b''))
+            continue
+        header_end = buffer.find(b'\n\n')
+        if header_end == -1:
+            break
+        lines = buffer[:header_end].decode('utf-8').replace('\r', '').split('\n')
+        unescape = str if lines[0] in _UNESCAPED_COMMANDS else _unescape
+        headers = {}
+        for line in lines[1:]:
+            key, _, value = line.partition(':')
+            headers.setdefault(unescape(key), unescape(value))
+        body_start = header_end + 2
+        if 'content-length' in headers:
+            body_end = body_start + int(headers['content-length'])
+            if len(buffer) < body_end + 1:
+                break
+        else:
+            body_end = buffer.find(b'\x00', body_start)
+            if body_end == -1:
+                break
+        frames.append(Frame(lines[0], headers, bytes(buffer[body_start:body_end])))
+        del buffer[:body_end + 1]
+    return frames
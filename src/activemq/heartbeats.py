@@ -0,0 +1,188 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+STOMP heartbeat negotiation and monitoring
+"""
+import logging
+import threading
+import time
+
+import stomp
+
+from src.activemq.subscriptions import ListenerWrapper
+
+# The number of times the connection is checked in each heartbeat interval
+CHECKS_PER_INTERVAL = 4
+
+
+def negotiate(interval, server_heart_beat):
+    """
+    :param interval: Milliseconds between the heartbeats the client sends and expects
+    :param server_heart_beat: The heart-beat header of the CONNECTED frame
+    :return: Tuple of the seconds between the heartbeats to send and to expect, where 0
+             means none
+    """
+    server_send, server_receive = (int(value) for value in server_heart_beat.split(','))
+    send = max(interval, server_receive) if interval and server_receive else 0
+    receive = max(interval, server_send) if interval and server_send else 0
+    return send / 1000, receive / 1000
+
+
+class HeartbeatMonitor(stomp.ConnectionListener):
+    """
+    Negotiates STOMP heartbeats when connecting, sends them while the connection is otherwise
+    idle and reports a missed heartbeat once nothing has been received from the broker for
+    tolerance times the negotiated interval. The connection is checked several times in each
+    interval, whereas stomp.py checks at most once a second, so a half-open connection is
+    noticed within a fraction of an interval of the heartbeat being due.
+
+    stomp.py reads frames and calls the listeners on the same thread, so nothing is read
+    while a listener handles a message. Listeners wrapped by tracking() mark that time as
+    dispatching, which is never treated as a missed heartbeat.
+
+    One monitor is registered with each connection a client opens in turn.
+    """
+
+    def __init__(self, send_heartbeat, on_missed, interval=10.0, tolerance=2.0):
+        """
+        :param send_heartbeat: Function sending a heartbeat on the current connection
+        :param on_missed: Function called on the monitor's thread when the broker has missed
+                          its heartbeats
+        :param interval: Seconds between the heartbeats sent and expected (0 disables them)
+        :param tolerance: The multiple of the negotiated interval allowed between heartbeats
+                          from the broker
+        """
+        self._send_heartbeat = send_heartbeat
+        self._on_missed = on_missed
+        self._interval = int(interval * 1000)
+        self._tolerance = tolerance
+        self._lock = threading.Lock()
+        # Incremented whenever a connection is established or lost, ending the thread that
+        # monitored the previous connection
+        self._generation = 0
+        self._last_received = 0.0
+        self._last_sent = 0.0
+        self._dispatching = 0
+        self.send_interval = 0.0
+        self.receive_interval = 0.0
+        self.timeouts = 0
+
+    def on_send(self, frame):
+        """ Ask for heartbeats when connecting and record when a frame was last sent """
+        if frame.cmd in ('CONNECT', 'STOMP'):
+            frame.headers['heart-beat'] = '{0},{0}'.format(self._interval)
+        self._last_sent = time.monotonic()
+
+    def on_connected(self, headers, body):
+        """ Start monitoring the connection at the intervals agreed with the broker """
+        send, receive = negotiate(self._interval, headers.get('heart-beat', '0,0'))
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self.send_interval = send
+            self.receive_interval = receive
+            self._last_received = time.monotonic()
+        if send or receive:
+            logging.debug("Sending heartbeats every %ss, expecting them every %ss",
+                          send, receive)
+            threading.Thread(target=self._run, args=(generation, send, receive),
+                             name='HeartbeatMonitor', daemon=True).start()
+
+    def _received(self):
+        """ Record that the broker has sent something """
+        self._last_received = time.monotonic()
+
+    def tracking(self, listener):
+        """
+        :param listener: The stomp.ConnectionListener that handles the messages received
+        :return: A listener passing messages to it while marking the time spent as dispatching
+        """
+        return DispatchTracker(listener, self)
+
+    def dispatch_started(self):
+        """ Record that a message is being passed to a listener """
+        with self._lock:
+            self._dispatching += 1
+
+    def dispatch_finished(self):
+        """
+        Record that a listener has returned. Frames that arrived meanwhile are read next, so
+        the broker is given a full interval from now.
+        """
+        with self._lock:
+            self._dispatching -= 1
+            self._last_received = time.monotonic()
+
+    def on_heartbeat(self):
+        self._received()
+
+    def on_message(self, headers, body):
+        self._received()
+
+    def on_receipt(self, headers, body):
+        self._received()
+
+    def on_error(self, headers, body):
+        self._received()
+
+    def on_disconnected(self):
+        self.stop()
+
+    def stop(self):
+        """ Stop monitoring the current connection """
+        with self._lock:
+            self._generation += 1
+
+    def _run(self, generation, send, receive):
+        """
+        Send heartbeats and check for those of the broker until the connection is lost or
+        another is established
+        """
+        step = min(interval for interval in (send, receive) if interval) / CHECKS_PER_INTERVAL
+        while True:
+            time.sleep(step)
+            now = time.monotonic()
+            with self._lock:
+                if generation != self._generation:
+                    return
+                silent = now - self._last_received
+                missed = (receive and not self._dispatching and
+                          silent > receive * self._tolerance)
+                if missed:
+                    self._generation += 1
+                    self.timeouts += 1
+            if missed:
+                logging.warning("No heartbeat received from ActiveMQ for %.3fs", silent)
+                self._on_missed()
+                return
+            if send and now - self._last_sent >= send:
+                try:
+                    self._send_heartbeat()
+                # pylint:disable=broad-except
+                except Exception as exp:
+                    # A connection that cannot be written to is reported by stomp.py
+                    logging.debug("Unable to send heartbeat: %s", exp)
+
+
+class DispatchTracker(ListenerWrapper):
+    """
+    Tells a HeartbeatMonitor when messages are being passed to a listener
+    """
+
+    def __init__(self, listener, monitor):
+        """
+        :param listener: The stomp.ConnectionListener to pass the messages to
+        :param monitor: The HeartbeatMonitor to tell
+        """
+        super(DispatchTracker, self).__init__(listener)
+        self._monitor = monitor
+
+    def on_message(self, headers, body):
+        self._monitor.dispatch_started()
+        try:
+            self.listener.on_message(headers, body)
+        finally:
+            self._monitor.dispatch_finished()
@@ -0,0 +1,262 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Pool of STOMP connections shared by the threads that publish messages
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from src.activemq.client import open_connection
+from src.activemq.codec import encode_message, get_codec
+from src.activemq.connection_state import CONNECTED, ConnectionStateListener
+from src.activemq.statistics import SENT_HEADER, sent_timestamp
+from src.connection_exception import ConnectionException
+from src.histogram import Histogram
+
+
+class _Producer:
+    """
+    A pooled connection and the listener tracking its state
+    """
+
+    def __init__(self, connection, state):
+        self.connection = connection
+        self.state = state
+        self.last_used = time.monotonic()
+
+    def is_usable(self, now, idle_timeout):
+        """ :return: True if the connection is alive and has not been idle for too long """
+        return self.state.state == CONNECTED and now - self.last_used < idle_timeout
+
+    def close(self):
+        """ Close the connection, without waiting if it has already been lost """
+        self.state.closing()
+        try:
+            if self.connection.is_connected():
+                self.connection.disconnect()
+            else:
+                self.connection.transport.disconnect_socket()
+        # pylint:disable=broad-except
+        except Exception as exp:
+            logging.debug("Error closing pooled ActiveMQ connection: %s", exp)
+
+
+# pylint:disable=too-many-instance-attributes
+class ProducerPool:
+    """
+    Keeps up to max_connections STOMP connections and checks them out to threads that send
+    messages, so each send does not pay for a connection handshake. The liveness of a
+    connection is tracked with STOMP heartbeats and the events reported by stomp.py, so
+    checking one out does not need to touch its socket. Connections that have been lost or
+    have been idle for idle_timeout seconds are closed when the pool is next used, and a
+    connection whose send fails is discarded.
+
+    New connections are made to the first of the configured brokers that accepts them or,
+    if balance_brokers is set, to each broker in turn so the connections are spread across
+    them.
+    """
+
+    # pylint:disable=too-many-arguments
+    def __init__(self, credentials, max_connections=4, idle_timeout=300.0, heartbeat=10.0,
+                 checkout_timeout=30.0, balance_brokers=False):
+        """
+        :param credentials: ActiveMQSettings of the broker to connect to
+        :param max_connections: The maximum number of open connections
+        :param idle_timeout: Seconds after which an unused connection is closed
+        :param heartbeat: Seconds between the heartbeats sent and expected on each
+                          connection (0 disables heartbeats)
+        :param checkout_timeout: The maximum seconds to wait for a free connection
+        :param balance_brokers: If True, open each new connection to the broker after the
+                                one the previous connection was opened to
+        """
+        self.credentials = credentials
+        self._max_connections = max_connections
+        self._idle_timeout = idle_timeout
+        self._heart_beats = (int(heartbeat * 1000),) * 2
+        self._checkout_timeout = checkout_timeout
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._checkout_wait = Histogram()
+        self._created = 0
+        self._evicted = 0
+        self._failed = 0
+        self._balance_brokers = balance_brokers
+        self._codec = get_codec(credentials.codec)
+        self._next_broker = 0
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of a with block. The connection is returned to
+        the pool afterwards, or discarded if the block raised an exception.
+        :return: A connected stomp.Connection
+        """
+        producer = self._checkout()
+        try:
+            yield producer.connection
+        except Exception:
+            self._discard(producer)
+            raise
+        self._release(producer)
+
+    # pylint:disable=too-many-arguments
+    def send(self, destination, message, persistent='true', priority='4', delay=None):
+        """
+        Send a message on a pooled connection
+        :param destination: Queue to send to
+        :param message: contents of the message, encoded as by ActiveMQClient.send
+        :param persistent: should to message be persistent
+        :param priority: priority rating of the message
+        :param delay: time to wait before send
+        """
+        message, content_type = encode_message(message, self._codec)
+        with self.connection() as connection:
+            try:
+                connection.send(destination, message,
+                                content_type=content_type,
+                                headers={SENT_HEADER: sent_timestamp()},
+                                persistent=persistent,
+                                priority=priority,
+                                delay=delay)
+            except Exception as exp:
+                logging.error("Unable to send to %s: %s", destination, exp)
+                raise ConnectionException("ActiveMQ") from exp
+
+    def close(self):
+        """
+        Close every idle connection. Connections checked out are closed when they are
+        returned.
+        """
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for producer in idle:
+            producer.close()
+
+    def snapshot(self):
+        """
+        :return: dictionary of the number of open, idle and checked out connections, the
+                 number created, evicted and discarded after a failure and a histogram of the
+                 time spent waiting for a connection
+        """
+        with self._condition:
+            return {'size': self._size,
+                    'idle': len(self._idle),
+                    'in_use': self._size - len(self._idle),
+                    'created': self._created,
+                    'evicted': self._evicted,
+                    'failed': self._failed,
+                    'checkout_wait': self._checkout_wait.snapshot()}
+
+    def _checkout(self):
+        """
+        :return: An idle connection, or a new one if fewer than max_connections are open
+        """
+        start = time.monotonic()
+        deadline = start + self._checkout_timeout
+        while True:
+            producer, reserved, evicted = self._take(deadline)
+            for expired in evicted:
+                expired.close()
+            if producer is not None or reserved:
+                with self._condition:
+                    self._checkout_wait.observe(time.monotonic() - start)
+                return producer or self._open()
+            if time.monotonic() >= deadline:
+                logging.error("No ActiveMQ connection free within %ss", self._checkout_timeout)
+                raise ConnectionException("ActiveMQ")
+
+    def _take(self, deadline):
+        """
+        Take an idle connection or reserve a slot for a new one, waiting for a connection to
+        be returned until the deadline if neither is possible
+        :return: tuple of the idle connection or None, whether a slot was reserved and the
+                 list of expired connections that must be closed
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Connections can not be checked out of a closed pool")
+            evicted = self._evict()
+            if self._idle:
+                return self._idle.pop(), False, evicted
+            if self._size < self._max_connections:
+                self._size += 1
+                return None, True, evicted
+            self._condition.wait(max(0.0, deadline - time.monotonic()))
+            return None, False, evicted
+
+    def _open(self):
+        """ Open a new connection for a slot reserved by _checkout """
+        brokers = self.credentials.get_brokers()
+        start = 0
+        if self._balance_brokers:
+            with self._condition:
+                start = self._next_broker
+                self._next_broker = (start + 1) % len(brokers)
+        for offset in range(len(brokers)):
+            broker = brokers[(start + offset) % len(brokers)]
+            state = ConnectionStateListener()
+            try:
+                connection = open_connection(self.credentials, state,
+                                             heart_beats=self._heart_beats, broker=broker)
+            except ConnectionException:
+                logging.warning("Unable to connect to ActiveMQ at %s:%s", *broker)
+                continue
+            except Exception:
+                self._cancel_slot()
+                raise
+            with self._condition:
+                self._created += 1
+            return _Producer(connection, state)
+        self._cancel_slot()
+        raise ConnectionException("ActiveMQ")
+
+    def _cancel_slot(self):
+        """ Give up a slot reserved by _checkout after failing to open its connection """
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def _evict(self):
+        """
+        Remove the idle connections that are lost or have expired. The condition must be held.
+        :return: list of the connections removed, which must be closed
+        """
+        now = time.monotonic()
+        evicted = [producer for producer in self._idle
+                   if not producer.is_usable(now, self._idle_timeout)]
+        if evicted:
+            self._idle = [producer for producer in self._idle if producer not in evicted]
+            self._size -= len(evicted)
+            self._evicted += len(evicted)
+            self._condition.notify_all()
+        return evicted
+
+    def _release(self, producer):
+        """ Return a connection to the pool """
+        producer.last_used = time.monotonic()
+        with self._condition:
+            if not self._closed and producer.state.state == CONNECTED:
+                self._idle.append(producer)
+                self._condition.notify()
+                return
+            self._size -= 1
+            self._condition.notify()
+        producer.close()
+
+    def _discard(self, producer):
+        """ Close a connection whose use failed """
+        with self._condition:
+            self._size -= 1
+            self._failed += 1
+            self._condition.notify()
+        producer.close()
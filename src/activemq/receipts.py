@@ -0,0 +1,72 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Listener for waiting on RECEIPT frames
+"""
+import itertools
+import threading
+
+import stomp
+
+
+class ReceiptListener(stomp.ConnectionListener):
+    """
+    Lets a thread wait for the broker to confirm a frame with a RECEIPT. The wait fails if
+    the broker answers with an ERROR frame or the connection is lost.
+    """
+
+    def __init__(self, prefix='receipt'):
+        """
+        :param prefix: Prefix of the receipt ids created by new_receipt
+        """
+        self._prefix = prefix
+        self._ids = itertools.count(1)
+        # receipt id -> None while waiting, True once received or the error message
+        self._receipts = {}
+        self._condition = threading.Condition()
+
+    def new_receipt(self):
+        """
+        :return: A receipt id to send in the receipt header of a frame
+        """
+        with self._condition:
+            receipt = '{}-{}'.format(self._prefix, next(self._ids))
+            self._receipts[receipt] = None
+            return receipt
+
+    def wait(self, receipt, timeout):
+        """
+        Block until the broker has sent the RECEIPT for a frame
+        :param receipt: The id returned by new_receipt
+        :param timeout: The maximum seconds to wait
+        :return: None if the receipt arrived, otherwise the reason it did not
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._receipts.get(receipt) is not None, timeout)
+            result = self._receipts.pop(receipt, None)
+        if result is True:
+            return None
+        return result or 'No receipt within {}s'.format(timeout)
+
+    def on_receipt(self, headers, body):
+        with self._condition:
+            if headers.get('receipt-id') in self._receipts:
+                self._receipts[headers['receipt-id']] = True
+                self._condition.notify_all()
+
+    def on_error(self, headers, body):
+        with self._condition:
+            receipt = headers.get('receipt-id')
+            if receipt in self._receipts:
+                self._receipts[receipt] = headers.get('message', body) or 'ERROR'
+                self._condition.notify_all()
+
+    def on_disconnected(self):
+        with self._condition:
+            for receipt, result in self._receipts.items():
+                if result is None:
+                    self._receipts[receipt] = 'Connection lost'
+            self._condition.notify_all()
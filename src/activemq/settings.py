@@ -3,6 +3,8 @@
 #
 # Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
 # ################################################################################# #
+import random
+
 from src.settings import ClientSettings
 
 
@@ -21,7 +23,48 @@ class ActiveMQSettings(ClientSettings):
                  reduction_complete='/queue/ReductionComplete',
                  reduction_error='/queue/ReductionError',
                  reduction_skipped='/queue/ReductionSkipped',
+                 connect_timeout=5.0,
+                 prefetch_size=1,
+                 queue_prefetch=None,
+                 ack_batch_size=1,
+                 ack_batch_interval=0.1,
+                 broker_hosts=None,
+                 auto_reconnect=True,
+                 reconnect_attempts=10,
+                 reconnect_initial_delay=0.1,
+                 reconnect_max_delay=30.0,
+                 codec='json',
+                 record_statistics=False,
+                 heartbeat=0.0,
+                 heartbeat_tolerance=2.0,
                  **kwargs):
+        """
+        :param connect_timeout: Seconds to wait for the broker to accept a connection
+        :param prefetch_size: The number of unacknowledged messages the broker may dispatch
+                              to each subscription
+        :param queue_prefetch: Optional dictionary of queue names to prefetch sizes that
+                               override prefetch_size for those queues
+        :param ack_batch_size: The number of messages acknowledged together by a single
+                               cumulative ack in client ack mode (1 acknowledges each message)
+        :param ack_batch_interval: The maximum seconds a message waits to be acknowledged
+                                   when acknowledgements are batched
+        :param broker_hosts: Optional list of 'host:port' strings of brokers to fail over to
+                             when the broker at host and port is unavailable
+        :param auto_reconnect: If True, reconnect and resubscribe when the connection is lost
+        :param reconnect_attempts: The number of times every broker is tried before giving up
+        :param reconnect_initial_delay: The maximum seconds to wait before the second attempt
+        :param reconnect_max_delay: The limit on the maximum delay, which doubles with each
+                                    attempt
+        :param codec: The name of the codec that encodes the dictionaries and
+                      ReductionMessages sent: json, orjson or msgpack
+        :param record_statistics: Record per queue message rates, receive lag and listener
+                                  latency
+        :param heartbeat: Seconds between the STOMP heartbeats sent to and expected from the
+                          broker (0 disables heartbeats). Time spent in listeners does not
+                          count towards the heartbeat_tolerance.
+        :param heartbeat_tolerance: The multiple of the negotiated heartbeat interval after
+                                    which a silent connection is treated as lost
+        """
         super(ActiveMQSettings, self).__init__(**kwargs)
 
         self.reduction_pending = reduction_pending
@@ -30,5 +73,47 @@ class ActiveMQSettings(ClientSettings):
         self.reduction_complete = reduction_complete
         self.reduction_error = reduction_error
         self.reduction_skipped = reduction_skipped
+        self.connect_timeout = connect_timeout
+        self.prefetch_size = prefetch_size
+        self.queue_prefetch = queue_prefetch or {}
+        self.ack_batch_size = ack_batch_size
+        self.ack_batch_interval = ack_batch_interval
+        self.broker_hosts = broker_hosts or []
+        self.auto_reconnect = auto_reconnect
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_initial_delay = reconnect_initial_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.codec = codec
+        self.record_statistics = record_statistics
+        self.heartbeat = heartbeat
+        self.heartbeat_tolerance = heartbeat_tolerance
         self.all_subscriptions = [data_ready, reduction_started,
-                                  reduction_complete, reduction_error, reduction_skipped]
\ No newline at end of file
+                                  reduction_complete, reduction_error, reduction_skipped]
+
+    def get_prefetch(self, queue):
+        """
+        :param queue: The name of the queue being subscribed to
+        :return: The prefetch size to request for the queue
+        """
+        return int(self.queue_prefetch.get(queue, self.prefetch_size))
+
+    def get_brokers(self):
+        """
+        :return: list of the (host, port) of each broker, starting with host and port
+        """
+        brokers = [(self.host, int(self.port))]
+        for broker in self.broker_hosts:
+            host, _, port = broker.rpartition(':')
+            if not host or not port.isdigit():
+                raise ValueError("Broker {} is not of the form host:port".format(broker))
+            brokers.append((host, int(port)))
+        return brokers
+
+    def get_reconnect_delay(self, attempt):
+        """
+        :param attempt: The number of times every broker has been tried
+        :return: Seconds to wait before trying again, chosen at random up to a maximum that
+                 doubles with each attempt so that clients do not reconnect in step
+        """
+        return random.uniform(0, min(self.reconnect_max_delay,
+                                     self.reconnect_initial_delay * 2 ** attempt))
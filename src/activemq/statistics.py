@@ -0,0 +1,202 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Per destination message rates, queue lag and handler latency instrumentation
+"""
+import threading
+import time
+
+from src.activemq.subscriptions import ListenerWrapper
+from src.histogram import Histogram
+
+# Header holding the milliseconds since the epoch at which a message was sent
+SENT_HEADER = 'sent-timestamp'
+# Upper bounds in seconds of the buckets of the time messages wait in a queue, which may be
+# minutes while runs are waiting to be reduced
+LAG_BUCKETS = (0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0, 14400.0)
+
+
+def sent_timestamp():
+    """ :return: The value of the SENT_HEADER of a message sent now """
+    return str(int(time.time() * 1000))
+
+
+def receive_lag(headers, now):
+    """
+    :param headers: The headers of a message
+    :param now: The time since the epoch in seconds at which the message was received
+    :return: The seconds since the message was sent, from the SENT_HEADER or the timestamp
+             set by the broker, or None if the message has neither
+    """
+    sent = headers.get(SENT_HEADER) or headers.get('timestamp')
+    try:
+        # The clocks of the sender and receiver may differ slightly
+        return max(0.0, now - int(sent) / 1000)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Destination:
+    """ The statistics of one destination """
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.failed = 0
+        self.lag = Histogram(LAG_BUCKETS)
+        self.handler = Histogram()
+
+
+class MessageStatistics:
+    """
+    Records the number of messages sent, received and failed by each destination along with
+    histograms of how long received messages waited in the queue and how long their listener
+    took to handle them
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._destinations = {}
+        self._started = time.monotonic()
+
+    def _destination(self, destination):
+        """ :return: The _Destination record of a destination. The lock must be held. """
+        record = self._destinations.get(destination)
+        if record is None:
+            record = self._destinations[destination] = _Destination()
+        return record
+
+    def record_sent(self, destination, count=1):
+        """
+        Record messages sent to a destination
+        :param destination: The queue the messages were sent to
+        :param count: The number of messages sent
+        """
+        with self._lock:
+            self._destination(destination).sent += count
+
+    def record_received(self, destination, lag, elapsed, failed=False):
+        """
+        Record a message received from a destination
+        :param destination: The queue the message was received from
+        :param lag: The seconds since the message was sent or None if unknown
+        :param elapsed: The seconds the listener took to handle the message
+        :param failed: True if the listener raised an exception
+        """
+        with self._lock:
+            record = self._destination(destination)
+            record.received += 1
+            if failed:
+                record.failed += 1
+            if lag is not None:
+                record.lag.observe(lag)
+            record.handler.observe(elapsed)
+
+    def snapshot(self):
+        """
+        :return: dictionary of the seconds recorded for and, for each destination, the
+                 number of messages sent, received and failed, the messages sent and received
+                 per second and histograms of the receive lag and handler latency
+        """
+        with self._lock:
+            seconds = time.monotonic() - self._started
+            destinations = {}
+            for destination, record in self._destinations.items():
+                destinations[destination] = {
+                    'sent': record.sent,
+                    'received': record.received,
+                    'failed': record.failed,
+                    'sent_per_second': record.sent / seconds if seconds else 0.0,
+                    'received_per_second': record.received / seconds if seconds else 0.0,
+                    'receive_lag': record.lag.snapshot(),
+                    'handler_latency': record.handler.snapshot()}
+            return {'seconds': seconds, 'destinations': destinations}
+
+    def prometheus(self):
+        """
+        :return: The statistics in the Prometheus text exposition format
+        """
+        destinations = self.snapshot()['destinations']
+        lines = []
+        for name, key, help_text in (
+                ('activemq_messages_sent_total', 'sent', 'Messages sent'),
+                ('activemq_messages_received_total', 'received', 'Messages received'),
+                ('activemq_messages_failed_total', 'failed',
+                 'Messages whose listener raised an exception')):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} counter'.format(name))
+            for destination, record in sorted(destinations.items()):
+                lines.append('{}{{destination="{}"}} {}'.format(
+                    name, _escape(destination), record[key]))
+        for name, key, help_text in (
+                ('activemq_receive_lag_seconds', 'receive_lag',
+                 'Seconds from sending a message to receiving it'),
+                ('activemq_handler_seconds', 'handler_latency',
+                 'Seconds taken by the listener to handle a message')):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} histogram'.format(name))
+            for destination, record in sorted(destinations.items()):
+                histogram = record[key]
+                label = 'destination="{}"'.format(_escape(destination))
+                for upper_bound, count in histogram['buckets']:
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, label, upper_bound,
+                                                                    count))
+                lines.append('{}_sum{{{}}} {}'.format(name, label, histogram['sum']))
+                lines.append('{}_count{{{}}} {}'.format(name, label, histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """
+        Discard the statistics recorded so far
+        """
+        with self._lock:
+            self._destinations = {}
+            self._started = time.monotonic()
+
+
+def prometheus_counters(counters):
+    """
+    :param counters: list of tuples of the name, help text and value of each counter
+    :return: The counters in the Prometheus text exposition format
+    """
+    lines = []
+    for name, help_text, value in counters:
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} counter'.format(name))
+        lines.append('{} {}'.format(name, value))
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    """ :return: A value escaped for use as a Prometheus label value """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class InstrumentedListener(ListenerWrapper):
+    """
+    Records the lag, handler latency and failure of each message passed to a listener
+    """
+
+    def __init__(self, listener, statistics, destination):
+        """
+        :param listener: The stomp.ConnectionListener to pass the messages to
+        :param statistics: The MessageStatistics to record to
+        :param destination: The queue the listener is subscribed to
+        """
+        super(InstrumentedListener, self).__init__(listener)
+        self._statistics = statistics
+        self._destination = destination
+
+    def on_message(self, headers, body):
+        lag = receive_lag(headers, time.time())
+        start = time.perf_counter()
+        failed = True
+        try:
+            self.listener.on_message(headers, body)
+            failed = False
+        finally:
+            self._statistics.record_received(self._destination, lag,
+                                             time.perf_counter() - start, failed)
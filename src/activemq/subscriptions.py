@@ -0,0 +1,122 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Routing of messages to the listener of the subscription they were delivered to
+"""
+import threading
+from collections import namedtuple
+
+import stomp
+
+# A subscription to a queue on the current connection
+Subscription = namedtuple('Subscription', 'id destination listener ack prefetch consumer_name')
+
+
+class ListenerWrapper(stomp.ConnectionListener):
+    """
+    Base class of listeners that pass messages on to another listener. Connection events
+    are passed on unchanged.
+    """
+
+    def __init__(self, listener):
+        """
+        :param listener: The stomp.ConnectionListener to pass the messages to
+        """
+        self.listener = listener
+
+    def on_message(self, headers, body):
+        self.listener.on_message(headers, body)
+
+    def on_connecting(self, host_and_port):
+        self.listener.on_connecting(host_and_port)
+
+    def on_connected(self, headers, body):
+        self.listener.on_connected(headers, body)
+
+    def on_disconnected(self):
+        self.listener.on_disconnected()
+
+    def on_heartbeat_timeout(self):
+        self.listener.on_heartbeat_timeout()
+
+    def on_receipt(self, headers, body):
+        self.listener.on_receipt(headers, body)
+
+    def on_error(self, headers, body):
+        self.listener.on_error(headers, body)
+
+
+class SubscriptionRouter(stomp.ConnectionListener):
+    """
+    Passes each message to the listener of the subscription named by its subscription
+    header and passes connection events to every subscribed listener once
+    """
+
+    def __init__(self):
+        self._listeners = {}
+        self._lock = threading.Lock()
+
+    def add(self, subscription_id, listener):
+        """
+        Send the messages of a subscription to a listener
+        :param subscription_id: The id of the subscription
+        :param listener: The stomp.ConnectionListener to call or None to ignore the messages
+        """
+        with self._lock:
+            self._listeners[subscription_id] = listener
+
+    def remove(self, subscription_id):
+        """
+        Stop sending the messages of a subscription to its listener
+        :param subscription_id: The id of the subscription
+        """
+        with self._lock:
+            self._listeners.pop(subscription_id, None)
+
+    def clear(self):
+        """ Remove every subscription """
+        with self._lock:
+            self._listeners = {}
+
+    def listeners(self):
+        """ :return: list of the distinct listeners of the subscriptions """
+        with self._lock:
+            listeners = []
+            for listener in self._listeners.values():
+                if listener is not None and all(listener is not other for other in listeners):
+                    listeners.append(listener)
+            return listeners
+
+    def on_message(self, headers, body):
+        with self._lock:
+            listener = self._listeners.get(headers.get('subscription'))
+        if listener is not None:
+            listener.on_message(headers, body)
+
+    def _broadcast(self, event, *args):
+        """ Call an event handler of every listener """
+        for listener in self.listeners():
+            handler = getattr(listener, event, None)
+            if handler is not None:
+                handler(*args)
+
+    def on_connecting(self, host_and_port):
+        self._broadcast('on_connecting', host_and_port)
+
+    def on_connected(self, headers, body):
+        self._broadcast('on_connected', headers, body)
+
+    def on_disconnected(self):
+        self._broadcast('on_disconnected')
+
+    def on_heartbeat_timeout(self):
+        self._broadcast('on_heartbeat_timeout')
+
+    def on_receipt(self, headers, body):
+        self._broadcast('on_receipt', headers, body)
+
+    def on_error(self, headers, body):
+        self._broadcast('on_error', headers, body)
@@ -0,0 +1,456 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Local STOMP 1.1 broker stand-in.
+This provides enough of the behaviour of ActiveMQ for the ActiveMQClient to be exercised
+without access to a broker. Messages sent to a destination, or sent in a transaction once it
+is committed, are queued and delivered to one of its subscribers in turn. Subscriptions
+using client or client-individual ack modes are limited to activemq.prefetchSize
+unacknowledged messages, which are redelivered if the subscription ends before they are
+acknowledged. If the stand-in is created with a heartbeat interval it exchanges heartbeats
+with clients that ask for them and, like ActiveMQ's inactivity monitor, closes the
+connection of a client that sends nothing for two heartbeat intervals.
+
+Run python -m src.activemq.tests.stomp_stand_in to start a stand-in for manual testing.
+"""
+import argparse
+import itertools
+import socket
+import socketserver
+import threading
+import time
+
+from src.activemq.frames import encode_frame, HEARTBEAT, parse_frames
+
+
+class _Subscription:
+    """
+    A client subscription to a destination
+    """
+
+    def __init__(self, session, subscription_id, destination, ack, prefetch):
+        self.session = session
+        self.id = subscription_id
+        self.destination = destination
+        self.ack = ack
+        self.prefetch = prefetch
+        self.unacked = []
+
+    def has_credit(self):
+        """ :return: True if another message can be delivered to the subscription """
+        return self.ack == 'auto' or len(self.unacked) < self.prefetch
+
+
+class _Session(socketserver.BaseRequestHandler):
+    """
+    Handles the frames of one client connection
+    """
+
+    def setup(self):
+        self.broker = self.server.broker
+        self.subscriptions = {}
+        self.transactions = {}
+        self.connected = False
+        self.silenced = False
+        self.closed = threading.Event()
+        self.last_received = time.monotonic()
+        self._send_lock = threading.Lock()
+        # Frames are written individually so avoid waiting for the client's delayed ACKs
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send_frame(self, command, headers=None, body=b''):
+        """ Send a frame to the client """
+        self._send(encode_frame(command, headers, body))
+
+    def send_heartbeat(self):
+        """ Send a heartbeat to the client """
+        self._send(HEARTBEAT)
+
+    def _send(self, data):
+        """ Send bytes to the client unless the connection has been silenced """
+        with self._send_lock:
+            if self.silenced:
+                return
+            try:
+                self.request.sendall(data)
+            except OSError:
+                pass
+
+    def handle(self):
+        self.broker.sessions.add(self)
+        buffer = bytearray()
+        try:
+            while True:
+                try:
+                    data = self.request.recv(65536)
+                except OSError:
+                    return
+                if not data:
+                    return
+                self.last_received = time.monotonic()
+                buffer.extend(data)
+                for command, headers, body in parse_frames(buffer):
+                    if command is None:
+                        continue
+                    if self.broker.latency:
+                        time.sleep(self.broker.latency)
+                    if not self.broker.handle_frame(self, command, headers, body):
+                        return
+        finally:
+            self.closed.set()
+            self.broker.sessions.discard(self)
+            self.broker.end_session(self)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class StompStandIn:
+    """
+    Threaded STOMP 1.1 broker listening on a local port
+    """
+
+    # pylint:disable=too-many-arguments
+    def __init__(self, host='127.0.0.1', port=0, connected_delay=0.0, username=None,
+                 password=None, latency=0.0, reject_commits=False, heartbeat=0.0):
+        """
+        :param host: The address to listen on
+        :param port: The port to listen on (0 to choose a free port)
+        :param connected_delay: Seconds to wait before answering CONNECT
+        :param username: If set, the login required to connect
+        :param password: If set, the passcode required to connect
+        :param latency: Seconds to wait before handling each frame, simulating a network
+                        round trip
+        :param reject_commits: If True, answer COMMIT frames with an ERROR
+        :param heartbeat: The minimum seconds between the heartbeats exchanged with clients
+                          that ask for them (0 to disable heartbeats)
+        """
+        self.connected_delay = connected_delay
+        self.latency = latency
+        self.reject_commits = reject_commits
+        self.heartbeat = heartbeat
+        self.username = username
+        self.password = password
+        self.sessions = set()
+        self.queues = {}
+        self.sent = {}
+        self.frames = []
+        self.acks = 0
+        self.commits = 0
+        self.heartbeat_timeouts = 0
+        self._subscribers = {}
+        self._message_ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._server = _Server((host, port), _Session)
+        self._server.broker = self
+        self._thread = None
+
+    @property
+    def host(self):
+        """ :return: The address the broker is listening on """
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        """ :return: The port the broker is listening on """
+        return self._server.server_address[1]
+
+    def start(self):
+        """ Start accepting connections on a background thread """
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.01,),
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stop accepting connections and close every open connection """
+        self._server.shutdown()
+        self._server.server_close()
+        for session in list(self.sessions):
+            self.drop(session)
+
+    @staticmethod
+    def drop(session):
+        """ Close a client connection without a DISCONNECT, as if the network failed """
+        try:
+            session.request.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        session.request.close()
+
+    @staticmethod
+    def silence(session):
+        """
+        Stop sending anything to a client while leaving its connection open, as if the
+        network had failed without closing the connection
+        """
+        session.silenced = True
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def wait_for(self, predicate, timeout=5.0):
+        """
+        Wait until predicate() is True
+        :return: True if the predicate became True within the timeout
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if predicate():
+                    return True
+            time.sleep(0.001)
+        return False
+
+    # ======================== Frame handling ============================== #
+    def handle_frame(self, session, command, headers, body):
+        """
+        Act on a frame from a client
+        :return: False if the connection should be closed
+        """
+        with self._lock:
+            self.frames.append((command, headers))
+        handler = getattr(self, '_on_' + command.lower(), None)
+        if handler is None:
+            session.send_frame('ERROR', {'message': 'Unknown command {}'.format(command)})
+            return False
+        if not session.connected and command not in ('CONNECT', 'STOMP'):
+            session.send_frame('ERROR', {'message': 'Not connected'})
+            return False
+        result = handler(session, headers, body)
+        if result is False:
+            return False
+        if 'receipt' in headers and command != 'CONNECT':
+            session.send_frame('RECEIPT', {'receipt-id': headers['receipt']})
+        return True
+
+    def _on_connect(self, session, headers, _):
+        if self.connected_delay:
+            time.sleep(self.connected_delay)
+        if self.username is not None and (headers.get('login') != self.username or
+                                          headers.get('passcode') != self.password):
+            session.send_frame('ERROR', {'message': 'Authentication failed'})
+            return False
+        session.connected = True
+        heartbeat = int(self.heartbeat * 1000)
+        session.send_frame('CONNECTED', {'version': '1.1',
+                                         'heart-beat': '{0},{0}'.format(heartbeat),
+                                         'server': 'StompStandIn'})
+        # The client offers heartbeats with the first value of its heart-beat header and
+        # asks for them with the second
+        offered, wanted = (int(value) for value in
+                           headers.get('heart-beat', '0,0').split(','))
+        if heartbeat and wanted:
+            threading.Thread(target=self._send_heartbeats,
+                             args=(session, max(heartbeat, wanted) / 1000), daemon=True).start()
+        if heartbeat and offered:
+            threading.Thread(target=self._check_heartbeats,
+                             args=(session, max(heartbeat, offered) / 1000), daemon=True).start()
+        return True
+
+    @staticmethod
+    def _send_heartbeats(session, interval):
+        """ Send heartbeats to a client until its connection closes """
+        while not session.closed.wait(interval):
+            session.send_heartbeat()
+
+    def _check_heartbeats(self, session, interval):
+        """ Close the connection of a client that has sent nothing for two intervals """
+        while not session.closed.wait(interval):
+            if time.monotonic() - session.last_received > 2 * interval:
+                with self._lock:
+                    self.heartbeat_timeouts += 1
+                self.drop(session)
+                return
+
+    _on_stomp = _on_connect
+
+    @staticmethod
+    def _on_disconnect(session, headers, _):
+        if 'receipt' in headers:
+            session.send_frame('RECEIPT', {'receipt-id': headers['receipt']})
+        return False
+
+    @staticmethod
+    def _error(session, message, headers):
+        """ Send an ERROR frame about a frame and close the connection """
+        error = {'message': message}
+        if 'receipt' in headers:
+            error['receipt-id'] = headers['receipt']
+        session.send_frame('ERROR', error)
+        return False
+
+    def _on_begin(self, session, headers, _):
+        if headers.get('transaction') in session.transactions:
+            return self._error(session, 'Transaction already started', headers)
+        session.transactions[headers['transaction']] = []
+        return True
+
+    def _on_commit(self, session, headers, _):
+        frames = session.transactions.pop(headers.get('transaction'), None)
+        if frames is None:
+            return self._error(session, 'Unknown transaction', headers)
+        if self.reject_commits:
+            return self._error(session, 'Commit rejected', headers)
+        with self._lock:
+            self.commits += 1
+            for frame_headers, body in frames:
+                self._on_send(session, frame_headers, body)
+        return True
+
+    def _on_abort(self, session, headers, _):
+        if session.transactions.pop(headers.get('transaction'), None) is None:
+            return self._error(session, 'Unknown transaction', headers)
+        return True
+
+    def _on_send(self, session, headers, body):
+        if 'transaction' in headers:
+            if headers['transaction'] not in session.transactions:
+                return self._error(session, 'Unknown transaction', headers)
+            frame_headers = {key: value for key, value in headers.items()
+                             if key != 'transaction'}
+            session.transactions[headers['transaction']].append((frame_headers, body))
+            return True
+        destination = headers['destination']
+        message_headers = {key: value for key, value in headers.items()
+                           if key not in ('receipt', 'content-length')}
+        with self._lock:
+            message_headers['message-id'] = 'ID:stand-in-{}'.format(next(self._message_ids))
+            self.sent.setdefault(destination, []).append(body)
+            self.queues.setdefault(destination, []).append((message_headers, body))
+            self._dispatch(destination)
+        return True
+
+    def _on_subscribe(self, session, headers, _):
+        subscription = _Subscription(session, headers['id'], headers['destination'],
+                                     headers.get('ack', 'auto'),
+                                     int(headers.get('activemq.prefetchSize', 1000)))
+        with self._lock:
+            session.subscriptions[subscription.id] = subscription
+            self._subscribers.setdefault(subscription.destination, []).append(subscription)
+            self._dispatch(subscription.destination)
+
+    def _on_unsubscribe(self, session, headers, _):
+        with self._lock:
+            subscription = session.subscriptions.pop(headers['id'], None)
+            if subscription is not None:
+                self._end_subscription(subscription)
+
+    def _on_ack(self, session, headers, _):
+        with self._lock:
+            subscription = session.subscriptions.get(headers.get('subscription'))
+            if subscription is None:
+                return
+            message_ids = [message[0]['message-id'] for message in subscription.unacked]
+            if headers['message-id'] not in message_ids:
+                return
+            index = message_ids.index(headers['message-id'])
+            self.acks += 1
+            if subscription.ack == 'client':
+                # Acknowledgements in client mode are cumulative
+                del subscription.unacked[:index + 1]
+            else:
+                del subscription.unacked[index]
+            self._dispatch(subscription.destination)
+
+    def _on_nack(self, session, headers, _):
+        with self._lock:
+            subscription = session.subscriptions.get(headers.get('subscription'))
+            if subscription is None:
+                return
+            for index, (message_headers, body) in enumerate(subscription.unacked):
+                if message_headers['message-id'] == headers['message-id']:
+                    del subscription.unacked[index]
+                    self._redeliver(subscription.destination, [(message_headers, body)])
+                    break
+
+    def end_session(self, session):
+        """ Remove the subscriptions and discard the open transactions of a closed connection """
+        session.transactions = {}
+        with self._lock:
+            for subscription in session.subscriptions.values():
+                self._end_subscription(subscription)
+            session.subscriptions = {}
+
+    def _end_subscription(self, subscription):
+        """
+        Remove a subscription and redeliver its unacknowledged messages.
+        The lock must be held.
+        """
+        self._subscribers[subscription.destination].remove(subscription)
+        self._redeliver(subscription.destination, subscription.unacked)
+        subscription.unacked = []
+
+    def _redeliver(self, destination, messages):
+        """
+        Return messages to the front of a queue marked as redelivered.
+        The lock must be held.
+        """
+        redelivered = [(dict(headers, redelivered='true'), body) for headers, body in messages]
+        self.queues.setdefault(destination, [])[:0] = redelivered
+        self._dispatch(destination)
+
+    def _dispatch(self, destination):
+        """
+        Deliver the queued messages of a destination to its subscribers in turn.
+        The lock must be held.
+        """
+        queue = self.queues.get(destination, [])
+        subscribers = self._subscribers.get(destination, [])
+        while queue:
+            available = [subscription for subscription in subscribers
+                         if subscription.has_credit()]
+            if not available:
+                return
+            subscription = available[0]
+            subscribers.remove(subscription)
+            subscribers.append(subscription)
+            headers, body = queue.pop(0)
+            self._deliver(subscription, headers, body)
+
+    @staticmethod
+    def _deliver(subscription, headers, body):
+        """ Send a MESSAGE frame to a subscriber. The lock must be held. """
+        if subscription.ack != 'auto':
+            subscription.unacked.append((headers, body))
+        headers = dict(headers, subscription=subscription.id)
+        subscription.session.send_frame('MESSAGE', headers, body)
+
+
+def main(argv=None):
+    """
+    Command line entry point for running a stand-in until interrupted
+    """
+    parser = argparse.ArgumentParser(description='Run a local STOMP 1.1 broker stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=61613)
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--heartbeat', type=float, default=0.0,
+                        help='seconds between heartbeats (0 to disable them)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds to wait before handling each frame')
+    args = parser.parse_args(argv)
+    broker = StompStandIn(args.host, args.port, username=args.username,
+                          password=args.password, latency=args.latency,
+                          heartbeat=args.heartbeat).start()
+    print('STOMP stand-in listening on {}:{}'.format(broker.host, broker.port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.stop()
+
+
+if __name__ == '__main__':
+    main()
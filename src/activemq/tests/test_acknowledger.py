@@ -0,0 +1,100 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for the batch acknowledger
+"""
+import threading
+import unittest
+
+from src.activemq.acknowledger import BatchAcknowledger
+
+
+# pylint:disable=missing-docstring
+class TestBatchAcknowledger(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.event = threading.Event()
+        self.acknowledger = None
+
+    def tearDown(self):
+        if self.acknowledger is not None:
+            self.acknowledger.close()
+
+    def send_ack(self, message_id, subscription):
+        self.sent.append((message_id, subscription))
+        self.event.set()
+
+    def test_acks_latest_message_of_batch(self):
+        self.acknowledger = BatchAcknowledger(self.send_ack, batch_size=3, interval=60)
+        self.acknowledger.track('1', prefetch=100)
+        for message_id in range(7):
+            self.acknowledger.ack(str(message_id), '1')
+        self.assertEqual([('2', '1'), ('5', '1')], self.sent)
+        self.assertEqual(1, self.acknowledger.pending())
+        self.acknowledger.flush()
+        self.assertEqual(('6', '1'), self.sent[-1])
+        self.assertEqual(3, self.acknowledger.frames_sent)
+
+    def test_batch_size_limited_by_prefetch(self):
+        self.acknowledger = BatchAcknowledger(self.send_ack, batch_size=100, interval=60)
+        self.acknowledger.track('1', prefetch=2)
+        self.acknowledger.ack('a', '1')
+        self.acknowledger.ack('b', '1')
+        self.assertEqual([('b', '1')], self.sent)
+
+    def test_subscriptions_batched_separately(self):
+        self.acknowledger = BatchAcknowledger(self.send_ack, batch_size=2, interval=60)
+        self.acknowledger.track('1', prefetch=10)
+        self.acknowledger.track('2', prefetch=10)
+        self.acknowledger.ack('a', '1')
+        self.acknowledger.ack('b', '2')
+        self.assertEqual([], self.sent)
+        self.acknowledger.ack('c', '2')
+        self.assertEqual([('c', '2')], self.sent)
+
+    def test_acks_after_interval(self):
+        self.acknowledger = BatchAcknowledger(self.send_ack, batch_size=100, interval=0.01)
+        self.acknowledger.track('1', prefetch=100)
+        self.acknowledger.ack('a', '1')
+        self.assertTrue(self.event.wait(5))
+        self.assertEqual([('a', '1')], self.sent)
+
+    def test_reset_discards_pending(self):
+        self.acknowledger = BatchAcknowledger(self.send_ack, batch_size=10, interval=60)
+        self.acknowledger.track('1', prefetch=10)
+        self.acknowledger.ack('a', '1')
+        self.acknowledger.ack('b', '1')
+        self.acknowledger.on_disconnected()
+        self.assertEqual(0, self.acknowledger.pending())
+        self.acknowledger.flush()
+        self.assertEqual([], self.sent)
+
+    def test_close_sends_pending(self):
+        self.acknowledger = BatchAcknowledger(self.send_ack, batch_size=10, interval=60)
+        self.acknowledger.track('1', prefetch=10)
+        self.acknowledger.ack('a', '1')
+        self.acknowledger.close()
+        self.assertEqual([('a', '1')], self.sent)
+        self.assertRaises(RuntimeError, self.acknowledger.ack, 'b', '1')
+        self.acknowledger = None
+
+    def test_untrack(self):
+        self.acknowledger = BatchAcknowledger(self.send_ack, batch_size=10, interval=60)
+        self.acknowledger.track('1', prefetch=10)
+        self.acknowledger.ack('a', '1')
+        self.acknowledger.untrack('1')
+        self.assertEqual([('a', '1')], self.sent)
+        self.assertFalse(self.acknowledger.is_tracked('1'))
+
+    def test_send_errors_logged(self):
+        def fail(*_):
+            raise OSError("Not connected")
+        self.acknowledger = BatchAcknowledger(fail, batch_size=1, interval=60)
+        self.acknowledger.track('1', prefetch=10)
+        with self.assertLogs(level='ERROR'):
+            self.acknowledger.ack('a', '1')
+        self.assertEqual(0, self.acknowledger.pending())
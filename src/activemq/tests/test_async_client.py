@@ -0,0 +1,183 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test functionality for the asyncio activemq client
+"""
+import asyncio
+import json
+import time
+import unittest
+
+from mock import patch
+
+from src.activemq import ActiveMQSettings, AsyncActiveMQClient
+from src.activemq.connection_state import CLOSED, CONNECTED
+from src.activemq.tests.stomp_stand_in import StompStandIn
+from src.activemq.tests.test_client import FakeMsgpack, stand_in_settings
+from src.connection_exception import ConnectionException
+
+QUEUE = '/queue/DataReady'
+
+
+# pylint:disable=missing-docstring,protected-access
+class TestAsyncActiveMQClient(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.broker = StompStandIn(username='user', password='pass').start()
+        self.client = AsyncActiveMQClient(stand_in_settings(self.broker))
+
+    async def asyncTearDown(self):
+        await self.client.disconnect()
+        self.broker.stop()
+
+    def test_invalid_init(self):
+        self.assertRaises(TypeError, AsyncActiveMQClient, 'string')
+
+    async def test_connect(self):
+        self.assertEqual(CLOSED, self.client.state)
+        await self.client.connect()
+        self.assertEqual(CONNECTED, self.client.state)
+        self.assertTrue(self.client._test_connection())
+        await self.client.disconnect()
+        self.assertEqual(CLOSED, self.client.state)
+        self.assertRaises(ConnectionException, self.client._test_connection)
+
+    async def test_connect_rejected(self):
+        self.client = AsyncActiveMQClient(ActiveMQSettings(username='user', password='wrong',
+                                                           host=self.broker.host,
+                                                           port=str(self.broker.port)))
+        with self.assertLogs(level='ERROR'):
+            with self.assertRaises(ConnectionException):
+                await self.client.connect()
+        self.assertEqual(CLOSED, self.client.state)
+
+    async def test_connect_timeout(self):
+        self.broker.connected_delay = 1
+        self.client = AsyncActiveMQClient(stand_in_settings(self.broker, connect_timeout=0.05))
+        with self.assertLogs(level='ERROR'):
+            with self.assertRaises(ConnectionException):
+                await self.client.connect()
+
+    async def test_send_with_receipt(self):
+        async with self.client:
+            await self.client.send(QUEUE, 'message', headers={'run': '1'}, receipt=True)
+            self.assertEqual([b'message'], self.broker.sent[QUEUE])
+            self.assertEqual('1', self.broker.queues[QUEUE][0][0]['run'])
+
+    async def test_send_dictionary(self):
+        async with self.client:
+            await self.client.send(QUEUE, {'run_number': 1}, receipt=True)
+            headers, body = self.broker.queues[QUEUE][0]
+            self.assertEqual({'run_number': 1}, json.loads(body))
+            self.assertEqual('application/json', headers['content-type'])
+            self.assertIn('sent-timestamp', headers)
+
+    async def test_receipt_timeout(self):
+        self.client = AsyncActiveMQClient(stand_in_settings(self.broker), receipt_timeout=0.05)
+        await self.client.connect()
+        for session in list(self.broker.sessions):
+            self.broker.silence(session)
+        with self.assertLogs(level='WARNING'):
+            with self.assertRaises(ConnectionException):
+                await self.client.send(QUEUE, 'message', receipt=True)
+        self.assertEqual({}, self.client._receipts)
+
+    async def test_subscribe_and_iterate(self):
+        await self.client.connect()
+        subscription = await self.client.subscribe(QUEUE)
+        for index in range(3):
+            await self.client.send(QUEUE, str(index))
+        received = []
+        async for frame in subscription:
+            received.append(frame)
+            if len(received) == 3:
+                break
+        self.assertEqual(['0', '1', '2'], [frame.body for frame in received])
+        self.assertEqual({QUEUE}, {frame.headers['destination'] for frame in received})
+
+    async def test_invalid_text_replaced(self):
+        await self.client.connect()
+        subscription = await self.client.subscribe(QUEUE)
+        await self.client.send(QUEUE, b'\xffmessage')
+        frame = await asyncio.wait_for(subscription.__anext__(), 5)
+        self.assertEqual('\ufffdmessage', frame.body)
+        self.assertEqual(CONNECTED, self.client.state)
+
+    @patch('src.activemq.codec.msgpack', FakeMsgpack)
+    async def test_binary_codec_keeps_bytes(self):
+        self.client = AsyncActiveMQClient(stand_in_settings(self.broker, codec='msgpack'))
+        await self.client.connect()
+        subscription = await self.client.subscribe(QUEUE)
+        await self.client.send(QUEUE, FakeMsgpack.packb({'run_number': 1}))
+        frame = await asyncio.wait_for(subscription.__anext__(), 5)
+        self.assertEqual({'run_number': 1}, FakeMsgpack.unpackb(frame.body))
+
+    async def test_client_ack_with_prefetch(self):
+        await self.client.connect()
+        subscription = await self.client.subscribe(QUEUE, ack='client-individual', prefetch=2)
+        for index in range(5):
+            await self.client.send(QUEUE, str(index))
+        async for frame in subscription:
+            await subscription.ack(frame)
+            if frame.body == '4':
+                break
+        self.assertTrue(self.broker.wait_for(lambda: self.broker.acks == 5))
+
+    async def test_many_messages_in_flight(self):
+        await self.client.connect()
+        subscription = await self.client.subscribe(QUEUE, prefetch=1000)
+        await asyncio.gather(*(self.client.send(QUEUE, str(index)) for index in range(2000)))
+        received = 0
+        async for _ in subscription:
+            received += 1
+            if received == 2000:
+                break
+        self.assertEqual(2000, received)
+
+    async def test_unsubscribe_ends_iteration(self):
+        await self.client.connect()
+        subscription = await self.client.subscribe(QUEUE)
+        await subscription.unsubscribe()
+        self.assertEqual([], [frame async for frame in subscription])
+        with self.assertRaises(KeyError):
+            await subscription.unsubscribe()
+
+    async def test_connection_lost(self):
+        await self.client.connect()
+        subscription = await self.client.subscribe(QUEUE)
+        for session in list(self.broker.sessions):
+            self.broker.drop(session)
+        with self.assertLogs(level='WARNING'):
+            with self.assertRaises(ConnectionException):
+                await asyncio.wait_for(subscription.__anext__(), 5)
+        self.assertEqual(CLOSED, self.client.state)
+        with self.assertRaises(ConnectionException):
+            await self.client.send(QUEUE, 'message')
+
+    async def test_malformed_frame_closes_connection(self):
+        await self.client.connect()
+        subscription = await self.client.subscribe(QUEUE)
+        for session in list(self.broker.sessions):
+            session._send(b'MESSAGE\nsubscription:1\ncontent-length:x\n\n\x00')
+        with self.assertLogs(level='WARNING'):
+            with self.assertRaises(ConnectionException):
+                await asyncio.wait_for(subscription.__anext__(), 5)
+        self.assertEqual(CLOSED, self.client.state)
+
+    async def test_missed_heartbeats_close_connection(self):
+        self.broker.heartbeat = 0.05
+        self.client = AsyncActiveMQClient(stand_in_settings(self.broker, heartbeat=0.05))
+        await self.client.connect()
+        subscription = await self.client.subscribe(QUEUE)
+        await asyncio.sleep(0.1)
+        self.assertEqual(CONNECTED, self.client.state)
+        for session in list(self.broker.sessions):
+            self.broker.silence(session)
+        start = time.monotonic()
+        with self.assertLogs(level='WARNING'):
+            with self.assertRaises(ConnectionException):
+                await asyncio.wait_for(subscription.__anext__(), 5)
+        self.assertLess(time.monotonic() - start, 0.5)
@@ -6,12 +6,18 @@
 """
 Test functionality for the activemq client
 """
+import json
+import time
 import unittest
 
-from mock import patch, call
+from mock import call, patch
+import stomp
 
 from src.connection_exception import ConnectionException
 from src.activemq import ActiveMQClient, ActiveMQSettings
+from src.activemq.codec import DecodingListener
+from src.activemq.connection_state import CLOSED, CONNECTED, RECONNECTING
+from src.activemq.tests.stomp_stand_in import StompStandIn
 
 
 # pylint:disable=protected-access,invalid-name,missing-docstring
@@ -47,10 +53,10 @@ class TestQueueClient(unittest.TestCase):
         client.connect()
         self.assertTrue(client._test_connection())
 
-    @patch('stomp.connect.StompConnection11.is_connected', return_value=False)
-    def test_invalid_connection_raises_on_test(self, _):
+    def test_invalid_connection_raises_on_test(self):
         client = QueueClient()
         client.connect()
+        client._state.closing()
         self.assertRaises(ConnectionException, client._test_connection)
 
     def test_invalid_credentials(self):
@@ -118,19 +124,420 @@ class TestQueueClient(unittest.TestCase):
                          'consumer_name': 'consumer'}
         mock_subscribe.assert_called_once_with(**expected_args)
 
-    @patch('stomp.connect.StompConnection11.set_listener')
     @patch('stomp.connect.StompConnection11.subscribe')
-    def test_subscribe_to_queue(self, mock_subscribe, mock_set_listener):
+    def test_subscribe_to_queue(self, mock_subscribe):
         client = QueueClient()
         client.connect()
         client.subscribe_queues(['test', 'queues'], 'consumer', None, 'auto')
-        mock_set_listener.assert_called_once_with('consumer', None)
         test_expected_args = {'destination': 'test',
                               'id': '1',
                               'ack': 'auto',
-                              'header': {'activemq.prefetchSize': '1'}}
+                              'headers': {'activemq.prefetchSize': '1'}}
         queue_expected_args = {'destination': 'queues',
-                               'id': '1',
+                               'id': '2',
                                'ack': 'auto',
-                               'header': {'activemq.prefetchSize': '1'}}
+                               'headers': {'activemq.prefetchSize': '1'}}
         mock_subscribe.assert_has_calls([call(**test_expected_args), call(**queue_expected_args)])
+
+
+class RecordingListener(stomp.ConnectionListener):
+    """ Records the headers of the messages received """
+
+    def __init__(self):
+        self.received = []
+
+    def on_message(self, headers, body):
+        self.received.append(headers)
+
+
+class FakeMsgpack:
+    """ Stands in for msgpack, encoding JSON after a byte that is never valid UTF-8 """
+
+    @staticmethod
+    def packb(fields):
+        return b'\xff' + json.dumps(fields).encode('utf-8')
+
+    @staticmethod
+    def unpackb(body):
+        if not isinstance(body, bytes) or body[:1] != b'\xff':
+            raise ValueError("Not a packed body: {!r}".format(body))
+        return json.loads(body[1:])
+
+
+def stand_in_settings(broker, **kwargs):
+    """ :return: ActiveMQSettings for connecting to a StompStandIn """
+    return ActiveMQSettings(username='user', password='pass', host=broker.host,
+                            port=str(broker.port), **kwargs)
+
+
+# pylint:disable=protected-access,missing-docstring
+class TestQueueClientStandIn(unittest.TestCase):
+    """
+    Exercises the queue client against a local STOMP broker stand-in
+    """
+
+    def setUp(self):
+        self.broker = StompStandIn(username='user', password='pass').start()
+        self.client = ActiveMQClient(stand_in_settings(self.broker))
+
+    def tearDown(self):
+        self.client.disconnect()
+        self.broker.stop()
+
+    def test_connect_waits_for_connected_frame(self):
+        self.assertEqual(CLOSED, self.client.state)
+        start = time.monotonic()
+        self.client.connect()
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(CONNECTED, self.client.state)
+        self.assertTrue(self.client._test_connection())
+
+    def test_connect_slow_broker(self):
+        self.broker.connected_delay = 0.1
+        self.client.connect()
+        self.assertEqual(CONNECTED, self.client.state)
+
+    def test_connect_timeout(self):
+        self.broker.connected_delay = 1
+        self.client = ActiveMQClient(stand_in_settings(self.broker, connect_timeout=0.05))
+        self.assertRaises(ConnectionException, self.client.connect)
+        self.assertEqual(CLOSED, self.client.state)
+        self.assertIsNone(self.client._connection)
+
+    def test_connect_rejected(self):
+        self.client = ActiveMQClient(ActiveMQSettings(username='user', password='wrong',
+                                                      host=self.broker.host,
+                                                      port=str(self.broker.port)))
+        self.assertRaises(ConnectionException, self.client.connect)
+
+    def test_disconnect(self):
+        self.client.connect()
+        self.client.disconnect()
+        self.assertEqual(CLOSED, self.client.state)
+
+    def test_connection_lost(self):
+        self.client = ActiveMQClient(stand_in_settings(self.broker, auto_reconnect=False))
+        self.client.connect()
+        for session in list(self.broker.sessions):
+            self.broker.drop(session)
+        self.assertTrue(self.broker.wait_for(lambda: self.client.state == RECONNECTING))
+        self.assertRaises(ConnectionException, self.client._test_connection)
+        self.client.connect()
+        self.assertEqual(CONNECTED, self.client.state)
+        self.assertEqual(1, self.client.connection_stats()['outages'])
+
+    def test_reconnects_and_resubscribes(self):
+        received = self.subscribe(ack='auto')
+        subscription_id = self.client.subscriptions()['/queue/DataReady'].id
+        for session in list(self.broker.sessions):
+            self.broker.drop(session)
+        self.assertTrue(self.broker.wait_for(
+            lambda: self.client.connection_stats()['failovers'] == 1))
+        self.assertEqual(CONNECTED, self.client.state)
+        self.client.send('/queue/DataReady', 'message')
+        self.assertTrue(self.broker.wait_for(lambda: len(received) == 1))
+        self.assertEqual(subscription_id, received[0]['subscription'])
+
+    def test_heartbeats_keep_connection_open(self):
+        self.broker.heartbeat = 0.05
+        self.client = ActiveMQClient(stand_in_settings(self.broker, heartbeat=0.05))
+        self.client.connect()
+        time.sleep(0.2)
+        self.assertEqual(0, self.broker.heartbeat_timeouts)
+        self.assertEqual(0, self.client.connection_stats()['outages'])
+        self.assertEqual(CONNECTED, self.client.state)
+
+    def test_missed_heartbeats_reconnect(self):
+        self.broker.heartbeat = 0.05
+        received = self.subscribe(ack='auto', heartbeat=0.05)
+        for session in list(self.broker.sessions):
+            self.broker.silence(session)
+        start = time.monotonic()
+        self.assertTrue(self.broker.wait_for(
+            lambda: self.client.connection_stats()['failovers'] == 1))
+        self.assertLess(time.monotonic() - start, 0.5)
+        stats = self.client.connection_stats()
+        self.assertEqual(1, stats['outages'])
+        self.assertEqual(1, stats['heartbeat_timeouts'])
+        self.client.send('/queue/DataReady', 'message')
+        self.assertTrue(self.broker.wait_for(lambda: len(received) == 1))
+
+    def test_missed_heartbeats_discard_pending_acks(self):
+        self.broker.heartbeat = 0.05
+        received = self.subscribe(prefetch_size=100, ack_batch_size=10, ack_batch_interval=60,
+                                  heartbeat=0.05)
+        for index in range(3):
+            self.client.send('/queue/DataReady', str(index))
+        self.assertTrue(self.broker.wait_for(lambda: len(received) == 3))
+        for headers in received[:3]:
+            self.client.ack(headers['message-id'], headers['subscription'])
+        self.assertEqual(3, self.client._acknowledger.pending())
+        for session in list(self.broker.sessions):
+            self.broker.silence(session)
+        self.assertTrue(self.broker.wait_for(
+            lambda: self.client.connection_stats()['failovers'] == 1))
+        self.assertEqual(0, self.client._acknowledger.pending())
+        # The broker redelivers the messages whose acknowledgements were never sent
+        self.assertTrue(self.broker.wait_for(lambda: len(received) == 6))
+        for headers in received[3:]:
+            self.client.ack(headers['message-id'], headers['subscription'])
+        self.assertEqual(3, self.client._acknowledger.pending())
+        self.client._acknowledger.flush()
+        self.assertTrue(self.broker.wait_for(lambda: self.broker.acks == 1))
+        self.assertEqual([], self.broker.queues['/queue/DataReady'])
+
+    def test_slow_listener_not_treated_as_missed_heartbeats(self):
+        self.broker.heartbeat = 0.05
+        self.client = ActiveMQClient(stand_in_settings(self.broker, heartbeat=0.05))
+        self.client.connect()
+        received = []
+
+        def handle(headers, _):
+            received.append(headers)
+            time.sleep(0.5)
+            self.client.ack(headers['message-id'], headers['subscription'])
+
+        listener = stomp.ConnectionListener()
+        listener.on_message = handle
+        self.client.subscribe('/queue/DataReady', listener, ack='client-individual')
+        self.client.send('/queue/DataReady', 'message')
+        self.assertTrue(self.broker.wait_for(lambda: self.broker.acks == 1))
+        self.assertEqual(1, len(received))
+        self.assertEqual(0, self.client.connection_stats()['outages'])
+        self.assertEqual(CONNECTED, self.client.state)
+
+    def test_missed_heartbeats_without_auto_reconnect(self):
+        self.broker.heartbeat = 0.05
+        self.client = ActiveMQClient(stand_in_settings(self.broker, heartbeat=0.05,
+                                                       auto_reconnect=False))
+        self.client.connect()
+        for session in list(self.broker.sessions):
+            self.broker.silence(session)
+        self.assertTrue(self.broker.wait_for(lambda: self.client.state == RECONNECTING))
+        self.assertTrue(self.broker.wait_for(lambda: not self.broker.sessions))
+        self.client.connect()
+        self.assertEqual(CONNECTED, self.client.state)
+
+    def test_fails_over_to_next_broker(self):
+        with StompStandIn(username='user', password='pass') as backup:
+            received = self.subscribe(ack='auto', broker_hosts=[
+                '{}:{}'.format(backup.host, backup.port)])
+            self.broker.stop()
+            self.assertTrue(backup.wait_for(
+                lambda: self.client.connection_stats()['failovers'] == 1))
+            stats = self.client.connection_stats()
+            self.assertEqual((backup.host, backup.port), stats['broker'])
+            self.assertLess(stats['last_recovery'], 1.0)
+            self.client.send('/queue/DataReady', 'message')
+            self.assertTrue(backup.wait_for(lambda: len(received) == 1))
+            self.client.disconnect()
+
+    def test_connect_skips_unavailable_broker(self):
+        self.broker.stop()
+        with StompStandIn(username='user', password='pass') as backup:
+            self.client = ActiveMQClient(stand_in_settings(self.broker, broker_hosts=[
+                '{}:{}'.format(backup.host, backup.port)]))
+            self.client.connect()
+            self.assertEqual((backup.host, backup.port),
+                             self.client.connection_stats()['broker'])
+            self.client.disconnect()
+
+    def test_reconnect_gives_up(self):
+        self.client = ActiveMQClient(stand_in_settings(self.broker, reconnect_attempts=2,
+                                                       reconnect_initial_delay=0.01))
+        self.client.connect()
+        self.broker.stop()
+        self.assertTrue(self.broker.wait_for(lambda: self.client.state == CLOSED and
+                                             self.client._reconnecting() is None))
+        self.assertEqual(0, self.client.connection_stats()['failovers'])
+        self.assertRaises(ConnectionException, self.client.connect)
+
+    def test_send(self):
+        self.client.send('/queue/DataReady', 'message')
+        self.assertTrue(self.broker.wait_for(lambda: '/queue/DataReady' in self.broker.sent))
+        self.assertEqual([b'message'], self.broker.sent['/queue/DataReady'])
+
+    def test_send_batch(self):
+        result = self.client.send_batch('/queue/DataReady',
+                                        (str(index) for index in range(25)), chunk_size=10)
+        self.assertEqual(25, result['messages'])
+        self.assertEqual(3, result['transactions'])
+        self.assertGreater(result['messages_per_second'], 0)
+        self.assertEqual(3, self.broker.commits)
+        self.assertEqual([str(index).encode() for index in range(25)],
+                         self.broker.sent['/queue/DataReady'])
+        self.assertEqual(3, len([command for command, headers in self.broker.frames
+                                 if command == 'COMMIT' and 'receipt' in headers]))
+
+    def test_send_batch_without_receipts(self):
+        result = self.client.send_batch('/queue/DataReady', ['a', 'b'], receipts=False)
+        self.assertEqual(1, result['transactions'])
+        self.assertTrue(self.broker.wait_for(lambda: self.broker.commits == 1))
+        self.assertFalse(any('receipt' in headers for _, headers in self.broker.frames))
+
+    def test_send_batch_commit_rejected(self):
+        self.broker.reject_commits = True
+        with self.assertLogs(level='ERROR'):
+            self.assertRaises(ConnectionException, self.client.send_batch,
+                              '/queue/DataReady', ['a', 'b'])
+        self.assertNotIn('/queue/DataReady', self.broker.sent)
+
+    def test_send_batch_aborts_partial_chunk(self):
+        connection = self.client.connect()
+        send = connection.send
+        calls = []
+
+        def failing_send(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 3:
+                raise OSError("Broken pipe")
+            return send(*args, **kwargs)
+
+        with patch.object(connection, 'send', side_effect=failing_send):
+            with self.assertLogs(level='ERROR'):
+                self.assertRaises(ConnectionException, self.client.send_batch,
+                                  '/queue/DataReady', ['a', 'b', 'c', 'd'], chunk_size=2)
+        self.assertTrue(self.broker.wait_for(lambda: any(
+            command == 'ABORT' for command, _ in self.broker.frames)))
+        self.assertEqual([b'a', b'b'], self.broker.sent['/queue/DataReady'])
+
+    def subscribe(self, ack='client', **kwargs):
+        """ Connect with the given settings and collect the messages sent to DataReady """
+        self.client = ActiveMQClient(stand_in_settings(self.broker, **kwargs))
+        self.client.connect()
+        listener = RecordingListener()
+        self.client.subscribe_queues(['/queue/DataReady'], 'consumer', listener, ack)
+        return listener.received
+
+    @patch('src.activemq.codec.msgpack', FakeMsgpack)
+    def test_binary_codec(self):
+        self.client = ActiveMQClient(stand_in_settings(self.broker, codec='msgpack'))
+        self.client.connect()
+        received = []
+        self.client.subscribe_queues(['/queue/DataReady'], 'consumer', DecodingListener(
+            lambda headers, message: received.append(message), message_type=None))
+        self.client.send('/queue/DataReady', {'run_number': 1})
+        self.assertTrue(self.broker.wait_for(lambda: received))
+        self.assertEqual([{'run_number': 1}], received)
+        self.assertEqual(CONNECTED, self.client.state)
+
+    def test_subscribe_requests_prefetch(self):
+        self.subscribe(prefetch_size=50, queue_prefetch={'/queue/DataReady': 10})
+        self.assertTrue(self.broker.wait_for(
+            lambda: any(command == 'SUBSCRIBE' for command, _ in self.broker.frames)))
+        headers = [headers for command, headers in self.broker.frames
+                   if command == 'SUBSCRIBE'][0]
+        self.assertEqual('10', headers['activemq.prefetchSize'])
+
+    def test_prefetch_limits_unacknowledged_messages(self):
+        received = self.subscribe(prefetch_size=2)
+        for index in range(5):
+            self.client.send('/queue/DataReady', str(index))
+        self.assertTrue(self.broker.wait_for(lambda: len(received) == 2))
+        time.sleep(0.05)
+        self.assertEqual(2, len(received))
+        self.client.ack(received[1]['message-id'], received[1]['subscription'])
+        self.assertTrue(self.broker.wait_for(lambda: len(received) == 4))
+
+    def test_batched_acks(self):
+        received = self.subscribe(prefetch_size=100, ack_batch_size=10,
+                                  ack_batch_interval=60)
+        for index in range(25):
+            self.client.send('/queue/DataReady', str(index))
+        self.assertTrue(self.broker.wait_for(lambda: len(received) == 25))
+        for headers in received:
+            self.client.ack(headers['message-id'], headers['subscription'])
+        self.assertTrue(self.broker.wait_for(lambda: self.broker.acks == 2))
+        self.assertEqual(5, self.client._acknowledger.pending())
+        self.client.disconnect()
+        self.assertTrue(self.broker.wait_for(lambda: self.broker.acks == 3))
+        self.assertEqual([], self.broker.queues['/queue/DataReady'])
+
+    def test_batched_acks_after_interval(self):
+        received = self.subscribe(prefetch_size=100, ack_batch_size=10,
+                                  ack_batch_interval=0.01)
+        self.client.send('/queue/DataReady', 'message')
+        self.assertTrue(self.broker.wait_for(lambda: len(received) == 1))
+        self.client.ack(received[0]['message-id'], received[0]['subscription'])
+        self.assertTrue(self.broker.wait_for(lambda: self.broker.acks == 1))
+
+    def test_unacknowledged_messages_redelivered(self):
+        received = self.subscribe(prefetch_size=100, ack_batch_size=10,
+                                  ack_batch_interval=60)
+        for index in range(3):
+            self.client.send('/queue/DataReady', str(index))
+        self.assertTrue(self.broker.wait_for(lambda: len(received) == 3))
+        self.client.ack(received[0]['message-id'], received[0]['subscription'])
+        for session in list(self.broker.sessions):
+            self.broker.drop(session)
+        # The client resubscribes after reconnecting and receives all three again
+        self.assertTrue(self.broker.wait_for(lambda: len(received) == 6))
+        self.assertEqual(0, self.client._acknowledger.pending())
+        self.assertTrue(all(headers['redelivered'] == 'true' for headers in received[3:]))
+
+    def test_subscriptions_have_distinct_ids(self):
+        self.client.connect()
+        self.client.subscribe_autoreduce('consumer', RecordingListener())
+        ids = [subscription.id for subscription in self.client.subscriptions().values()]
+        self.assertEqual(5, len(set(ids)))
+        self.assertTrue(self.broker.wait_for(lambda: sum(
+            len(session.subscriptions) for session in self.broker.sessions) == 5))
+
+    def test_subscribe_amq_single_queue(self):
+        self.client.connect()
+        self.client.subscribe_amq('consumer', RecordingListener())
+        self.assertEqual(['/queue/ReductionPending'], list(self.client.subscriptions()))
+
+    def test_listener_per_queue(self):
+        self.client.connect()
+        pending, status = RecordingListener(), RecordingListener()
+        self.client.subscribe('/queue/ReductionPending', pending, prefetch=10)
+        self.client.subscribe_queues(['/queue/ReductionStarted', '/queue/ReductionComplete'],
+                                     'status', status)
+        self.client.send('/queue/ReductionPending', 'run')
+        self.client.send('/queue/ReductionStarted', 'started')
+        self.client.send('/queue/ReductionComplete', 'complete')
+        self.assertTrue(self.broker.wait_for(
+            lambda: len(pending.received) == 1 and len(status.received) == 2))
+        self.assertEqual(['/queue/ReductionPending'],
+                         [headers['destination'] for headers in pending.received])
+        self.assertEqual(10, self.client.subscriptions()['/queue/ReductionPending'].prefetch)
+
+    def test_unsubscribe(self):
+        self.client.connect()
+        listener = RecordingListener()
+        self.client.subscribe('/queue/DataReady', listener)
+        self.client.subscribe('/queue/ReductionPending', listener)
+        self.client.unsubscribe('/queue/DataReady')
+        self.assertTrue(self.broker.wait_for(lambda: any(
+            command == 'UNSUBSCRIBE' for command, _ in self.broker.frames)))
+        self.client.send('/queue/DataReady', 'ignored')
+        self.client.send('/queue/ReductionPending', 'received')
+        self.assertTrue(self.broker.wait_for(lambda: len(listener.received) == 1))
+        self.assertEqual(1, len(self.broker.queues['/queue/DataReady']))
+        self.assertRaises(KeyError, self.client.unsubscribe, '/queue/DataReady')
+        self.assertEqual(CONNECTED, self.client.state)
+
+    def test_resubscribe_replaces_subscription(self):
+        self.client.connect()
+        self.client.subscribe('/queue/DataReady', RecordingListener(), prefetch=1)
+        first = self.client.subscriptions()['/queue/DataReady'].id
+        self.client.subscribe('/queue/DataReady', RecordingListener(), prefetch=20)
+        subscription = self.client.subscriptions()['/queue/DataReady']
+        self.assertNotEqual(first, subscription.id)
+        self.assertTrue(self.broker.wait_for(lambda: [
+            list(session.subscriptions) for session in self.broker.sessions] ==
+                                             [[subscription.id]]))
+
+    def test_disconnect_clears_subscriptions(self):
+        self.client.connect()
+        self.client.subscribe('/queue/DataReady', RecordingListener())
+        self.client.disconnect()
+        self.assertEqual({}, self.client.subscriptions())
+
+    def test_ack_without_batching(self):
+        received = self.subscribe(ack='client-individual', ack_batch_size=10)
+        self.client.send('/queue/DataReady', 'message')
+        self.assertTrue(self.broker.wait_for(lambda: len(received) == 1))
+        self.client.ack(received[0]['message-id'], received[0]['subscription'])
+        self.assertTrue(self.broker.wait_for(lambda: self.broker.acks == 1))
@@ -0,0 +1,153 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for the message codecs
+"""
+import json
+import unittest
+
+from mock import Mock
+
+from src.activemq import ActiveMQClient
+from src.activemq.codec import (available_codecs, codec_for, DecodingListener, encode_message,
+                                get_codec, JsonCodec, MSGPACK, ReductionMessage)
+from src.activemq.tests.stomp_stand_in import StompStandIn
+from src.activemq.tests.test_client import stand_in_settings
+
+
+def reduction_message(**kwargs):
+    """ :return: A valid ReductionMessage with the given fields replaced """
+    fields = dict(rb_number=1234567, instrument='WISH', data='/archive/WISH00012345.nxs',
+                  run_number=12345, started_by=-1)
+    fields.update(kwargs)
+    return ReductionMessage(**fields)
+
+
+# pylint:disable=missing-docstring
+class TestReductionMessage(unittest.TestCase):
+
+    def test_fields(self):
+        message = reduction_message()
+        self.assertEqual({'rb_number': 1234567,
+                          'instrument': 'WISH',
+                          'data': '/archive/WISH00012345.nxs',
+                          'run_number': 12345,
+                          'facility': 'ISIS',
+                          'started_by': -1}, message.to_dict())
+        self.assertFalse(hasattr(message, '__dict__'))
+
+    def test_serialise_data_fields(self):
+        fields = ActiveMQClient.serialise_data(1234567, 'WISH', '/archive/WISH00012345.nxs',
+                                               12345, -1)
+        self.assertEqual(fields, ReductionMessage.from_dict(fields).to_dict())
+
+    def test_optional_field(self):
+        self.assertIsNone(reduction_message(started_by=None).started_by)
+
+    def test_invalid_fields(self):
+        for fields in ({'instrument': None}, {'run_number': 1.5}, {'rb_number': True},
+                       {'data': ['/archive']}, {'started_by': {}}):
+            self.assertRaises(ValueError, reduction_message, **fields)
+
+    def test_from_dict(self):
+        fields = dict(reduction_message().to_dict(), reduction_script='ignored')
+        self.assertEqual(reduction_message(), ReductionMessage.from_dict(fields))
+
+    def test_from_dict_invalid(self):
+        fields = reduction_message().to_dict()
+        del fields['instrument']
+        self.assertRaises(ValueError, ReductionMessage.from_dict, fields)
+        self.assertRaises(ValueError, ReductionMessage.from_dict, [1, 2])
+
+
+class TestCodecs(unittest.TestCase):
+
+    def test_round_trip(self):
+        fields = reduction_message().to_dict()
+        for name, codec in available_codecs().items():
+            with self.subTest(codec=name):
+                self.assertEqual(fields, codec.decode(codec.encode(fields)))
+                self.assertEqual(fields,
+                                 codec_for(codec.content_type).decode(codec.encode(fields)))
+
+    def test_json_interoperable(self):
+        fields = reduction_message().to_dict()
+        for codec in available_codecs().values():
+            if codec.content_type == JsonCodec.content_type:
+                self.assertEqual(fields, json.loads(codec.encode(fields)))
+
+    def test_get_codec(self):
+        self.assertIs(JsonCodec, get_codec('json'))
+        self.assertRaises(ValueError, get_codec, 'yaml')
+
+    def test_codec_for(self):
+        self.assertIs(codec_for(None), codec_for('application/json;charset=utf-8'))
+        self.assertRaises(ValueError, codec_for, 'text/plain')
+        if 'msgpack' not in available_codecs():
+            self.assertRaises(ValueError, codec_for, MSGPACK)
+
+    def test_encode_message(self):
+        message = reduction_message()
+        body, content_type = encode_message(message, JsonCodec)
+        self.assertEqual('application/json', content_type)
+        self.assertEqual(message.to_dict(), json.loads(body))
+        self.assertEqual(('text', None), encode_message('text', JsonCodec))
+
+
+class TestDecodingListener(unittest.TestCase):
+
+    def test_decodes_message(self):
+        handler = Mock()
+        listener = DecodingListener(handler)
+        headers = {'content-type': 'application/json'}
+        listener.on_message(headers, JsonCodec.encode(reduction_message().to_dict()))
+        handler.assert_called_once_with(headers, reduction_message())
+
+    def test_decodes_dictionary(self):
+        handler = Mock()
+        DecodingListener(handler, message_type=None).on_message({}, '{"a":1}')
+        handler.assert_called_once_with({}, {'a': 1})
+
+    def test_invalid_message(self):
+        handler, on_invalid = Mock(), Mock()
+        listener = DecodingListener(handler, on_invalid=on_invalid)
+        listener.on_message({}, '{"instrument": "WISH"}')
+        listener.on_message({}, 'not json')
+        handler.assert_not_called()
+        self.assertEqual(2, on_invalid.call_count)
+        with self.assertLogs(level='ERROR'):
+            DecodingListener(handler).on_message({'message-id': '1'}, 'not json')
+
+
+class TestCodecStandIn(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = StompStandIn().start()
+        self.client = ActiveMQClient(stand_in_settings(self.broker))
+
+    def tearDown(self):
+        self.client.disconnect()
+        self.broker.stop()
+
+    def test_send_and_receive(self):
+        received = []
+        self.client.connect()
+        self.client.subscribe('/queue/DataReady',
+                              DecodingListener(lambda _, message: received.append(message)))
+        self.client.send('/queue/DataReady', reduction_message())
+        self.client.send_batch('/queue/DataReady', [reduction_message(run_number=12346)])
+        self.assertTrue(self.broker.wait_for(lambda: len(received) == 2))
+        self.assertEqual([reduction_message(), reduction_message(run_number=12346)], received)
+        content_types = [headers.get('content-type') for command, headers in self.broker.frames
+                         if command == 'SEND']
+        self.assertEqual(['application/json'] * 2, content_types)
+
+    def test_send_encoded_body_unchanged(self):
+        self.client.send('/queue/DataReady', 'message')
+        self.assertTrue(self.broker.wait_for(lambda: '/queue/DataReady' in self.broker.sent))
+        self.assertEqual([b'message'], self.broker.sent['/queue/DataReady'])
+        self.assertNotIn('content-type', [headers for command, headers in self.broker.frames
+                                          if command == 'SEND'][0])
@@ -0,0 +1,77 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test the connection state listener
+"""
+import threading
+import unittest
+
+from mock import Mock
+
+from src.activemq.connection_state import (CLOSED, CONNECTED, CONNECTING,
+                                           ConnectionStateListener, RECONNECTING)
+
+
+# pylint:disable=missing-docstring
+class TestConnectionStateListener(unittest.TestCase):
+
+    def setUp(self):
+        self.listener = ConnectionStateListener()
+
+    def test_initial_state(self):
+        self.assertEqual(CLOSED, self.listener.state)
+
+    def test_connect(self):
+        self.listener.on_connecting(('host', 61613))
+        self.assertEqual(CONNECTING, self.listener.state)
+        self.listener.on_connected({}, '')
+        self.assertEqual(CONNECTED, self.listener.state)
+
+    def test_connection_lost(self):
+        self.listener.on_connecting(('host', 61613))
+        self.listener.on_connected({}, '')
+        self.listener.on_disconnected()
+        self.assertEqual(RECONNECTING, self.listener.state)
+        self.listener.on_connecting(('host', 61613))
+        self.assertEqual(RECONNECTING, self.listener.state)
+        self.listener.on_connected({}, '')
+        self.assertEqual(CONNECTED, self.listener.state)
+
+    def test_on_lost_called_once(self):
+        on_lost = Mock()
+        self.listener = ConnectionStateListener(on_lost)
+        self.listener.on_connecting(('host', 61613))
+        self.listener.on_connected({}, '')
+        self.listener.on_heartbeat_timeout()
+        self.listener.on_disconnected()
+        on_lost.assert_called_once_with()
+        self.listener.closing()
+        self.listener.on_disconnected()
+        on_lost.assert_called_once_with()
+
+    def test_closing(self):
+        self.listener.on_connecting(('host', 61613))
+        self.listener.on_connected({}, '')
+        self.listener.closing()
+        self.listener.on_disconnected()
+        self.assertEqual(CLOSED, self.listener.state)
+
+    def test_wait_until_connected(self):
+        self.listener.on_connecting(('host', 61613))
+        timer = threading.Timer(0.01, self.listener.on_connected, ({}, ''))
+        timer.start()
+        self.assertTrue(self.listener.wait_until_connected(5))
+        timer.join()
+
+    def test_wait_until_connected_timeout(self):
+        self.listener.on_connecting(('host', 61613))
+        self.assertFalse(self.listener.wait_until_connected(0.01))
+
+    def test_wait_until_connected_error(self):
+        self.listener.on_connecting(('host', 61613))
+        self.listener.on_error({'message': 'Authentication failed'}, '')
+        self.assertFalse(self.listener.wait_until_connected(5))
+        self.assertEqual('Authentication failed', self.listener.error)
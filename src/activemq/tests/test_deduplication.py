@@ -0,0 +1,227 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for dropping duplicate messages
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock, patch
+
+from src.activemq import ActiveMQClient
+from src.activemq.deduplication import (DeduplicatingListener, Deduplicator, HANDLED,
+                                        IN_FLIGHT, message_id_key, run_key)
+from src.activemq.tests.stomp_stand_in import StompStandIn
+from src.activemq.tests.test_client import RecordingListener, stand_in_settings
+
+RUN = '{"rb_number": 1234567, "instrument": "WISH", "data": "/archive", "run_number": 12345}'
+
+
+def message(message_id):
+    """ :return: The headers of a message """
+    return {'message-id': message_id, 'subscription': '1'}
+
+
+def handle(deduplicator, headers, body=''):
+    """ Record a message as received and handled :return: The result of seen() """
+    duplicate = deduplicator.seen(headers, body)
+    if not duplicate:
+        deduplicator.done(headers, body)
+    return duplicate
+
+
+# pylint:disable=missing-docstring
+class TestDeduplicator(unittest.TestCase):
+
+    def test_keys(self):
+        self.assertEqual('ID:1', message_id_key(message('ID:1'), RUN))
+        self.assertEqual(('WISH', 12345, 1234567), run_key({}, RUN))
+        self.assertIsNone(run_key({}, 'not json'))
+        self.assertIsNone(run_key({}, '{"instrument": "WISH"}'))
+
+    def test_seen(self):
+        deduplicator = Deduplicator()
+        self.assertFalse(handle(deduplicator, message('ID:1')))
+        self.assertFalse(handle(deduplicator, message('ID:2')))
+        self.assertEqual(HANDLED, handle(deduplicator, message('ID:1')))
+        self.assertEqual(1, deduplicator.duplicates)
+        self.assertEqual(2, len(deduplicator))
+
+    def test_in_flight(self):
+        deduplicator = Deduplicator()
+        self.assertFalse(deduplicator.seen(message('ID:1'), ''))
+        self.assertEqual(IN_FLIGHT, deduplicator.seen(message('ID:1'), ''))
+        self.assertEqual(0, len(deduplicator))
+        deduplicator.done(message('ID:1'), '')
+        self.assertEqual(HANDLED, deduplicator.seen(message('ID:1'), ''))
+
+    def test_no_key_never_dropped(self):
+        deduplicator = Deduplicator(key=run_key)
+        self.assertFalse(deduplicator.seen({}, 'not json'))
+        self.assertFalse(deduplicator.seen({}, 'not json'))
+
+    def test_least_recently_seen_forgotten(self):
+        deduplicator = Deduplicator(max_size=2)
+        for message_id in ('ID:1', 'ID:2', 'ID:1', 'ID:3'):
+            handle(deduplicator, message(message_id))
+        self.assertEqual(2, len(deduplicator))
+        self.assertTrue(handle(deduplicator, message('ID:1')))
+        self.assertFalse(handle(deduplicator, message('ID:2')))
+
+    @patch('src.activemq.deduplication.time.time')
+    def test_expiry(self, mock_time):
+        mock_time.return_value = 1000.0
+        deduplicator = Deduplicator(ttl=60)
+        handle(deduplicator, message('ID:1'))
+        mock_time.return_value = 1059.0
+        self.assertTrue(handle(deduplicator, message('ID:1')))
+        mock_time.return_value = 1120.0
+        self.assertFalse(handle(deduplicator, message('ID:1')))
+
+    def test_forget(self):
+        deduplicator = Deduplicator()
+        handle(deduplicator, message('ID:1'))
+        deduplicator.forget(message('ID:1'), '')
+        self.assertFalse(deduplicator.seen(message('ID:1'), ''))
+        deduplicator.forget(message('ID:1'), '')
+        self.assertFalse(deduplicator.seen(message('ID:1'), ''))
+
+    def test_wrap(self):
+        handler = Mock(side_effect=[ValueError, None])
+        wrapped = Deduplicator().wrap(handler)
+        self.assertRaises(ValueError, wrapped, message('ID:1'), '')
+        wrapped(message('ID:1'), '')
+        wrapped(message('ID:1'), '')
+        self.assertEqual(2, handler.call_count)
+
+
+class TestDeduplicatorPersistence(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'seen.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_keys_persisted(self):
+        deduplicator = Deduplicator(key=run_key, path=self.path)
+        handle(deduplicator, {}, RUN)
+        deduplicator.close()
+        restarted = Deduplicator(key=run_key, path=self.path)
+        self.assertEqual(HANDLED, restarted.seen({}, RUN))
+        restarted.close()
+
+    def test_unhandled_message_handled_after_restart(self):
+        deduplicator = Deduplicator(path=self.path)
+        # The process stops while the listener is handling the message
+        self.assertFalse(deduplicator.seen(message('ID:1'), 'body'))
+        deduplicator.close()
+        restarted = Deduplicator(path=self.path)
+        listener, ack = Mock(), Mock()
+        DeduplicatingListener(listener, restarted, ack).on_message(message('ID:1'), 'body')
+        listener.on_message.assert_called_once_with(message('ID:1'), 'body')
+        ack.assert_not_called()
+        restarted.close()
+
+    def test_forgotten_and_expired_keys_not_loaded(self):
+        deduplicator = Deduplicator(path=self.path)
+        handle(deduplicator, message('ID:1'))
+        handle(deduplicator, message('ID:2'))
+        deduplicator.forget(message('ID:1'), '')
+        deduplicator.close()
+        with open(self.path, 'a') as keys:
+            keys.write('["ID:3", 0]\n["ID:4", ')
+        restarted = Deduplicator(path=self.path)
+        self.assertEqual(1, len(restarted))
+        self.assertTrue(restarted.seen(message('ID:2'), ''))
+        restarted.close()
+
+    def test_file_compacted(self):
+        deduplicator = Deduplicator(max_size=10, path=self.path)
+        for index in range(500):
+            handle(deduplicator, message('ID:{}'.format(index)))
+        deduplicator.close()
+        with open(self.path) as keys:
+            self.assertLess(len(keys.readlines()), 200)
+        restarted = Deduplicator(max_size=10, path=self.path)
+        self.assertEqual(10, len(restarted))
+        self.assertTrue(restarted.seen(message('ID:499'), ''))
+        restarted.close()
+
+
+class TestDeduplicatingListener(unittest.TestCase):
+
+    def test_duplicate_dropped_and_acknowledged(self):
+        listener, ack = Mock(), Mock()
+        deduplicating = DeduplicatingListener(listener, Deduplicator(), ack)
+        deduplicating.on_message(message('ID:1'), 'body')
+        deduplicating.on_message(message('ID:1'), 'body')
+        listener.on_message.assert_called_once_with(message('ID:1'), 'body')
+        ack.assert_called_once_with('ID:1', '1')
+
+    def test_duplicate_in_flight_not_acknowledged(self):
+        ack = Mock()
+        deduplicator = Deduplicator()
+        deduplicator.seen(message('ID:1'), 'body')
+        listener = Mock()
+        DeduplicatingListener(listener, deduplicator, ack).on_message(message('ID:1'), 'body')
+        listener.on_message.assert_not_called()
+        ack.assert_not_called()
+
+    def test_failed_message_forgotten(self):
+        listener = Mock()
+        listener.on_message.side_effect = [ValueError, None]
+        deduplicating = DeduplicatingListener(listener, Deduplicator())
+        self.assertRaises(ValueError, deduplicating.on_message, message('ID:1'), 'body')
+        deduplicating.on_message(message('ID:1'), 'body')
+        self.assertEqual(2, listener.on_message.call_count)
+
+    def test_events_forwarded(self):
+        listener = Mock()
+        DeduplicatingListener(listener, Deduplicator()).on_disconnected()
+        listener.on_disconnected.assert_called_once_with()
+
+
+class TestDeduplicationStandIn(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = StompStandIn().start()
+        self.client = ActiveMQClient(stand_in_settings(self.broker))
+        self.client.connect()
+
+    def tearDown(self):
+        self.client.disconnect()
+        self.broker.stop()
+
+    def test_same_run_sent_twice(self):
+        listener = RecordingListener()
+        deduplicator = Deduplicator(key=run_key)
+        self.client.subscribe('/queue/DataReady', listener, deduplicator=deduplicator)
+        self.client.send('/queue/DataReady', RUN)
+        self.client.send('/queue/DataReady', RUN)
+        self.client.send('/queue/DataReady', RUN.replace('12345', '12346'))
+        self.assertTrue(self.broker.wait_for(
+            lambda: deduplicator.duplicates == 1 and len(listener.received) == 2))
+        self.assertEqual(['ID:stand-in-1', 'ID:stand-in-3'],
+                         [headers['message-id'] for headers in listener.received])
+
+    def test_redelivery_after_reconnect_dropped(self):
+        listener = RecordingListener()
+        deduplicator = Deduplicator()
+        self.client.subscribe('/queue/DataReady', listener, ack='client-individual',
+                              deduplicator=deduplicator)
+        self.client.send('/queue/DataReady', RUN)
+        self.assertTrue(self.broker.wait_for(lambda: len(listener.received) == 1))
+        for session in list(self.broker.sessions):
+            self.broker.drop(session)
+        # The message is redelivered once the client has resubscribed, then acknowledged
+        self.assertTrue(self.broker.wait_for(lambda: deduplicator.duplicates == 1 and
+                                             self.broker.acks == 1))
+        self.assertEqual(1, len(listener.received))
+        self.assertEqual([], self.broker.queues['/queue/DataReady'])
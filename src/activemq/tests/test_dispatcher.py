@@ -0,0 +1,193 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for the concurrent dispatcher
+"""
+import json
+import threading
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from mock import patch
+
+from src.activemq import ActiveMQClient
+from src.activemq.dispatcher import ConcurrentDispatcher, instrument_key
+from src.activemq.tests.stomp_stand_in import StompStandIn
+from src.activemq.tests.test_client import FakeMsgpack, stand_in_settings
+
+
+def headers_for(index):
+    """ :return: The headers of a message delivered to subscription 1 """
+    return {'message-id': str(index), 'subscription': '1'}
+
+
+def record_nothing(headers, body):
+    """ Picklable handler for the process pool test """
+    return headers, body
+
+
+# pylint:disable=missing-docstring,protected-access
+class TestConcurrentDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.acks = []
+        self.nacks = []
+        self.dispatcher = None
+
+    def tearDown(self):
+        if self.dispatcher is not None:
+            self.dispatcher.close(timeout=5)
+
+    def ack(self, message_id, subscription):
+        self.acks.append((message_id, subscription))
+
+    def nack(self, message_id, subscription):
+        self.nacks.append((message_id, subscription))
+
+    def test_instrument_key(self):
+        self.assertEqual('WISH', instrument_key({}, json.dumps({'instrument': 'WISH'})))
+        self.assertIsNone(instrument_key({}, 'not json'))
+        self.assertIsNone(instrument_key({}, '[1, 2]'))
+
+    @patch('src.activemq.codec.msgpack', FakeMsgpack)
+    def test_instrument_key_of_binary_message(self):
+        self.assertEqual('WISH', instrument_key({'content-type': 'application/msgpack'},
+                                                FakeMsgpack.packb({'instrument': 'WISH'})))
+        self.assertIsNone(instrument_key({'content-type': 'text/plain'}, 'WISH'))
+
+    def test_slow_message_does_not_block_others(self):
+        release = threading.Event()
+        handled = []
+
+        def handler(headers, body):
+            if body == 'slow':
+                release.wait(5)
+            handled.append(body)
+
+        self.dispatcher = ConcurrentDispatcher(handler, ack=self.ack, workers=2)
+        self.dispatcher.on_message(headers_for(0), 'slow')
+        self.dispatcher.on_message(headers_for(1), 'fast')
+        self.assertTrue(self.wait_for(lambda: handled == ['fast']))
+        self.assertEqual([('1', '1')], self.acks)
+        release.set()
+        self.assertTrue(self.dispatcher.wait_until_idle(5))
+        self.assertEqual(['fast', 'slow'], handled)
+
+    def test_ordered_per_key(self):
+        handled = []
+        lock = threading.Lock()
+
+        def handler(_, body):
+            with lock:
+                handled.append(json.loads(body))
+
+        self.dispatcher = ConcurrentDispatcher(handler, workers=4, key=instrument_key)
+        for index in range(200):
+            body = json.dumps({'instrument': 'INST{}'.format(index % 3), 'index': index})
+            self.dispatcher.on_message(headers_for(index), body)
+        self.assertTrue(self.dispatcher.wait_until_idle(5))
+        self.assertEqual(200, len(handled))
+        for instrument in ('INST0', 'INST1', 'INST2'):
+            indices = [message['index'] for message in handled
+                       if message['instrument'] == instrument]
+            self.assertEqual(sorted(indices), indices)
+
+    def test_failed_messages_rejected(self):
+        def handler(_, body):
+            if body == 'bad':
+                raise ValueError(body)
+
+        self.dispatcher = ConcurrentDispatcher(handler, ack=self.ack, nack=self.nack)
+        with self.assertLogs(level='ERROR'):
+            self.dispatcher.on_message(headers_for(0), 'bad')
+            self.dispatcher.on_message(headers_for(1), 'good')
+            self.assertTrue(self.dispatcher.wait_until_idle(5))
+        self.assertEqual([('0', '1')], self.nacks)
+        self.assertEqual([('1', '1')], self.acks)
+        snapshot = self.dispatcher.snapshot()
+        self.assertEqual(1, snapshot['handled'])
+        self.assertEqual(1, snapshot['failed'])
+
+    def test_receiver_blocked_when_saturated(self):
+        release = threading.Event()
+        self.dispatcher = ConcurrentDispatcher(lambda *_: release.wait(5), workers=1,
+                                               max_pending=2)
+        self.dispatcher.on_message(headers_for(0), 'a')
+        self.dispatcher.on_message(headers_for(1), 'b')
+        receiver = threading.Thread(target=self.dispatcher.on_message,
+                                    args=(headers_for(2), 'c'))
+        receiver.start()
+        receiver.join(0.05)
+        self.assertTrue(receiver.is_alive())
+        self.assertEqual(2, self.dispatcher.pending())
+        release.set()
+        receiver.join(5)
+        self.assertTrue(self.dispatcher.wait_until_idle(5))
+        snapshot = self.dispatcher.snapshot()
+        self.assertEqual(1, snapshot['saturated'])
+        self.assertEqual(2, snapshot['max_pending'])
+        self.assertEqual(3, snapshot['handler_latency']['count'])
+
+    def test_disconnect_drops_waiting_messages(self):
+        release = threading.Event()
+        handled = []
+
+        def handler(_, body):
+            release.wait(5)
+            handled.append(body)
+
+        self.dispatcher = ConcurrentDispatcher(handler, ack=self.ack, key=lambda *_: 'key')
+        self.dispatcher.on_message(headers_for(0), 'a')
+        self.dispatcher.on_message(headers_for(1), 'b')
+        self.dispatcher.on_disconnected()
+        self.assertEqual(1, self.dispatcher.pending())
+        release.set()
+        self.assertTrue(self.dispatcher.wait_until_idle(5))
+        self.assertEqual(['a'], handled)
+        self.assertEqual([], self.acks)
+
+    def test_process_pool(self):
+        with ProcessPoolExecutor(2) as executor:
+            self.dispatcher = ConcurrentDispatcher(record_nothing, ack=self.ack,
+                                                   executor=executor)
+            for index in range(5):
+                self.dispatcher.on_message(headers_for(index), 'body')
+            self.assertTrue(self.dispatcher.wait_until_idle(30))
+        self.assertEqual(5, len(self.acks))
+
+    def wait_for(self, predicate, timeout=5):
+        with self.dispatcher._condition:
+            return self.dispatcher._condition.wait_for(predicate, timeout)
+
+
+# pylint:disable=missing-docstring
+class TestConcurrentDispatcherStandIn(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = StompStandIn().start()
+        self.client = ActiveMQClient(stand_in_settings(self.broker, prefetch_size=4))
+        self.client.connect()
+
+    def tearDown(self):
+        self.client.disconnect()
+        self.broker.stop()
+
+    def test_acknowledges_handled_messages(self):
+        handled = []
+        lock = threading.Lock()
+
+        def handler(_, body):
+            with lock:
+                handled.append(body)
+
+        dispatcher = ConcurrentDispatcher(handler, ack=self.client.ack, workers=4)
+        self.client.subscribe_queues(['/queue/DataReady'], 'consumer', dispatcher,
+                                     ack='client-individual')
+        for index in range(20):
+            self.client.send('/queue/DataReady', str(index))
+        self.assertTrue(self.broker.wait_for(lambda: self.broker.acks == 20))
+        dispatcher.close(timeout=5)
+        self.assertEqual(20, len(handled))
@@ -0,0 +1,44 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for encoding and parsing STOMP frames
+"""
+import unittest
+
+from src.activemq.frames import encode_frame, Frame, parse_frames
+
+
+# pylint:disable=missing-docstring
+class TestFrames(unittest.TestCase):
+
+    def test_round_trip(self):
+        buffer = bytearray(encode_frame('SEND', {'destination': '/queue/a:b\n'}, 'body\x00'))
+        self.assertEqual([Frame('SEND', {'destination': '/queue/a:b\n',
+                                         'content-length': '5'}, b'body\x00')],
+                         parse_frames(buffer))
+        self.assertEqual(bytearray(), buffer)
+
+    def test_connect_headers_not_escaped(self):
+        frame = encode_frame('CONNECT', {'passcode': 'a:b'})
+        self.assertIn(b'passcode:a:b\n', frame)
+        self.assertEqual({'passcode': 'a:b'}, parse_frames(bytearray(frame))[0].headers)
+
+    def test_partial_frames_left_in_buffer(self):
+        frame = encode_frame('MESSAGE', {'message-id': '1'}, 'body')
+        buffer = bytearray(frame[:-3])
+        self.assertEqual([], parse_frames(buffer))
+        buffer.extend(frame[-3:] + b'\nMESSAGE\n')
+        frames = parse_frames(buffer)
+        self.assertEqual(['MESSAGE', None], [frame.command for frame in frames])
+        self.assertEqual(bytearray(b'MESSAGE\n'), buffer)
+
+    def test_body_without_content_length(self):
+        buffer = bytearray(b'MESSAGE\nmessage-id:1\n\nbody\x00')
+        self.assertEqual(b'body', parse_frames(buffer)[0].body)
+
+    def test_repeated_header_uses_first(self):
+        buffer = bytearray(b'MESSAGE\nkey:first\nkey:second\n\n\x00')
+        self.assertEqual({'key': 'first'}, parse_frames(buffer)[0].headers)
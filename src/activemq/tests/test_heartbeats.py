@@ -0,0 +1,78 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for the STOMP heartbeat monitor
+"""
+import threading
+import time
+import unittest
+
+from mock import Mock
+from stomp.utils import Frame
+
+from src.activemq.heartbeats import HeartbeatMonitor, negotiate
+
+
+# pylint:disable=missing-docstring
+class TestHeartbeatMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.send_heartbeat = Mock()
+        self.missed = threading.Event()
+        self.monitor = HeartbeatMonitor(self.send_heartbeat, self.missed.set, interval=0.02)
+
+    def tearDown(self):
+        self.monitor.stop()
+
+    def test_negotiate(self):
+        self.assertEqual((0.05, 0.02), negotiate(20, '20,50'))
+        self.assertEqual((0.0, 0.02), negotiate(20, '10,0'))
+        self.assertEqual((0.0, 0.0), negotiate(0, '20,20'))
+
+    def test_connect_asks_for_heartbeats(self):
+        frame = Frame('CONNECT', {})
+        self.monitor.on_send(frame)
+        self.assertEqual('20,20', frame.headers['heart-beat'])
+
+    def test_missed_heartbeats(self):
+        self.monitor.on_connected({'heart-beat': '20,0'}, '')
+        self.assertTrue(self.missed.wait(1))
+        self.assertEqual(1, self.monitor.timeouts)
+
+    def test_heartbeats_received(self):
+        self.monitor.on_connected({'heart-beat': '20,0'}, '')
+        for _ in range(10):
+            time.sleep(0.01)
+            self.monitor.on_heartbeat()
+        self.assertFalse(self.missed.is_set())
+        self.assertEqual(0, self.monitor.timeouts)
+
+    def test_dispatching_not_treated_as_missed(self):
+        self.monitor.on_connected({'heart-beat': '20,0'}, '')
+        listener = Mock()
+        listener.on_message.side_effect = lambda headers, body: time.sleep(0.2)
+        self.monitor.tracking(listener).on_message({}, 'body')
+        listener.on_message.assert_called_once_with({}, 'body')
+        self.assertFalse(self.missed.is_set())
+        # The broker must send something within the tolerance once the listener returns
+        self.assertTrue(self.missed.wait(1))
+
+    def test_heartbeats_sent_while_idle(self):
+        self.monitor.on_connected({'heart-beat': '0,20'}, '')
+        time.sleep(0.1)
+        self.assertGreater(self.send_heartbeat.call_count, 1)
+        self.assertFalse(self.missed.is_set())
+
+    def test_disconnected_stops_monitoring(self):
+        self.monitor.on_connected({'heart-beat': '20,20'}, '')
+        self.monitor.on_disconnected()
+        time.sleep(0.1)
+        self.assertFalse(self.missed.is_set())
+        self.send_heartbeat.assert_not_called()
+
+    def test_broker_without_heartbeats(self):
+        self.monitor.on_connected({}, '')
+        self.assertEqual((0.0, 0.0), (self.monitor.send_interval, self.monitor.receive_interval))
@@ -0,0 +1,136 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for the producer connection pool
+"""
+import threading
+import time
+import unittest
+
+from src.activemq.connection_state import CONNECTED
+from src.activemq.producer_pool import ProducerPool
+from src.activemq.tests.stomp_stand_in import StompStandIn
+from src.activemq.tests.test_client import stand_in_settings
+from src.connection_exception import ConnectionException
+
+
+# pylint:disable=missing-docstring,protected-access
+class TestProducerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = StompStandIn().start()
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool is not None:
+            self.pool.close()
+        self.broker.stop()
+
+    def create_pool(self, **kwargs):
+        self.pool = ProducerPool(stand_in_settings(self.broker), **kwargs)
+        return self.pool
+
+    def connects(self):
+        return len([command for command, _ in self.broker.frames
+                    if command in ('CONNECT', 'STOMP')])
+
+    def test_connection_reused(self):
+        self.create_pool()
+        for index in range(10):
+            self.pool.send('/queue/Status', str(index))
+        self.assertTrue(self.broker.wait_for(
+            lambda: len(self.broker.sent.get('/queue/Status', [])) == 10))
+        self.assertEqual(1, self.connects())
+        snapshot = self.pool.snapshot()
+        self.assertEqual(1, snapshot['created'])
+        self.assertEqual(1, snapshot['idle'])
+        self.assertEqual(10, snapshot['checkout_wait']['count'])
+
+    def test_concurrent_senders_bounded(self):
+        self.create_pool(max_connections=2)
+
+        def publish():
+            for index in range(20):
+                self.pool.send('/queue/Status', str(index))
+
+        threads = [threading.Thread(target=publish) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertTrue(self.broker.wait_for(
+            lambda: len(self.broker.sent.get('/queue/Status', [])) == 160))
+        self.assertLessEqual(self.pool.snapshot()['created'], 2)
+
+    def test_lost_connection_evicted(self):
+        self.create_pool()
+        self.pool.send('/queue/Status', 'first')
+        self.assertTrue(self.broker.wait_for(lambda: '/queue/Status' in self.broker.sent))
+        producer = self.pool._idle[0]
+        for session in list(self.broker.sessions):
+            self.broker.drop(session)
+        self.assertTrue(self.broker.wait_for(lambda: producer.state.state != CONNECTED))
+        self.pool.send('/queue/Status', 'second')
+        self.assertTrue(self.broker.wait_for(
+            lambda: self.broker.sent['/queue/Status'] == [b'first', b'second']))
+        snapshot = self.pool.snapshot()
+        self.assertEqual(1, snapshot['evicted'])
+        self.assertEqual(2, snapshot['created'])
+
+    def test_idle_connection_evicted(self):
+        self.create_pool(idle_timeout=0.01)
+        self.pool.send('/queue/Status', 'first')
+        time.sleep(0.02)
+        self.pool.send('/queue/Status', 'second')
+        self.assertEqual(1, self.pool.snapshot()['evicted'])
+        self.assertEqual(1, self.pool.snapshot()['size'])
+
+    def test_checkout_timeout(self):
+        self.create_pool(max_connections=1, checkout_timeout=0.05)
+        with self.pool.connection():
+            errors = []
+            thread = threading.Thread(target=lambda: errors.append(
+                self.assertRaises(ConnectionException, self.pool.send, '/queue/Status', 'x')))
+            with self.assertLogs(level='ERROR'):
+                thread.start()
+                thread.join(5)
+        self.assertEqual(1, len(errors))
+
+    def test_failed_connection_discarded(self):
+        self.create_pool()
+        with self.assertRaises(ValueError):
+            with self.pool.connection():
+                raise ValueError("failed")
+        snapshot = self.pool.snapshot()
+        self.assertEqual(1, snapshot['failed'])
+        self.assertEqual(0, snapshot['size'])
+
+    def test_close(self):
+        self.create_pool()
+        self.pool.send('/queue/Status', 'message')
+        self.pool.close()
+        self.assertEqual(0, self.pool.snapshot()['size'])
+        self.assertRaises(RuntimeError, self.pool.send, '/queue/Status', 'message')
+        self.pool = None
+
+    def test_balance_brokers(self):
+        with StompStandIn() as other:
+            self.pool = ProducerPool(stand_in_settings(self.broker, broker_hosts=[
+                '{}:{}'.format(other.host, other.port)]), balance_brokers=True)
+            with self.pool.connection() as first, self.pool.connection() as second:
+                first.send('/queue/Status', 'first')
+                second.send('/queue/Status', 'second')
+            self.assertTrue(self.broker.wait_for(lambda: '/queue/Status' in self.broker.sent))
+            self.assertTrue(other.wait_for(lambda: '/queue/Status' in other.sent))
+
+    def test_unavailable_broker_skipped(self):
+        stopped = StompStandIn().start()
+        stopped.stop()
+        self.pool = ProducerPool(stand_in_settings(stopped, broker_hosts=[
+            '{}:{}'.format(self.broker.host, self.broker.port)]))
+        self.pool.send('/queue/Status', 'message')
+        self.assertTrue(self.broker.wait_for(lambda: '/queue/Status' in self.broker.sent))
+        self.assertEqual(1, self.pool.snapshot()['created'])
@@ -0,0 +1,41 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for the receipt listener
+"""
+import threading
+import unittest
+
+from src.activemq.receipts import ReceiptListener
+
+
+# pylint:disable=missing-docstring
+class TestReceiptListener(unittest.TestCase):
+
+    def setUp(self):
+        self.listener = ReceiptListener()
+
+    def test_receipt_ids_unique(self):
+        self.assertNotEqual(self.listener.new_receipt(), self.listener.new_receipt())
+
+    def test_wait_for_receipt(self):
+        receipt = self.listener.new_receipt()
+        threading.Timer(0.01, self.listener.on_receipt, ({'receipt-id': receipt}, '')).start()
+        self.assertIsNone(self.listener.wait(receipt, 5))
+
+    def test_wait_timeout(self):
+        receipt = self.listener.new_receipt()
+        self.assertEqual('No receipt within 0.01s', self.listener.wait(receipt, 0.01))
+
+    def test_error_instead_of_receipt(self):
+        receipt = self.listener.new_receipt()
+        self.listener.on_error({'receipt-id': receipt, 'message': 'Commit rejected'}, '')
+        self.assertEqual('Commit rejected', self.listener.wait(receipt, 5))
+
+    def test_connection_lost(self):
+        receipt = self.listener.new_receipt()
+        self.listener.on_disconnected()
+        self.assertEqual('Connection lost', self.listener.wait(receipt, 5))
@@ -0,0 +1,37 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test the ActiveMQ settings
+"""
+import unittest
+
+from src.activemq import ActiveMQSettings
+
+
+# pylint:disable=missing-docstring
+class TestActiveMQSettings(unittest.TestCase):
+
+    @staticmethod
+    def settings(**kwargs):
+        return ActiveMQSettings(username='user', password='pass', **kwargs)
+
+    def test_get_brokers(self):
+        settings = self.settings(host='primary', port='61613',
+                                 broker_hosts=['backup:61614', '10.0.0.1:61615'])
+        self.assertEqual([('primary', 61613), ('backup', 61614), ('10.0.0.1', 61615)],
+                         settings.get_brokers())
+
+    def test_get_brokers_invalid(self):
+        settings = self.settings(host='primary', port='61613', broker_hosts=['backup'])
+        self.assertRaises(ValueError, settings.get_brokers)
+
+    def test_get_reconnect_delay(self):
+        settings = self.settings(host='primary', port='61613', reconnect_initial_delay=0.1,
+                                 reconnect_max_delay=1.0)
+        for attempt in range(10):
+            delay = settings.get_reconnect_delay(attempt)
+            self.assertGreaterEqual(delay, 0.0)
+            self.assertLessEqual(delay, min(1.0, 0.1 * 2 ** attempt))
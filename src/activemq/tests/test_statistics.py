@@ -0,0 +1,125 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for the message statistics
+"""
+import unittest
+
+from mock import Mock
+
+from src.activemq import ActiveMQClient
+from src.activemq.statistics import (InstrumentedListener, MessageStatistics,
+                                     prometheus_counters, receive_lag, SENT_HEADER)
+from src.activemq.tests.stomp_stand_in import StompStandIn
+from src.activemq.tests.test_client import RecordingListener, stand_in_settings
+
+
+# pylint:disable=missing-docstring,protected-access
+class TestMessageStatistics(unittest.TestCase):
+
+    def setUp(self):
+        self.statistics = MessageStatistics()
+
+    def test_receive_lag(self):
+        self.assertEqual(2.5, receive_lag({SENT_HEADER: '1000000'}, 1002.5))
+        self.assertEqual(1.0, receive_lag({'timestamp': '1000000'}, 1001.0))
+        self.assertEqual(0.0, receive_lag({SENT_HEADER: '1000000'}, 999.0))
+        self.assertIsNone(receive_lag({}, 1000.0))
+        self.assertIsNone(receive_lag({SENT_HEADER: 'invalid'}, 1000.0))
+
+    def test_snapshot(self):
+        self.statistics.record_sent('/queue/DataReady', 3)
+        self.statistics.record_received('/queue/DataReady', 2.0, 0.01)
+        self.statistics.record_received('/queue/DataReady', None, 0.02, failed=True)
+        record = self.statistics.snapshot()['destinations']['/queue/DataReady']
+        self.assertEqual(3, record['sent'])
+        self.assertEqual(2, record['received'])
+        self.assertEqual(1, record['failed'])
+        self.assertEqual(1, record['receive_lag']['count'])
+        self.assertEqual(2.0, record['receive_lag']['max'])
+        self.assertEqual(2, record['handler_latency']['count'])
+        self.assertGreater(record['received_per_second'], 0)
+
+    def test_reset(self):
+        self.statistics.record_sent('/queue/DataReady')
+        self.statistics.reset()
+        self.assertEqual({}, self.statistics.snapshot()['destinations'])
+
+    def test_prometheus(self):
+        self.statistics.record_sent('/queue/DataReady')
+        self.statistics.record_received('/queue/Data"Ready', 2.0, 0.01)
+        lines = self.statistics.prometheus().splitlines()
+        self.assertIn('# TYPE activemq_messages_sent_total counter', lines)
+        self.assertIn('activemq_messages_sent_total{destination="/queue/DataReady"} 1', lines)
+        self.assertIn('activemq_receive_lag_seconds_bucket{destination="/queue/Data\\"Ready",'
+                      'le="5.0"} 1', lines)
+        self.assertIn('activemq_handler_seconds_count{destination="/queue/Data\\"Ready"} 1',
+                      lines)
+        self.assertIn('activemq_handler_seconds_bucket{destination="/queue/Data\\"Ready",'
+                      'le="+Inf"} 1', lines)
+
+    def test_prometheus_counters(self):
+        self.assertEqual('# HELP outages_total Outages\n# TYPE outages_total counter\n'
+                         'outages_total 2\n',
+                         prometheus_counters([('outages_total', 'Outages', 2)]))
+
+
+class TestInstrumentedListener(unittest.TestCase):
+
+    def test_records_message(self):
+        statistics = MessageStatistics()
+        listener = Mock()
+        InstrumentedListener(listener, statistics, '/queue/DataReady').on_message({}, 'body')
+        listener.on_message.assert_called_once_with({}, 'body')
+        self.assertEqual(1, statistics.snapshot()['destinations']['/queue/DataReady']
+                         ['received'])
+
+    def test_records_failure(self):
+        statistics = MessageStatistics()
+        listener = Mock()
+        listener.on_message.side_effect = ValueError
+        instrumented = InstrumentedListener(listener, statistics, '/queue/DataReady')
+        self.assertRaises(ValueError, instrumented.on_message, {}, 'body')
+        self.assertEqual(1, statistics.snapshot()['destinations']['/queue/DataReady']['failed'])
+
+
+class TestStatisticsStandIn(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = StompStandIn().start()
+        self.client = None
+
+    def tearDown(self):
+        self.client.disconnect()
+        self.broker.stop()
+
+    def test_disabled(self):
+        self.client = ActiveMQClient(stand_in_settings(self.broker))
+        self.client.connect()
+        listener = RecordingListener()
+        self.client.subscribe('/queue/DataReady', listener)
+        self.assertIs(listener, self.client._router.listeners()[0])
+        self.assertIsNone(self.client.get_stats())
+        self.assertIsNone(self.client.get_prometheus_stats())
+
+    def test_send_and_receive(self):
+        self.client = ActiveMQClient(stand_in_settings(self.broker, record_statistics=True))
+        self.client.connect()
+        listener = RecordingListener()
+        self.client.subscribe('/queue/DataReady', listener)
+        self.client.send('/queue/DataReady', 'message')
+        self.client.send_batch('/queue/DataReady', ['a', 'b'])
+        self.assertTrue(self.broker.wait_for(lambda: len(listener.received) == 3))
+        self.assertTrue(all(SENT_HEADER in headers for headers in listener.received))
+        record = self.client.get_stats()['destinations']['/queue/DataReady']
+        self.assertEqual(3, record['sent'])
+        self.assertEqual(3, record['received'])
+        self.assertEqual(3, record['receive_lag']['count'])
+        self.assertLess(record['receive_lag']['max'], 1.0)
+        prometheus = self.client.get_prometheus_stats()
+        self.assertIn('activemq_messages_received_total{destination="/queue/DataReady"} 3',
+                      prometheus)
+        self.assertIn('activemq_connection_outages_total 0', prometheus)
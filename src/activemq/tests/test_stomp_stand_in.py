@@ -0,0 +1,51 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for the heartbeats of the STOMP broker stand-in
+"""
+import socket
+import time
+import unittest
+
+from src.activemq.frames import encode_frame, HEARTBEAT
+from src.activemq.tests.stomp_stand_in import StompStandIn
+
+
+# pylint:disable=missing-docstring
+class TestStompStandInHeartbeats(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = StompStandIn(heartbeat=0.05).start()
+        self.connection = socket.create_connection((self.broker.host, self.broker.port))
+
+    def tearDown(self):
+        self.connection.close()
+        self.broker.stop()
+
+    def connect(self, heart_beat):
+        self.connection.sendall(encode_frame('CONNECT', {'accept-version': '1.1',
+                                                         'heart-beat': heart_beat}))
+        self.assertTrue(self.broker.wait_for(lambda: any(
+            session.connected for session in self.broker.sessions)))
+
+    def test_silent_client_disconnected(self):
+        self.connect('50,0')
+        self.assertTrue(self.broker.wait_for(lambda: self.broker.heartbeat_timeouts == 1))
+        self.assertTrue(self.broker.wait_for(lambda: not self.broker.sessions))
+
+    def test_client_heartbeats_keep_connection_open(self):
+        self.connect('50,0')
+        for _ in range(10):
+            time.sleep(0.01)
+            self.connection.sendall(HEARTBEAT)
+        self.assertEqual(0, self.broker.heartbeat_timeouts)
+        self.assertEqual(1, len(self.broker.sessions))
+
+    def test_client_without_heartbeats_not_checked(self):
+        self.connect('0,0')
+        time.sleep(0.1)
+        self.assertEqual(0, self.broker.heartbeat_timeouts)
+        self.assertEqual(1, len(self.broker.sessions))
@@ -0,0 +1,48 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for the subscription router
+"""
+import unittest
+
+from mock import Mock
+
+from src.activemq.subscriptions import SubscriptionRouter
+
+
+# pylint:disable=missing-docstring
+class TestSubscriptionRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.router = SubscriptionRouter()
+        self.first, self.second = Mock(), Mock()
+        self.router.add('1', self.first)
+        self.router.add('2', self.first)
+        self.router.add('3', self.second)
+        self.router.add('4', None)
+
+    def test_message_routed_by_subscription(self):
+        self.router.on_message({'subscription': '3'}, 'body')
+        self.router.on_message({'subscription': '4'}, 'body')
+        self.router.on_message({'subscription': '5'}, 'body')
+        self.first.on_message.assert_not_called()
+        self.second.on_message.assert_called_once_with({'subscription': '3'}, 'body')
+
+    def test_events_sent_to_each_listener_once(self):
+        self.router.on_disconnected()
+        self.router.on_error({'message': 'error'}, '')
+        self.first.on_disconnected.assert_called_once_with()
+        self.second.on_disconnected.assert_called_once_with()
+        self.first.on_error.assert_called_once_with({'message': 'error'}, '')
+
+    def test_remove(self):
+        self.router.remove('3')
+        self.router.on_message({'subscription': '3'}, 'body')
+        self.router.on_disconnected()
+        self.second.on_message.assert_not_called()
+        self.second.on_disconnected.assert_not_called()
+        self.router.clear()
+        self.assertEqual([], self.router.listeners())
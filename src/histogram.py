@@ -0,0 +1,53 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Fixed bucket histogram used by clients to record latencies
+"""
+from bisect import bisect_left
+
+# Upper bounds in seconds of the latency buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Count of observed values in fixed buckets along with their count, sum and maximum.
+    This is not thread safe so callers must hold a lock when sharing an instance.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, value):
+        """
+        Record a value in the histogram
+        :param value: The value to record
+        """
+        # The first bucket whose upper bound is at least the value, or the +Inf bucket
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+    def snapshot(self):
+        """
+        :return: dictionary of the count, sum, maximum and the cumulative count of values
+                 less than or equal to each bucket upper bound (as used by Prometheus)
+        """
+        cumulative = []
+        running = 0
+        for upper_bound, bucket_count in zip(list(self.buckets) + ['+Inf'], self.bucket_counts):
+            running += bucket_count
+            cumulative.append((upper_bound, running))
+        return {'count': self.count,
+                'sum': self.total,
+                'max': self.maximum,
+                'buckets': cumulative}
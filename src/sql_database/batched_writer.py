@@ -0,0 +1,147 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Write-behind queue that coalesces single row updates into one transaction
+"""
+import logging
+import threading
+import time
+
+from sqlalchemy import bindparam
+
+
+class BatchedWriter:
+    """
+    Queues single row updates and writes them in one transaction when max_items updates are
+    queued or max_delay seconds have passed since the oldest was queued, whichever is first.
+    Updates to the same row within a batch are merged. Each update's callback is called with
+    None once the transaction has committed or with the exception if it failed.
+    """
+
+    def __init__(self, engine, max_items=100, max_delay=0.05):
+        """
+        :param engine: The engine to write to
+        :param max_items: The number of queued updates that triggers a write
+        :param max_delay: The maximum seconds an update is queued for before it is written
+        """
+        self._engine = engine
+        self._max_items = max_items
+        self._max_delay = max_delay
+        self._pending = []
+        self._oldest = None
+        self._closed = False
+        self._condition = threading.Condition()
+        # Held while writing so that batches are committed in the order they were queued
+        self._write_lock = threading.RLock()
+        self.commits = 0
+        self._thread = threading.Thread(target=self._run, name='BatchedWriter', daemon=True)
+        self._thread.start()
+
+    def update(self, table, row_id, values, callback=None):
+        """
+        Queue an update of a single row
+        :param table: The Table or declarative class of the row
+        :param row_id: The primary key of the row
+        :param values: dictionary of column names to new values
+        :param callback: Optional function called with None after the update is committed
+                         or with the exception raised if it could not be written
+        """
+        table = getattr(table, '__table__', table)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Updates can not be queued after the writer is closed")
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((table, row_id, dict(values), callback))
+            if len(self._pending) >= self._max_items or len(self._pending) == 1:
+                self._condition.notify()
+
+    def flush(self):
+        """
+        Write all queued updates now
+        """
+        with self._write_lock:
+            with self._condition:
+                batch = self._take_batch()
+            self._write(batch)
+
+    def close(self):
+        """
+        Write all queued updates and stop the background thread
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+
+    def pending(self):
+        """ :return: The number of updates waiting to be written """
+        with self._condition:
+            return len(self._pending)
+
+    def _take_batch(self):
+        """ Remove and return the queued updates. The condition must be held. """
+        batch, self._pending, self._oldest = self._pending, [], None
+        return batch
+
+    def _run(self):
+        """ Write batches as they become due until the writer is closed """
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if len(self._pending) >= self._max_items:
+                        break
+                    if self._pending:
+                        remaining = self._oldest + self._max_delay - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                if self._closed:
+                    return
+            self.flush()
+
+    def _write(self, batch):
+        """
+        Write a batch of updates in one transaction and call their callbacks
+        """
+        if not batch:
+            return
+        # Merge updates to the same row then group rows by the columns they update so each
+        # group is written with a single executemany
+        rows = {}
+        for table, row_id, values, _ in batch:
+            rows.setdefault((table, row_id), {}).update(values)
+        groups = {}
+        for (table, row_id), values in rows.items():
+            parameters = {'new_' + column: value for column, value in values.items()}
+            parameters['row_id'] = row_id
+            groups.setdefault((table, tuple(sorted(values))), []).append(parameters)
+        try:
+            with self._engine.begin() as connection:
+                for (table, columns), parameters in groups.items():
+                    primary_key = list(table.primary_key.columns)[0]
+                    statement = table.update() \
+                        .where(primary_key == bindparam('row_id')) \
+                        .values({column: bindparam('new_' + column) for column in columns})
+                    connection.execute(statement, parameters)
+            self.commits += 1
+            error = None
+        # pylint:disable=broad-except
+        except Exception as exp:
+            logging.error("Unable to write %s batched updates: %s", len(batch), exp)
+            error = exp
+        for _, row_id, _, callback in batch:
+            if callback is None:
+                continue
+            try:
+                callback(error)
+            # pylint:disable=broad-except
+            except Exception as exp:
+                # One failing callback must not stop the others or the background thread
+                logging.error("Callback for the update of row %s failed: %s", row_id, exp)
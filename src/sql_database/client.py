@@ -6,17 +6,70 @@
 """
 Creates a database session for the reduction database
 """
+import logging
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy.dialects import mysql
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine, MetaData, Table
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy import bindparam, create_engine, MetaData, select, Table
+from sqlalchemy.orm import (joinedload, scoped_session, selectinload, sessionmaker,
+                            relationship, Query)
+from sqlalchemy.pool import QueuePool
 
 from src.abstract_client import AbstractClient
 from src.connection_exception import ConnectionException
+from src.sql_database.batched_writer import BatchedWriter
+from src.sql_database.lookup_cache import LookupCache
+from src.sql_database.replicas import ReplicaRouter
+from src.sql_database.schema_snapshot import read_snapshot, schema_checksum, SnapshotError
+from src.sql_database.statistics import StatementStatistics, TimedQueuePool
+
+DEFAULT_CHUNK_SIZE = 1000
+
+LOADER_STRATEGIES = {'joined': joinedload,
+                     'selectin': selectinload}
+
+# Lookup tables and the natural key column used to find their rows
+LOOKUP_KEYS = {'instrument': 'name',
+               'status': 'value',
+               'experiment': 'reference_number'}
 
+# Named queries used on the hot path and the parameters they take
+HOT_PATH_QUERIES = {'run_by_instrument_run_number': ('instrument', 'run_number'),
+                    'latest_run_version': ('instrument', 'run_number'),
+                    'data_locations_for_run': ('run_id',)}
+
+
+def _as_dicts(rows, columns):
+    """
+    Convert rows to dictionaries of column values
+    :param rows: list of dictionaries or of tuples in the order of columns
+    :param columns: column names for tuple rows
+    :return: list of dictionaries
+    """
+    if rows and not isinstance(rows[0], dict):
+        if columns is None:
+            raise ValueError("columns must be provided when rows are not dictionaries")
+        return [dict(zip(columns, row)) for row in rows]
+    return list(rows)
 
+
+def _chunks(rows, chunk_size):
+    """ Yield successive chunks of at most chunk_size rows """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1 not {}".format(chunk_size))
+    for start in range(0, len(rows), chunk_size):
+        yield rows[start:start + chunk_size]
+
+
+# pylint:disable=too-many-instance-attributes,too-many-public-methods
 class SQLDatabaseClient(AbstractClient):
     """
-    Single access point for the mysql database
+    Single access point for the mysql database.
+    All threads share one engine and its connection pool. Each thread is given its own
+    session by get_connection() or a short lived session by session_scope().
     """
 
     def __init__(self, credentials):
@@ -24,21 +77,71 @@ class SQLDatabaseClient(AbstractClient):
         self._connection = None
         self._meta_data = None
         self._engine = None
+        self._base = None
+        self._models = {}
+        self._statements = {}
+        self._compiled_cache = {}
+        self._lock = threading.RLock()
+        self._lookup_cache = LookupCache(
+            {name: (self._lookup_loader(name), self._lookup_key_loader(name))
+             for name in LOOKUP_KEYS},
+            ttl=self.credentials.lookup_cache_ttl)
+        self._batched_writer = None
+        self._replicas = None
+        self._statistics = None
+        if self.credentials.record_statistics:
+            self._statistics = StatementStatistics(self.credentials.slow_query_threshold)
 
     def connect(self):
         """
         Get the connection to the database service
-        :return: The connection to the database
+        :return: The session of the calling thread
         """
-        if self._connection is None:
-            connect_string = self.credentials.get_full_connection_string()
-            self._engine = create_engine(connect_string, pool_recycle=280)
-            self._meta_data = MetaData(self._engine)
-            session = sessionmaker(bind=self._engine)
-            self._connection = session()
-            self._test_connection()
-            return self._connection
-        return self._connection
+        with self._lock:
+            if self._connection is None:
+                self._engine = self._create_engine()
+                self._connection = scoped_session(sessionmaker(bind=self._engine))
+                self._test_connection()
+                self._meta_data = self._load_meta_data()
+                replicas = [self._create_engine(host)
+                            for host in self.credentials.replica_hosts]
+                self._replicas = ReplicaRouter(replicas, self._engine,
+                                               self.credentials.replica_retry_interval)
+        return self._connection()
+
+    def _create_engine(self, host=None):
+        """
+        Create an engine with the pool options of the settings
+        :param host: The host to connect to (defaults to the primary host)
+        :return: The Engine
+        """
+        connect_string = self.credentials.get_full_connection_string(host)
+        pool_class = QueuePool if self._statistics is None else TimedQueuePool
+        engine = create_engine(connect_string,
+                               poolclass=pool_class,
+                               **self.credentials.get_engine_options())
+        if self._statistics is not None:
+            self._statistics.attach(engine)
+        return engine
+
+    def _load_meta_data(self):
+        """
+        Load the MetaData from the schema snapshot if one is configured and it matches the
+        live schema. Otherwise return an empty MetaData that tables will be reflected into.
+        :return: MetaData bound to the engine
+        """
+        snapshot_path = self.credentials.schema_snapshot
+        if snapshot_path is not None:
+            try:
+                meta_data, checksum = read_snapshot(snapshot_path)
+                if checksum == schema_checksum(self._engine):
+                    meta_data.bind = self._engine
+                    return meta_data
+                logging.warning("Schema snapshot %s does not match the database schema. "
+                                "Falling back to reflection", snapshot_path)
+            except SnapshotError as exp:
+                logging.warning("%s. Falling back to reflection", exp)
+        return MetaData(self._engine)
 
     def _test_connection(self):
         """
@@ -59,127 +162,584 @@ class SQLDatabaseClient(AbstractClient):
 
     def get_connection(self):
         """
-        Retrieve the session object.
-        :return: SQLAlchemy session
+        Retrieve the session object of the calling thread.
+        :return: SQLAlchemy session or None if there is no connection
+        """
+        if self._connection is None:
+            return None
+        return self._connection()
+
+    @contextmanager
+    def session_scope(self):
+        """
+        Provide a new session for a unit of work. The session is committed if the block
+        completes, rolled back if it raises and then closed to return its database
+        connection to the pool.
+        Usage:
+            with client.session_scope() as session:
+                session.add(...)
         """
-        return self._connection
+        self.connect()
+        session = self._connection.session_factory()
+        try:
+            yield session
+            session.commit()
+        except BaseException:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def read_engine(self):
+        """
+        :return: The engine of the next healthy read replica in round robin order or that
+                 of the primary if there are no healthy replicas
+        """
+        self.connect()
+        return self._replicas.choose()
+
+    @contextmanager
+    def read_session_scope(self):
+        """
+        Provide a session for read only work routed to a read replica (or the primary if no
+        replica is available). The session is rolled back and closed when the block exits.
+        A replica that raises a connection error is skipped until its retry interval passes.
+        Usage:
+            with client.read_session_scope() as session:
+                session.query(...)
+        """
+        engine = self.read_engine()
+        session = self._connection.session_factory(bind=engine)
+        try:
+            yield session
+        except OperationalError as exp:
+            if engine is not self._engine:
+                self._replicas.mark_unhealthy(engine, exp)
+            raise
+        finally:
+            session.rollback()
+            session.close()
+
+    def remove_session(self):
+        """
+        Close and discard the session of the calling thread.
+        Worker threads should call this when finished to return their connection to the pool.
+        """
+        if self._connection is not None:
+            self._connection.remove()
+
+    def get_stats(self):
+        """
+        Snapshot of the statement latency histograms (grouped by normalised SQL), row counts,
+        pool checkout wait times and slow query count recorded since the client was created.
+        Recording is enabled with SQLSettings(record_statistics=True).
+        :return: dictionary of statistics or None if recording is disabled
+        """
+        if self._statistics is None:
+            return None
+        return self._statistics.snapshot()
+
+    def batched_writer(self, max_items=100, max_delay=0.05):
+        """
+        Get the write-behind queue for single row updates, such as reduction run status
+        changes, which are committed together in batches. It is created on first use and
+        any queued updates are written when the client disconnects.
+        :param max_items: The number of queued updates that triggers a write
+        :param max_delay: The maximum seconds an update is queued for before it is written
+        :return: BatchedWriter for the connection
+        """
+        self.connect()
+        with self._lock:
+            if self._batched_writer is None:
+                self._batched_writer = BatchedWriter(self._engine, max_items, max_delay)
+            return self._batched_writer
 
     def disconnect(self):
         """
         Close the connection and reset variables
         """
-        self._connection.close()
+        if self._batched_writer is not None:
+            self._batched_writer.close()
+            self._batched_writer = None
+        self._connection.remove()
+        self._engine.dispose()
+        self._replicas.dispose()
+        self._replicas = None
         self._connection = None
         self._meta_data = None
         self._engine = None
+        self._base = None
+        self._models = {}
+        self._statements = {}
+        self._compiled_cache = {}
+        self._lookup_cache.invalidate()
+
+    def _declarative_base(self):
+        """
+        :return: The declarative base shared by all of the tables of this connection
+        """
+        if self._base is None:
+            self._base = declarative_base(metadata=self._meta_data)
+        return self._base
+
+    def _reflect_table(self, table_name):
+        """
+        Reflect a table from the database unless it is already held in the MetaData
+        :param table_name: The name of the table in the database
+        :return: The reflected Table
+        """
+        if table_name in self._meta_data.tables:
+            return self._meta_data.tables[table_name]
+        return Table(table_name, self._meta_data, autoload=True, autoload_with=self._engine)
+
+    def stream_query(self, query, batch_size=1000):
+        """
+        Lazily iterate over the results of a query using a server side cursor
+        (SSCursor for MySQLdb) so that memory use is bounded by batch_size.
+        :param query: An ORM Query or a Core selectable
+        :param batch_size: The number of rows fetched from the database at a time
+        :return: generator of ORM objects (or keyed tuples) for a Query and of
+                 plain tuples for a Core selectable
+        """
+        if isinstance(query, Query):
+            yield from query.execution_options(stream_results=True).yield_per(batch_size)
+            return
+        self.connect()
+        with self._engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(query)
+            try:
+                rows = result.fetchmany(batch_size)
+                while rows:
+                    for row in rows:
+                        yield tuple(row)
+                    rows = result.fetchmany(batch_size)
+            finally:
+                result.close()
 
     # ======================== Tables for database access ============================== #
+    # Each table is reflected once per connection and the resulting class is held in
+    # self._models until disconnect() so that repeated calls do not query the schema again
     def instrument(self):
         """
         :return: Instrument Table to replicate what we expect in the database
         """
-        # pylint: disable=too-few-public-methods
-        class Instrument(declarative_base()):
-            """
-            Table for reduction_viewer_instrument entity
-            """
-            __table__ = Table('reduction_viewer_instrument',
-                              self._meta_data, autoload=True,
-                              autoload_with=self._engine)
-        return Instrument
+        with self._lock:
+            if 'Instrument' not in self._models:
+                # pylint: disable=too-few-public-methods
+                class Instrument(self._declarative_base()):
+                    """
+                    Table for reduction_viewer_instrument entity
+                    """
+                    __table__ = self._reflect_table('reduction_viewer_instrument')
+                self._models['Instrument'] = Instrument
+            return self._models['Instrument']
 
     def reduction_run(self):
         """
         :return: ReductionRun Table to replicate what we expect in the database
         """
-        # pylint: disable=too-few-public-methods
-        class ReductionRun(declarative_base()):
-            """
-            Table for reduction_viewer_reductionrun entity
-            """
-            __table__ = Table('reduction_viewer_reductionrun',
-                              self._meta_data, autoload=True,
-                              autoload_with=self._engine)
-            instrument = relationship(self.instrument(),
-                                      foreign_keys='ReductionRun.instrument_id')
-            status = relationship(self.status(),
-                                  foreign_keys='ReductionRun.status_id')
-            experiment = relationship(self.experiment(),
-                                      foreign_keys='ReductionRun.experiment_id')
-        return ReductionRun
+        with self._lock:
+            if 'ReductionRun' not in self._models:
+                # pylint: disable=too-few-public-methods
+                class ReductionRun(self._declarative_base()):
+                    """
+                    Table for reduction_viewer_reductionrun entity
+                    """
+                    __table__ = self._reflect_table('reduction_viewer_reductionrun')
+                    instrument = relationship(self.instrument(),
+                                              foreign_keys='ReductionRun.instrument_id')
+                    status = relationship(self.status(),
+                                          foreign_keys='ReductionRun.status_id')
+                    experiment = relationship(self.experiment(),
+                                              foreign_keys='ReductionRun.experiment_id')
+                self._models['ReductionRun'] = ReductionRun
+            return self._models['ReductionRun']
 
     def reduction_data_location(self):
         """
         :return: ReductionDataLocation Table to replicate what we expect in the database
         """
-        # pylint: disable=too-few-public-methods
-        class ReductionDataLocation(declarative_base()):
-            """
-            Table for reduction_viewer_datalocation entity
-            """
-            __table__ = Table('reduction_viewer_datalocation',
-                              self._meta_data, autoload=True,
-                              autoload_with=self._engine)
-            reduction_run = relationship(self.reduction_run(),
-                                         foreign_keys='ReductionDataLocation.reduction_run_id')
-        return ReductionDataLocation
+        with self._lock:
+            if 'ReductionDataLocation' not in self._models:
+                # pylint: disable=too-few-public-methods
+                class ReductionDataLocation(self._declarative_base()):
+                    """
+                    Table for reduction_viewer_datalocation entity
+                    """
+                    __table__ = self._reflect_table('reduction_viewer_datalocation')
+                    reduction_run = relationship(
+                        self.reduction_run(),
+                        foreign_keys='ReductionDataLocation.reduction_run_id')
+                self._models['ReductionDataLocation'] = ReductionDataLocation
+            return self._models['ReductionDataLocation']
 
     def reduction_location(self):
         """
         :return: ReductionLocation Table to replicate what we expect in the database
         """
-        # pylint: disable=too-few-public-methods
-        class ReductionLocation(declarative_base()):
-            """
-            Table for reduction_viewer_reductionlocation entity
-            """
-            __table__ = Table('reduction_viewer_reductionlocation',
-                              self._meta_data, autoload=True,
-                              autoload_with=self._engine)
-            reduction_run = relationship(self.reduction_run(),
-                                         foreign_keys='ReductionLocation.reduction_run_id')
-        return ReductionLocation
+        with self._lock:
+            if 'ReductionLocation' not in self._models:
+                # pylint: disable=too-few-public-methods
+                class ReductionLocation(self._declarative_base()):
+                    """
+                    Table for reduction_viewer_reductionlocation entity
+                    """
+                    __table__ = self._reflect_table('reduction_viewer_reductionlocation')
+                    reduction_run = relationship(self.reduction_run(),
+                                                 foreign_keys='ReductionLocation.reduction_run_id')
+                self._models['ReductionLocation'] = ReductionLocation
+            return self._models['ReductionLocation']
 
     def run_variables(self):
         """
         :return: RunVariables Table to replicate what we expect in the database
         """
-        # pylint: disable=too-few-public-methods
-        class RunVariable(declarative_base()):
-            """
-            Table for reduction_variables_runvariable entity
-            """
-            __table__ = Table('reduction_variables_runvariable',
-                              self._meta_data, autoload=True,
-                              autoload_with=self._engine)
-            reduction_run = relationship(self.reduction_run(),
-                                         foreign_keys='RunVariable.reduction_run_id')
-        return RunVariable
+        with self._lock:
+            if 'RunVariable' not in self._models:
+                # pylint: disable=too-few-public-methods
+                class RunVariable(self._declarative_base()):
+                    """
+                    Table for reduction_variables_runvariable entity
+                    """
+                    __table__ = self._reflect_table('reduction_variables_runvariable')
+                    reduction_run = relationship(self.reduction_run(),
+                                                 foreign_keys='RunVariable.reduction_run_id')
+                self._models['RunVariable'] = RunVariable
+            return self._models['RunVariable']
 
     def experiment(self):
         """
         :return: Experiment Table to replicate what we expect in the database
         """
-        # pylint: disable=too-few-public-methods
-        class Experiment(declarative_base()):
-            """
-            Table for reduction_viewer_experiment entity
-            """
-            __table__ = Table('reduction_viewer_experiment',
-                              self._meta_data, autoload=True,
-                              autoload_with=self._engine)
-        return Experiment
+        with self._lock:
+            if 'Experiment' not in self._models:
+                # pylint: disable=too-few-public-methods
+                class Experiment(self._declarative_base()):
+                    """
+                    Table for reduction_viewer_experiment entity
+                    """
+                    __table__ = self._reflect_table('reduction_viewer_experiment')
+                self._models['Experiment'] = Experiment
+            return self._models['Experiment']
 
     def status(self):
         """
         :return: Status Table to replicate what we expect in the database
         """
-        # pylint: disable=too-few-public-methods
-        class Status(declarative_base()):
-            """
-            Table for reduction_viewer_status entity
-            """
-            __table__ = Table('reduction_viewer_status',
-                              self._meta_data, autoload=True,
-                              autoload_with=self._engine)
-        return Status
+        with self._lock:
+            if 'Status' not in self._models:
+                # pylint: disable=too-few-public-methods
+                class Status(self._declarative_base()):
+                    """
+                    Table for reduction_viewer_status entity
+                    """
+                    __table__ = self._reflect_table('reduction_viewer_status')
+                self._models['Status'] = Status
+            return self._models['Status']
+
+    # ======================== Lookup tables ============================== #
+    def _lookup_loader(self, table_name):
+        """
+        :return: function that returns the ids of every row of a lookup table
+                 keyed by their natural key using a single query
+        """
+        def load_table():
+            table = getattr(self, table_name)().__table__
+            query = select([table.columns[LOOKUP_KEYS[table_name]], table.c.id])
+            with self._engine.connect() as connection:
+                return dict(connection.execute(query).fetchall())
+        return load_table
+
+    def _lookup_key_loader(self, table_name):
+        """
+        :return: function that returns the id of a single row of a lookup table
+        """
+        def load_key(key):
+            table = getattr(self, table_name)().__table__
+            query = select([table.c.id]).where(table.columns[LOOKUP_KEYS[table_name]] == key)
+            with self._engine.connect() as connection:
+                return connection.execute(query).scalar()
+        return load_key
+
+    def lookup_id(self, table_name, key):
+        """
+        Find the id of a row of a lookup table from the in-process cache.
+        The table is loaded in one query when first used and after the cache TTL expires.
+        :param table_name: One of 'instrument', 'status' or 'experiment'
+        :param key: The instrument name, status value or experiment reference number
+        :return: The id of the row or None if there is no such row
+        """
+        self.connect()
+        return self._lookup_cache.get(table_name, key)
+
+    def preload_lookups(self):
+        """
+        Load every lookup table into the cache
+        """
+        self.connect()
+        self._lookup_cache.preload()
+
+    def invalidate_lookups(self, table_name=None):
+        """
+        Discard cached lookup rows so they are loaded again when next used
+        :param table_name: The lookup table to discard (defaults to all of them)
+        """
+        self._lookup_cache.invalidate(table_name)
+
+    def lookup_stats(self):
+        """
+        :return: dictionary of the lookup cache hit and miss counts and cached row counts
+        """
+        return self._lookup_cache.stats()
+
+    # ======================== Hot path queries ============================== #
+    def _build_hot_path_statement(self, name):
+        """
+        :return: The parameterised Core statement for a named hot path query
+        """
+        run = self.reduction_run().__table__
+        instrument = self.instrument().__table__
+        if name == 'data_locations_for_run':
+            location = self.reduction_data_location().__table__
+            return select([location]) \
+                .where(location.c.reduction_run_id == bindparam('run_id')) \
+                .order_by(location.c.id)
+        statement = select([run]) \
+            .select_from(run.join(instrument, run.c.instrument_id == instrument.c.id)) \
+            .where(instrument.c.name == bindparam('instrument')) \
+            .where(run.c.run_number == bindparam('run_number'))
+        if name == 'latest_run_version':
+            return statement.order_by(run.c.run_version.desc()).limit(1)
+        return statement.order_by(run.c.run_version)
+
+    def hot_path_query(self, name, **parameters):
+        """
+        Execute one of the HOT_PATH_QUERIES. Each is built once and its compiled SQL is
+        cached so later calls only bind the parameters.
+        run_by_instrument_run_number: every version of a run (instrument, run_number)
+        latest_run_version: the highest version of a run (instrument, run_number)
+        data_locations_for_run: the data locations of a run (run_id)
+        :param name: The name of the query
+        :param parameters: The values of the query parameters
+        :return: list of result rows
+        """
+        if name not in HOT_PATH_QUERIES:
+            raise KeyError("{} is not a hot path query".format(name))
+        self.connect()
+        with self._lock:
+            if name not in self._statements:
+                self._statements[name] = self._build_hot_path_statement(name)
+            statement = self._statements[name]
+        with self._engine.connect() as connection:
+            return connection.execution_options(compiled_cache=self._compiled_cache) \
+                .execute(statement, **parameters).fetchall()
+
+    # ======================== Eager loading queries ============================== #
+    # These queries load the related rows of each table up front rather than issuing a
+    # SELECT per row when a relationship is first accessed.
+    # strategy is 'joined' to load them in the same SELECT or 'selectin' to load them
+    # with one additional SELECT per relationship
+    def _run_loader_options(self, strategy):
+        """
+        :return: loader options for the instrument, status and experiment of a ReductionRun
+        """
+        loader = LOADER_STRATEGIES[strategy]
+        reduction_run = self.reduction_run()
+        return [loader(reduction_run.instrument),
+                loader(reduction_run.status),
+                loader(reduction_run.experiment)]
+
+    def _query(self, model, session):
+        """
+        :return: Query for the model using the given session or that of the calling thread
+        """
+        if session is None:
+            session = self.connect()
+        return session.query(model)
+
+    def reduction_run_query(self, session=None, strategy='joined'):
+        """
+        :return: Query for ReductionRuns with their instrument, status and experiment loaded
+        """
+        return self._query(self.reduction_run(), session) \
+            .options(*self._run_loader_options(strategy))
+
+    def _run_child_query(self, model, session, strategy):
+        """
+        :return: Query for a table with a reduction_run relationship with the run,
+                 and its instrument, status and experiment, loaded
+        """
+        loader = LOADER_STRATEGIES[strategy]
+        return self._query(model, session) \
+            .options(loader(model.reduction_run).options(*self._run_loader_options(strategy)))
+
+    def reduction_data_location_query(self, session=None, strategy='joined'):
+        """
+        :return: Query for ReductionDataLocations with their ReductionRun loaded
+        """
+        return self._run_child_query(self.reduction_data_location(), session, strategy)
+
+    def reduction_location_query(self, session=None, strategy='joined'):
+        """
+        :return: Query for ReductionLocations with their ReductionRun loaded
+        """
+        return self._run_child_query(self.reduction_location(), session, strategy)
+
+    def run_variable_query(self, session=None, strategy='joined'):
+        """
+        :return: Query for RunVariables with their ReductionRun loaded
+        """
+        return self._run_child_query(self.run_variables(), session, strategy)
+
+    # ======================== Bulk operations ============================== #
+    # pylint:disable=too-many-arguments
+    def bulk_insert_runs(self, runs, columns=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                         return_ids=True):
+        """
+        Insert many reduction runs in a single transaction with one multi-row INSERT per
+        chunk. All rows must provide the same columns.
+        The ids of the rows of a multi-row INSERT are allocated together, so they are
+        derived from the id the database reports for the statement. On MySQL this relies on
+        InnoDB allocating consecutive ids to each multi-row INSERT, which it does in every
+        innodb_autoinc_lock_mode as the number of rows is known in advance.
+        :param runs: list of dictionaries of column values or tuples in the order of columns
+        :param columns: column names for tuple rows
+        :param chunk_size: maximum number of rows inserted by each statement
+        :param return_ids: If True, return the ids of the inserted runs
+        :return: list of the ids of the inserted runs in the order they were given or None
+                 if return_ids is False
+        :raises ValueError: If ids are requested from a database other than MySQL or SQLite
+        """
+        rows = _as_dicts(runs, columns)
+        self.connect()
+        table = self.reduction_run().__table__
+        ids = [] if return_ids else None
+        with self._engine.begin() as connection:
+            for chunk in _chunks(rows, chunk_size):
+                if not return_ids:
+                    connection.execute(table.insert(), chunk)
+                    continue
+                result = connection.execute(table.insert().values(chunk))
+                ids.extend(self._inserted_ids(connection, table, chunk, result))
+        return ids
+
+    @staticmethod
+    def _inserted_ids(connection, table, rows, result):
+        """
+        :param connection: The connection that executed the INSERT
+        :param table: The table the rows were inserted into
+        :param rows: The rows inserted by a single multi-row INSERT
+        :param result: The ResultProxy of the INSERT
+        :return: list of the ids of the rows in the order they were given
+        :raises ValueError: If the ids can not be derived for the dialect of the connection
+        """
+        primary_key = table.primary_key.columns.values()[0].name
+        if primary_key in rows[0]:
+            return [row[primary_key] for row in rows]
+        if result.rowcount not in (-1, len(rows)):
+            raise ValueError("{} rows inserted instead of {}".format(result.rowcount,
+                                                                     len(rows)))
+        dialect = connection.dialect.name
+        if dialect == 'mysql':
+            # The id of the first row, with the others following it at the configured step
+            step = connection.execute('SELECT @@auto_increment_increment').scalar()
+            return [result.lastrowid + index * step for index in range(len(rows))]
+        if dialect == 'sqlite':
+            # The id of the last row. SQLite locks the database while it inserts the rows.
+            return list(range(result.lastrowid - len(rows) + 1, result.lastrowid + 1))
+        raise ValueError("Returning the ids of bulk inserts is not supported for {}, pass "
+                         "return_ids=False".format(dialect))
+
+    def bulk_upsert_run_variables(self, run_variables, columns=None,
+                                  chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Insert many run variables, updating any that already exist, in a single transaction
+        using INSERT ... ON DUPLICATE KEY UPDATE. All rows must provide the same columns.
+        :param run_variables: list of dictionaries of column values or tuples in the order
+                              of columns
+        :param columns: column names for tuple rows
+        :param chunk_size: maximum number of rows inserted by each statement
+        :return: list of the primary keys of the run variables in the order they were given
+        """
+        rows = _as_dicts(run_variables, columns)
+        if not rows:
+            return []
+        self.connect()
+        table = self.run_variables().__table__
+        statement = self._upsert_statement(table, rows[0].keys())
+        with self._engine.begin() as connection:
+            for chunk in _chunks(rows, chunk_size):
+                connection.execute(statement, chunk)
+        primary_key = table.primary_key.columns.values()[0].name
+        return [row[primary_key] for row in rows]
+
+    # pylint:disable=too-many-arguments
+    def transition_runs(self, status, run_ids=None, instrument=None, current_status=None,
+                        finished=None, message=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Set the status, and optionally the finish time and message, of many reduction runs
+        in a single transaction using UPDATE statements rather than loading each run.
+        Runs are selected by id and/or by instrument and current status.
+        e.g. mark every Queued WISH run as Error:
+            client.transition_runs('Error', instrument='WISH', current_status='Queued')
+        :param status: The new status value (e.g. 'Error') or status id
+        :param run_ids: ids of the runs to update. These are updated with one statement
+                        per chunk of ids
+        :param instrument: Only update runs of the instrument with this name
+        :param current_status: Only update runs that currently have this status value or id
+        :param finished: The finish time to set
+        :param message: The message to set
+        :param chunk_size: The maximum number of ids in each statement
+        :return: The number of runs updated
+        """
+        if run_ids is None and instrument is None and current_status is None:
+            raise ValueError("run_ids, instrument or current_status must be provided")
+        self.connect()
+        table = self.reduction_run().__table__
+        values = {'status_id': self._status_id(status)}
+        if finished is not None:
+            values['finished'] = finished
+        if message is not None:
+            values['message'] = message
+        statement = table.update().values(values)
+        if instrument is not None:
+            instrument_id = self.lookup_id('instrument', instrument)
+            if instrument_id is None:
+                return 0
+            statement = statement.where(table.c.instrument_id == instrument_id)
+        if current_status is not None:
+            statement = statement.where(table.c.status_id == self._status_id(current_status))
+        updated = 0
+        with self._engine.begin() as connection:
+            if run_ids is None:
+                return connection.execute(statement).rowcount
+            for chunk in _chunks(list(run_ids), chunk_size):
+                updated += connection.execute(statement.where(table.c.id.in_(chunk))).rowcount
+        return updated
+
+    def _status_id(self, status):
+        """
+        :param status: A status value or id
+        :return: The id of the status
+        """
+        if isinstance(status, int):
+            return status
+        status_id = self.lookup_id('status', status)
+        if status_id is None:
+            raise ValueError("{} is not a valid status".format(status))
+        return status_id
+
+    def _upsert_statement(self, table, column_names):
+        """
+        :return: an INSERT statement for the table that updates rows with an existing key
+        :raises ValueError: If upserts are not supported for the dialect of the engine
+        """
+        dialect = self._engine.dialect.name
+        if dialect == 'mysql':
+            statement = mysql.insert(table)
+            return statement.on_duplicate_key_update(
+                {name: statement.inserted[name] for name in column_names
+                 if not table.columns[name].primary_key})
+        if dialect == 'sqlite':
+            return table.insert().prefix_with('OR REPLACE')
+        raise ValueError("Upserts are not supported for {}".format(dialect))
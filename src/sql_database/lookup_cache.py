@@ -0,0 +1,88 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+In-process cache for small lookup tables that rarely change
+"""
+import threading
+import time
+
+
+class LookupCache:
+    """
+    Cache of the ids of rows in lookup tables keyed by table name and natural key.
+    A table is loaded in full the first time it is used and again after ttl seconds.
+    Keys missing from a loaded table are looked up individually to find rows that have been
+    added since the table was loaded.
+    """
+
+    def __init__(self, loaders, ttl=300, clock=time.monotonic):
+        """
+        :param loaders: dictionary of table name to a tuple of two functions.
+                        The first returns a dictionary of natural key to id for every row
+                        and the second returns the id of a single natural key or None.
+        :param ttl: seconds a loaded table is used for before it is loaded again
+        :param clock: function returning the current time in seconds
+        """
+        self._loaders = loaders
+        self._ttl = ttl
+        self._clock = clock
+        self._tables = {}
+        self._loaded_at = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, table_name, key):
+        """
+        :param table_name: The lookup table to search
+        :param key: The natural key of the row
+        :return: The id of the row or None if there is no such row
+        """
+        if table_name not in self._loaders:
+            raise KeyError("{} is not a lookup table".format(table_name))
+        with self._lock:
+            loaded_at = self._loaded_at.get(table_name)
+            if loaded_at is not None and self._clock() - loaded_at < self._ttl:
+                ids = self._tables[table_name]
+                if key in ids:
+                    self.hits += 1
+                    return ids[key]
+                self.misses += 1
+                row_id = self._loaders[table_name][1](key)
+                if row_id is not None:
+                    ids[key] = row_id
+                return row_id
+            self.misses += 1
+            self._tables[table_name] = self._loaders[table_name][0]()
+            self._loaded_at[table_name] = self._clock()
+            return self._tables[table_name].get(key)
+
+    def preload(self, table_names=None):
+        """
+        Load lookup tables in full
+        :param table_names: The tables to load (defaults to all of them)
+        """
+        with self._lock:
+            for table_name in table_names or self._loaders:
+                self._tables[table_name] = self._loaders[table_name][0]()
+                self._loaded_at[table_name] = self._clock()
+
+    def invalidate(self, table_name=None):
+        """
+        Discard cached rows so they are loaded again when next used
+        :param table_name: The table to discard (defaults to all of them)
+        """
+        with self._lock:
+            for name in [table_name] if table_name else list(self._tables):
+                self._tables.pop(name, None)
+                self._loaded_at.pop(name, None)
+
+    def stats(self):
+        """ :return: dictionary of hit and miss counts and the number of cached rows """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'rows': {name: len(ids) for name, ids in self._tables.items()}}
@@ -0,0 +1,87 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Routing of read only work to replica databases
+"""
+import itertools
+import logging
+import threading
+import time
+
+
+class ReplicaRouter:
+    """
+    Chooses the engine for read only work from a set of replicas in round robin order.
+    A replica that fails is skipped until retry_interval seconds have passed, after which it
+    is health checked before being used again. The primary is used when no replica is healthy.
+    """
+
+    def __init__(self, replicas, primary, retry_interval=30, clock=time.monotonic):
+        """
+        :param replicas: list of engines for the replica databases
+        :param primary: engine for the primary database
+        :param retry_interval: seconds a failed replica is skipped for
+        :param clock: function returning the current time in seconds
+        """
+        self.replicas = replicas
+        self.primary = primary
+        self._retry_interval = retry_interval
+        self._clock = clock
+        self._unhealthy_until = {}
+        self._order = itertools.cycle(range(len(replicas)))
+        self._lock = threading.Lock()
+
+    def choose(self):
+        """
+        :return: The next healthy replica engine or the primary if there is none
+        """
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                replica = self.replicas[next(self._order)]
+                retry_at = self._unhealthy_until.get(replica)
+            if retry_at is None:
+                return replica
+            if self._clock() >= retry_at and self.check(replica):
+                return replica
+        return self.primary
+
+    def check(self, replica):
+        """
+        Test a replica with a trivial query and record whether it is healthy
+        :param replica: The replica engine to test
+        :return: True if the replica answered
+        """
+        try:
+            with replica.connect() as connection:
+                connection.execute('SELECT 1').fetchall()
+        # pylint:disable=broad-except
+        except Exception as exp:
+            self.mark_unhealthy(replica, exp)
+            return False
+        with self._lock:
+            self._unhealthy_until.pop(replica, None)
+        return True
+
+    def mark_unhealthy(self, replica, error=None):
+        """
+        Skip a replica until the retry interval has passed
+        :param replica: The replica engine that failed
+        :param error: The exception raised by the replica
+        """
+        logging.warning("Read replica %r is unavailable: %s", replica.url, error)
+        with self._lock:
+            self._unhealthy_until[replica] = self._clock() + self._retry_interval
+
+    def healthy_replicas(self):
+        """ :return: list of the replicas not currently marked as unhealthy """
+        with self._lock:
+            return [replica for replica in self.replicas
+                    if replica not in self._unhealthy_until]
+
+    def dispose(self):
+        """ Close the connections of every replica engine """
+        for replica in self.replicas:
+            replica.dispose()
@@ -0,0 +1,142 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Persisted snapshots of the reflected database schema.
+A snapshot allows the SQLDatabaseClient to build its tables without reflecting them from
+the database. The snapshot is only used if a checksum of the live schema matches the
+checksum recorded when the snapshot was generated.
+
+To regenerate a snapshot:
+python -m src.sql_database.schema_snapshot --username USER --password PASS --host HOST
+                                           --port PORT --database DATABASE OUTPUT_FILE
+"""
+import argparse
+import hashlib
+import pickle
+
+import sqlalchemy
+from sqlalchemy import bindparam, create_engine, MetaData, text
+
+from src.sql_database.settings import SQLSettings
+
+SNAPSHOT_VERSION = 1
+
+TABLE_NAMES = ['reduction_viewer_instrument',
+               'reduction_viewer_status',
+               'reduction_viewer_experiment',
+               'reduction_viewer_reductionrun',
+               'reduction_viewer_datalocation',
+               'reduction_viewer_reductionlocation',
+               'reduction_variables_runvariable']
+
+_CHECKSUM_QUERIES = {
+    'mysql': "SELECT table_name, column_name, column_type, is_nullable, column_key "
+             "FROM information_schema.columns "
+             "WHERE table_schema = DATABASE() AND table_name IN :table_names "
+             "ORDER BY table_name, ordinal_position",
+    'sqlite': "SELECT name, sql FROM sqlite_master "
+              "WHERE type = 'table' AND name IN :table_names "
+              "ORDER BY name"
+}
+
+
+class SnapshotError(Exception):
+    """
+    Raised when a schema snapshot can not be used
+    """
+
+
+def schema_checksum(connectable, table_names=None):
+    """
+    Calculate a checksum of the live schema using a single query
+    :param connectable: An Engine or Connection to the database
+    :param table_names: The tables to include in the checksum (defaults to TABLE_NAMES)
+    :return: hex digest of the schema description
+    """
+    dialect = connectable.dialect.name
+    if dialect not in _CHECKSUM_QUERIES:
+        raise SnapshotError("Schema checksums are not supported for {}".format(dialect))
+    query = text(_CHECKSUM_QUERIES[dialect]).bindparams(bindparam('table_names',
+                                                                  expanding=True))
+    rows = connectable.execute(query, table_names=table_names or TABLE_NAMES).fetchall()
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update(repr(tuple(row)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def write_snapshot(engine, path, table_names=None):
+    """
+    Reflect the tables from the database and save them to a snapshot file
+    :param engine: Engine for the database to reflect
+    :param path: location of the snapshot file to write
+    :param table_names: The tables to include in the snapshot (defaults to TABLE_NAMES)
+    """
+    table_names = table_names or TABLE_NAMES
+    meta_data = MetaData()
+    meta_data.reflect(bind=engine, only=table_names)
+    snapshot = {'version': SNAPSHOT_VERSION,
+                'sqlalchemy_version': sqlalchemy.__version__,
+                'checksum': schema_checksum(engine, table_names),
+                'meta_data': meta_data}
+    with open(path, 'wb') as snapshot_file:
+        pickle.dump(snapshot, snapshot_file)
+
+
+def read_snapshot(path):
+    """
+    Load a snapshot file written by write_snapshot.
+    Snapshots are pickled so should only be read from trusted locations.
+    :param path: location of the snapshot file
+    :return: tuple of the unbound MetaData and the checksum of the schema it was taken from
+    """
+    try:
+        with open(path, 'rb') as snapshot_file:
+            snapshot = pickle.load(snapshot_file)
+    # Unpickling a damaged or foreign file can raise almost any exception
+    # pylint:disable=broad-except
+    except Exception as exp:
+        raise SnapshotError("Unable to read schema snapshot {}: {}".format(path, exp))
+    if not isinstance(snapshot, dict):
+        raise SnapshotError("Schema snapshot {} holds a {} not a snapshot".format(
+            path, type(snapshot).__name__))
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise SnapshotError("Schema snapshot {} has version {} but {} is required".format(
+            path, snapshot.get('version'), SNAPSHOT_VERSION))
+    if snapshot.get('sqlalchemy_version') != sqlalchemy.__version__:
+        raise SnapshotError("Schema snapshot {} was written by SQLAlchemy {}".format(
+            path, snapshot.get('sqlalchemy_version')))
+    if not isinstance(snapshot.get('meta_data'), MetaData) or \
+            not isinstance(snapshot.get('checksum'), str):
+        raise SnapshotError("Schema snapshot {} is incomplete".format(path))
+    return snapshot['meta_data'], snapshot['checksum']
+
+
+def main(argv=None):
+    """
+    Command line entry point for regenerating a schema snapshot
+    """
+    parser = argparse.ArgumentParser(description='Write a snapshot of the autoreduction '
+                                                 'database schema')
+    parser.add_argument('output', help='location of the snapshot file to write')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--host', required=True)
+    parser.add_argument('--port', default='3306')
+    parser.add_argument('--database', default='autoreduction')
+    args = parser.parse_args(argv)
+    settings = SQLSettings(database_name=args.database, username=args.username,
+                           password=args.password, host=args.host, port=args.port)
+    engine = create_engine(settings.get_full_connection_string(
+        host='{}:{}'.format(args.host, args.port)))
+    try:
+        write_snapshot(engine, args.output)
+    finally:
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
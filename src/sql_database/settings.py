@@ -6,20 +6,65 @@
 from src.settings import ClientSettings
 
 
-# pylint:disable=too-few-public-methods
+# pylint:disable=too-few-public-methods,too-many-instance-attributes
 class SQLSettings(ClientSettings):
     """
     MySQL settings to be used as a Database settings object
     """
     database = None
+    schema_snapshot = None
 
-    def __init__(self, database_name='autoreduction', **kwargs):
+    # pylint:disable=too-many-arguments
+    def __init__(self, database_name='autoreduction', schema_snapshot=None,
+                 pool_size=5, max_overflow=10, pool_timeout=30, pool_recycle=280,
+                 pool_pre_ping=False, lookup_cache_ttl=300, record_statistics=False,
+                 slow_query_threshold=1.0, replica_hosts=None, replica_retry_interval=30,
+                 **kwargs):
+        """
+        :param database_name: The name of the database to connect to
+        :param schema_snapshot: Optional path of a schema snapshot file to build the
+                                tables from instead of reflecting them on connection
+        :param pool_size: The number of connections to keep open in the pool
+        :param max_overflow: The number of connections allowed in addition to pool_size
+        :param pool_timeout: Seconds to wait for a connection from a full pool
+        :param pool_recycle: Seconds after which a pooled connection is replaced
+        :param pool_pre_ping: Test connections for liveness when taken from the pool
+        :param lookup_cache_ttl: Seconds that cached instrument, status and experiment ids
+                                 are used for before they are loaded again
+        :param record_statistics: Record per statement latencies and pool checkout times
+        :param slow_query_threshold: Seconds after which a statement is written to the
+                                     slow query log when recording statistics
+        :param replica_hosts: Optional list of hosts of read replicas of the database
+        :param replica_retry_interval: Seconds an unavailable replica is skipped for
+        """
         super(SQLSettings, self).__init__(**kwargs)
         self.database = database_name
+        self.schema_snapshot = schema_snapshot
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_timeout = pool_timeout
+        self.pool_recycle = pool_recycle
+        self.pool_pre_ping = pool_pre_ping
+        self.lookup_cache_ttl = lookup_cache_ttl
+        self.record_statistics = record_statistics
+        self.slow_query_threshold = slow_query_threshold
+        self.replica_hosts = [self._attempt_param_cast(host) for host in replica_hosts or []]
+        self.replica_retry_interval = replica_retry_interval
 
-    def get_full_connection_string(self):
-        """ :return: string for connecting directly to mysql service with user + pass """
+    def get_full_connection_string(self, host=None):
+        """
+        :param host: The host to connect to (defaults to the primary host)
+        :return: string for connecting directly to mysql service with user + pass
+        """
         return 'mysql+mysqldb://{0}:{1}@{2}/{3}'.format(self.username,
                                                         self.password,
-                                                        self.host,
+                                                        host or self.host,
                                                         self.database)
+
+    def get_engine_options(self):
+        """ :return: dictionary of keyword arguments for creating the database engine """
+        return {'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'pool_timeout': self.pool_timeout,
+                'pool_recycle': self.pool_recycle,
+                'pool_pre_ping': self.pool_pre_ping}
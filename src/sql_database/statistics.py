@@ -0,0 +1,170 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Per statement latency instrumentation for SQLAlchemy engines
+"""
+import logging
+import re
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from src.histogram import Histogram
+
+SLOW_QUERY_LOG = logging.getLogger('sql_database.slow_queries')
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|:\w+|\?')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_VALUES_LIST = re.compile(r'(VALUES \(\?\))(?:\s*,\s*\(\?\))+', re.IGNORECASE)
+
+
+def normalise_statement(statement):
+    """
+    Reduce a SQL statement to a form shared by all executions of the same query by
+    replacing literals and placeholders with ? and collapsing lists of them
+    :param statement: The SQL text
+    :return: The normalised SQL text
+    """
+    statement = _WHITESPACE.sub(' ', statement.strip())
+    statement = _STRING_LITERAL.sub('?', statement)
+    statement = _NUMBER_LITERAL.sub('?', statement)
+    statement = _PLACEHOLDER.sub('?', statement)
+    statement = _PLACEHOLDER_LIST.sub('(?)', statement)
+    return _VALUES_LIST.sub(r'\1', statement)
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited for a connection
+    """
+    statistics = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        finally:
+            if self.statistics is not None:
+                self.statistics.record_checkout(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super(TimedQueuePool, self).recreate()
+        pool.statistics = self.statistics
+        return pool
+
+
+class StatementStatistics:
+    """
+    Records latency histograms and row counts grouped by normalised SQL text and pool
+    checkout wait times for an engine. Statements slower than slow_query_threshold seconds
+    are written to the slow query log.
+    """
+
+    def __init__(self, slow_query_threshold=1.0):
+        self.slow_query_threshold = slow_query_threshold
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._checkout = Histogram()
+        self._slow_queries = 0
+
+    def attach(self, engine):
+        """
+        Start recording the statements executed by an engine.
+        Checkout wait times are only recorded if the engine uses a TimedQueuePool.
+        """
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+        if isinstance(engine.pool, TimedQueuePool):
+            engine.pool.statistics = self
+
+    def detach(self, engine):
+        """
+        Stop recording the statements executed by an engine
+        """
+        event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.remove(engine, 'handle_error', self._handle_error)
+        if isinstance(engine.pool, TimedQueuePool):
+            engine.pool.statistics = None
+
+    # pylint:disable=too-many-arguments,unused-argument
+    @staticmethod
+    def _before_cursor_execute(connection, cursor, statement, parameters, context,
+                               executemany):
+        connection.info.setdefault('statement_start', []).append(time.perf_counter())
+
+    # pylint:disable=too-many-arguments,unused-argument
+    def _after_cursor_execute(self, connection, cursor, statement, parameters, context,
+                              executemany):
+        elapsed = time.perf_counter() - connection.info['statement_start'].pop()
+        self.record_statement(statement, elapsed, cursor.rowcount)
+
+    @staticmethod
+    def _handle_error(exception_context):
+        """
+        Discard the start time of a statement that failed, as after_cursor_execute is only
+        called for statements that succeed
+        """
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('statement_start'):
+            connection.info['statement_start'].pop()
+
+    def record_statement(self, statement, elapsed, row_count=-1):
+        """
+        Record the execution of a statement
+        :param statement: The SQL text that was executed
+        :param elapsed: The seconds taken to execute it
+        :param row_count: The number of rows affected or returned (-1 if unknown)
+        """
+        key = normalise_statement(statement)
+        with self._lock:
+            record = self._statements.get(key)
+            if record is None:
+                record = self._statements[key] = {'latency': Histogram(), 'rows': 0}
+            record['latency'].observe(elapsed)
+            if row_count > 0:
+                record['rows'] += row_count
+            slow = elapsed >= self.slow_query_threshold
+            if slow:
+                self._slow_queries += 1
+        if slow:
+            SLOW_QUERY_LOG.warning("Slow query took %.3fs: %s", elapsed, statement)
+
+    def record_checkout(self, elapsed):
+        """
+        Record the time spent waiting for a connection from the pool
+        :param elapsed: The seconds spent waiting
+        """
+        with self._lock:
+            self._checkout.observe(elapsed)
+
+    def snapshot(self):
+        """
+        :return: dictionary of the statistics recorded so far
+        """
+        with self._lock:
+            statements = {}
+            for key, record in self._statements.items():
+                statements[key] = record['latency'].snapshot()
+                statements[key]['rows'] = record['rows']
+            return {'statements': statements,
+                    'pool_checkout': self._checkout.snapshot(),
+                    'slow_queries': self._slow_queries}
+
+    def reset(self):
+        """
+        Discard the statistics recorded so far
+        """
+        with self._lock:
+            self._statements = {}
+            self._checkout = Histogram()
+            self._slow_queries = 0
@@ -0,0 +1,136 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Local SQLite stand-in for the autoreduction database.
+This mirrors the tables the SQLDatabaseClient reflects so the client can be exercised
+without access to a MySQL service.
+"""
+import sqlite3
+
+from sqlalchemy import event
+
+from src.sql_database import SQLSettings
+
+
+SCHEMA = [
+    """CREATE TABLE reduction_viewer_instrument (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name VARCHAR(80) NOT NULL,
+        is_active BOOLEAN NOT NULL DEFAULT 1,
+        is_paused BOOLEAN NOT NULL DEFAULT 0)""",
+    """CREATE TABLE reduction_viewer_status (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        value VARCHAR(25) NOT NULL)""",
+    """CREATE TABLE reduction_viewer_experiment (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        reference_number INTEGER NOT NULL)""",
+    """CREATE TABLE reduction_viewer_reductionrun (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_number INTEGER NOT NULL,
+        run_version INTEGER NOT NULL DEFAULT 0,
+        run_name VARCHAR(200) NOT NULL DEFAULT '',
+        cancel BOOLEAN NOT NULL DEFAULT 0,
+        hidden_in_failviewer BOOLEAN NOT NULL DEFAULT 0,
+        admin_log TEXT NOT NULL DEFAULT '',
+        reduction_log TEXT NOT NULL DEFAULT '',
+        created DATETIME,
+        last_updated DATETIME,
+        started DATETIME,
+        finished DATETIME,
+        message VARCHAR(255),
+        graph TEXT,
+        overwrite BOOLEAN,
+        reduction_host VARCHAR(255),
+        started_by INTEGER,
+        instrument_id INTEGER REFERENCES reduction_viewer_instrument (id),
+        experiment_id INTEGER NOT NULL REFERENCES reduction_viewer_experiment (id),
+        status_id INTEGER NOT NULL REFERENCES reduction_viewer_status (id),
+        retry_run_id INTEGER REFERENCES reduction_viewer_reductionrun (id))""",
+    """CREATE TABLE reduction_viewer_datalocation (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_path VARCHAR(255) NOT NULL,
+        reduction_run_id INTEGER NOT NULL REFERENCES reduction_viewer_reductionrun (id))""",
+    """CREATE TABLE reduction_viewer_reductionlocation (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_path VARCHAR(255) NOT NULL,
+        reduction_run_id INTEGER NOT NULL REFERENCES reduction_viewer_reductionrun (id))""",
+    """CREATE TABLE reduction_variables_runvariable (
+        variable_ptr_id INTEGER PRIMARY KEY,
+        reduction_run_id INTEGER NOT NULL REFERENCES reduction_viewer_reductionrun (id))""",
+]
+
+STATUSES = ['Queued', 'Processing', 'Completed', 'Skipped', 'Error']
+
+
+# pylint:disable=too-few-public-methods
+class SQLiteSettings(SQLSettings):
+    """
+    SQLSettings pointing at a local SQLite file instead of a MySQL service
+    """
+
+    def __init__(self, path, **kwargs):
+        super(SQLiteSettings, self).__init__(database_name=path,
+                                             username='', password='',
+                                             host='localhost', port='',
+                                             **kwargs)
+
+    def get_full_connection_string(self, host=None):
+        """
+        :param host: Path of a replica SQLite file (defaults to the primary file)
+        :return: string for connecting to the local SQLite file
+        """
+        return 'sqlite:///{0}'.format(host or self.database)
+
+    def get_engine_options(self):
+        """ :return: engine options allowing pooled connections to be shared by threads """
+        options = super(SQLiteSettings, self).get_engine_options()
+        options['connect_args'] = {'check_same_thread': False}
+        return options
+
+
+def create_stand_in_database(path, instruments=('WISH', 'GEM')):
+    """
+    Create the autoreduction tables in a SQLite file and populate the lookup tables
+    :param path: location of the SQLite file to create
+    :param instruments: names of the instruments to add
+    """
+    connection = sqlite3.connect(path)
+    with connection:
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.executemany('INSERT INTO reduction_viewer_status (value) VALUES (?)',
+                               [(status,) for status in STATUSES])
+        connection.executemany('INSERT INTO reduction_viewer_instrument (name) VALUES (?)',
+                               [(name,) for name in instruments])
+        connection.execute('INSERT INTO reduction_viewer_experiment (reference_number) '
+                           'VALUES (1234567)')
+    connection.close()
+
+
+class QueryCounter:
+    """
+    Context manager recording every statement executed on an engine
+    """
+
+    def __init__(self, engine):
+        self._engine = engine
+        self.statements = []
+
+    def _record(self, *args):
+        """ Record the statement text of a before_cursor_execute event """
+        self.statements.append(args[2])
+
+    def __enter__(self):
+        event.listen(self._engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(self._engine, 'before_cursor_execute', self._record)
+
+    @property
+    def count(self):
+        """ :return: The number of statements executed """
+        return len(self.statements)
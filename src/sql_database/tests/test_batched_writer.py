@@ -0,0 +1,122 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for the batched writer
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from sqlalchemy import Column, create_engine, Integer, MetaData, select, String, Table
+
+from src.sql_database.batched_writer import BatchedWriter
+
+
+# pylint:disable=missing-docstring,protected-access
+class TestBatchedWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        path = os.path.join(self.directory, 'writer.sqlite3')
+        self.engine = create_engine('sqlite:///{}'.format(path))
+        self.table = Table('run', MetaData(),
+                           Column('id', Integer, primary_key=True),
+                           Column('status', String(10)),
+                           Column('message', String(10)))
+        self.table.create(self.engine)
+        self.engine.execute(self.table.insert(),
+                            [{'id': row_id, 'status': 'Queued'} for row_id in range(10)])
+        self.writer = None
+
+    def tearDown(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def rows(self):
+        query = select([self.table]).order_by(self.table.c.id)
+        return [(row.id, row.status, row.message) for row in self.engine.execute(query)]
+
+    def test_writes_when_max_items_queued(self):
+        self.writer = BatchedWriter(self.engine, max_items=3, max_delay=60)
+        written = threading.Event()
+        self.writer.update(self.table, 0, {'status': 'Completed'})
+        self.writer.update(self.table, 1, {'status': 'Completed'})
+        self.assertEqual(2, self.writer.pending())
+        self.writer.update(self.table, 2, {'status': 'Error'},
+                           callback=lambda error: written.set())
+        self.assertTrue(written.wait(5))
+        self.assertEqual(1, self.writer.commits)
+        self.assertEqual(['Completed', 'Completed', 'Error'],
+                         [row[1] for row in self.rows()[:3]])
+
+    def test_writes_after_max_delay(self):
+        self.writer = BatchedWriter(self.engine, max_items=100, max_delay=0.01)
+        written = threading.Event()
+        self.writer.update(self.table, 4, {'status': 'Completed'},
+                           callback=lambda error: written.set())
+        self.assertTrue(written.wait(5))
+        self.assertEqual((4, 'Completed', None), self.rows()[4])
+
+    def test_merges_updates_to_a_row(self):
+        self.writer = BatchedWriter(self.engine, max_items=100, max_delay=60)
+        self.writer.update(self.table, 1, {'status': 'Processing'})
+        self.writer.update(self.table, 1, {'status': 'Error', 'message': 'failed'})
+        self.writer.update(self.table, 2, {'message': 'skipped'})
+        self.writer.flush()
+        self.assertEqual([(1, 'Error', 'failed'), (2, 'Queued', 'skipped')], self.rows()[1:3])
+        self.assertEqual(1, self.writer.commits)
+
+    def test_callbacks_after_commit(self):
+        self.writer = BatchedWriter(self.engine, max_items=100, max_delay=60)
+        results = []
+
+        def callback(error):
+            results.append((error, self.rows()[5][1]))
+        self.writer.update(self.table, 5, {'status': 'Completed'}, callback=callback)
+        self.assertEqual([], results)
+        self.writer.flush()
+        self.assertEqual([(None, 'Completed')], results)
+
+    def test_failed_write_calls_back_with_error(self):
+        self.writer = BatchedWriter(self.engine, max_items=100, max_delay=60)
+        errors = []
+        self.writer.update(self.table, 1, {'status': 'Completed'}, callback=errors.append)
+        self.writer.update(self.table, 2, {'not_a_column': 'x'}, callback=errors.append)
+        self.writer.flush()
+        self.assertEqual(2, len(errors))
+        self.assertIsInstance(errors[0], Exception)
+        self.assertEqual('Queued', self.rows()[1][1])
+
+    def test_failing_callback(self):
+        self.writer = BatchedWriter(self.engine, max_items=2, max_delay=60)
+        written = threading.Event()
+        with self.assertLogs(level='ERROR'):
+            self.writer.update(self.table, 1, {'status': 'Completed'},
+                               callback=lambda error: 1 / 0)
+            self.writer.update(self.table, 2, {'status': 'Completed'},
+                               callback=lambda error: written.set())
+            self.assertTrue(written.wait(5))
+        # The background thread still writes later batches
+        written.clear()
+        self.writer.update(self.table, 3, {'status': 'Error'})
+        self.writer.update(self.table, 4, {'status': 'Error'},
+                           callback=lambda error: written.set())
+        self.assertTrue(written.wait(5))
+        self.assertTrue(self.writer._thread.is_alive())
+        self.assertEqual(['Completed', 'Completed', 'Error', 'Error'],
+                         [row[1] for row in self.rows()[1:5]])
+
+    def test_close_flushes(self):
+        writer = BatchedWriter(self.engine, max_items=100, max_delay=60)
+        writer.update(self.table, 3, {'status': 'Completed'})
+        writer.close()
+        self.assertEqual('Completed', self.rows()[3][1])
+        self.assertFalse(writer._thread.is_alive())
+        self.assertRaises(RuntimeError, writer.update, self.table, 3, {'status': 'Error'})
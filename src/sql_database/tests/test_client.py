@@ -6,14 +6,26 @@
 """
 Test cases for the database client
 """
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import tracemalloc
+import types
 import unittest
 
-from mock import patch
+from mock import Mock, patch
+from sqlalchemy import event, select
+from sqlalchemy.dialects import mysql
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm.session import Session
 
 from src.connection_exception import ConnectionException
 from src.sql_database import SQLDatabaseClient, SQLSettings
+from src.sql_database.statistics import TimedQueuePool
+from src.sql_database.tests.sqlite_stand_in import (create_stand_in_database,
+                                                    QueryCounter, SQLiteSettings)
 
 
 # pylint:disable=missing-docstring,protected-access,invalid-name
@@ -102,3 +114,477 @@ class TestDatabaseClient(unittest.TestCase):
         reduction_run_table = client.reduction_run()
         self.assertEqual(type(reduction_run_table.__bases__[0]), type(declarative_base()))
         self.assertIsNotNone(reduction_run_table.__table__)
+
+
+# pylint:disable=missing-docstring
+class TestDatabaseClientStandIn(unittest.TestCase):
+    """
+    Exercises the database client against a local SQLite stand-in
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'autoreduction.sqlite3')
+        create_stand_in_database(self.path)
+        self.client = SQLDatabaseClient(SQLiteSettings(self.path))
+        self.client.connect()
+
+    def tearDown(self):
+        if self.client.get_connection() is not None:
+            self.client.disconnect()
+        shutil.rmtree(self.directory)
+
+    def test_tables_are_reflected_once(self):
+        with QueryCounter(self.client._engine) as cold:
+            self.client.reduction_run()
+        self.assertGreater(cold.count, 0)
+        with QueryCounter(self.client._engine) as warm:
+            self.client.reduction_run()
+            self.client.instrument()
+            self.client.status()
+            self.client.experiment()
+        self.assertEqual(0, warm.count)
+
+    def test_tables_are_cached(self):
+        self.assertIs(self.client.reduction_run(), self.client.reduction_run())
+        self.assertIs(self.client.run_variables().reduction_run.property.mapper.class_,
+                      self.client.reduction_run())
+
+    def test_tables_share_declarative_base(self):
+        self.assertIs(self.client.instrument().__bases__[0],
+                      self.client.reduction_data_location().__bases__[0])
+        self.assertIs(self.client.status().metadata, self.client._meta_data)
+
+    def test_disconnect_invalidates_tables(self):
+        reduction_run = self.client.reduction_run()
+        self.client.disconnect()
+        self.assertEqual({}, self.client._models)
+        self.assertIsNone(self.client._base)
+        self.client.connect()
+        self.assertIsNot(reduction_run, self.client.reduction_run())
+
+    def test_reduction_run_relationships(self):
+        session = self.client.get_connection()
+        reduction_run = self.client.reduction_run()
+        session.add(reduction_run(run_number=1, instrument_id=1, experiment_id=1, status_id=1))
+        session.commit()
+        run = session.query(reduction_run).one()
+        self.assertEqual('WISH', run.instrument.name)
+        self.assertEqual('Queued', run.status.value)
+        self.assertEqual(1234567, run.experiment.reference_number)
+
+    def test_engine_pool_settings(self):
+        self.client.disconnect()
+        self.client = SQLDatabaseClient(SQLiteSettings(self.path, pool_size=2, max_overflow=1,
+                                                       pool_timeout=5, pool_recycle=60))
+        self.client.connect()
+        pool = self.client._engine.pool
+        self.assertEqual(2, pool.size())
+        self.assertEqual(1, pool._max_overflow)
+        self.assertEqual(5, pool._timeout)
+        self.assertEqual(60, pool._recycle)
+
+    def test_session_per_thread(self):
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(self.client.get_connection()))
+        thread.start()
+        thread.join()
+        self.assertIs(self.client.get_connection(), self.client.get_connection())
+        self.assertIsNot(self.client.get_connection(), sessions[0])
+
+    def test_remove_session(self):
+        session = self.client.get_connection()
+        self.client.remove_session()
+        self.assertIsNot(session, self.client.get_connection())
+
+    def test_session_scope_commits(self):
+        status = self.client.status()
+        with self.client.session_scope() as session:
+            self.assertIsNot(session, self.client.get_connection())
+            session.add(status(value='Cancelled'))
+        self.assertEqual(1, self.client.get_connection().query(status)
+                         .filter_by(value='Cancelled').count())
+
+    def test_session_scope_rolls_back(self):
+        status = self.client.status()
+        with self.assertRaises(RuntimeError):
+            with self.client.session_scope() as session:
+                session.add(status(value='Cancelled'))
+                session.flush()
+                raise RuntimeError()
+        self.assertEqual(0, self.client.get_connection().query(status)
+                         .filter_by(value='Cancelled').count())
+
+    def test_threads_share_bounded_pool(self):
+        self.client.disconnect()
+        self.client = SQLDatabaseClient(SQLiteSettings(self.path, pool_size=2, max_overflow=0))
+        self.client.connect()
+        self.client.remove_session()
+        connections = []
+        event.listen(self.client._engine, 'connect',
+                     lambda dbapi_connection, _: connections.append(dbapi_connection))
+        status = self.client.status()
+        results = []
+
+        def worker():
+            with self.client.session_scope() as session:
+                results.append(session.query(status).count())
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([5] * 8, results)
+        self.assertLessEqual(len(connections), 2)
+        self.assertEqual(0, self.client._engine.pool.checkedout())
+
+    def test_bulk_insert_runs(self):
+        runs = [{'run_number': number, 'run_version': 0, 'instrument_id': 1,
+                 'experiment_id': 1, 'status_id': 1} for number in range(25)]
+        with QueryCounter(self.client._engine) as counter:
+            ids = self.client.bulk_insert_runs(runs, chunk_size=10)
+        self.assertEqual(3, len([statement for statement in counter.statements
+                                 if statement.startswith('INSERT')]))
+        self.assertEqual(25, len(set(ids)))
+        reduction_run = self.client.reduction_run()
+        session = self.client.get_connection()
+        for number, run_id in enumerate(ids):
+            self.assertEqual(number, session.query(reduction_run).get(run_id).run_number)
+
+    def test_bulk_insert_runs_without_ids(self):
+        runs = [{'run_number': number, 'run_version': 0, 'instrument_id': 1,
+                 'experiment_id': 1, 'status_id': 1} for number in range(25)]
+        with QueryCounter(self.client._engine) as counter:
+            self.assertIsNone(self.client.bulk_insert_runs(runs, chunk_size=10,
+                                                           return_ids=False))
+        inserts = [statement for statement in counter.statements
+                   if statement.startswith('INSERT')]
+        self.assertEqual(3, len(inserts))
+        self.assertEqual(25, self.client.get_connection()
+                         .query(self.client.reduction_run()).count())
+
+    def test_bulk_insert_runs_duplicate_keys(self):
+        columns = ['run_number', 'run_version', 'instrument_id', 'experiment_id', 'status_id']
+        ids = self.client.bulk_insert_runs([(1, 0, 1, 1, 1)] * 3, columns=columns)
+        self.assertEqual(3, len(set(ids)))
+        reduction_run = self.client.reduction_run()
+        self.assertEqual(sorted(ids), [run.id for run in self.client.get_connection()
+                                       .query(reduction_run).order_by(reduction_run.id)])
+
+    def test_inserted_ids_mysql(self):
+        table = self.client.reduction_run().__table__
+        connection = Mock()
+        connection.dialect.name = 'mysql'
+        connection.execute.return_value.scalar.return_value = 2
+        result = Mock(lastrowid=10, rowcount=3)
+        self.assertEqual([10, 12, 14], self.client._inserted_ids(
+            connection, table, [{'run_number': 1}] * 3, result))
+        connection.dialect.name = 'oracle'
+        self.assertRaises(ValueError, self.client._inserted_ids, connection, table,
+                          [{'run_number': 1}] * 3, result)
+        self.assertEqual([5, 6], self.client._inserted_ids(
+            connection, table, [{'id': 5}, {'id': 6}], Mock(rowcount=2)))
+
+    def test_bulk_insert_runs_from_tuples(self):
+        columns = ['run_number', 'run_version', 'instrument_id', 'experiment_id', 'status_id']
+        ids = self.client.bulk_insert_runs([(1, 0, 1, 1, 1), (1, 1, 1, 1, 1), (1, 0, 2, 1, 1)],
+                                           columns=columns)
+        reduction_run = self.client.reduction_run()
+        session = self.client.get_connection()
+        runs = [session.query(reduction_run).get(run_id) for run_id in ids]
+        self.assertEqual([(1, 0, 1), (1, 1, 1), (1, 0, 2)],
+                         [(run.run_number, run.run_version, run.instrument_id) for run in runs])
+
+    def test_bulk_insert_tuples_without_columns(self):
+        self.assertRaises(ValueError, self.client.bulk_insert_runs, [(1, 0, 1, 1, 1)])
+
+    def test_bulk_insert_invalid_chunk_size(self):
+        self.assertRaises(ValueError, self.client.bulk_insert_runs,
+                          [{'run_number': 1, 'experiment_id': 1, 'status_id': 1}], chunk_size=0)
+
+    def test_bulk_upsert_run_variables(self):
+        run_ids = self.client.bulk_insert_runs([(1, 1, 1, 1), (2, 1, 1, 1)],
+                                               columns=['run_number', 'instrument_id',
+                                                        'experiment_id', 'status_id'])
+        keys = self.client.bulk_upsert_run_variables([(10, run_ids[0]), (11, run_ids[0])],
+                                                     columns=['variable_ptr_id',
+                                                              'reduction_run_id'])
+        self.assertEqual([10, 11], keys)
+        keys = self.client.bulk_upsert_run_variables(
+            [{'variable_ptr_id': 11, 'reduction_run_id': run_ids[1]},
+             {'variable_ptr_id': 12, 'reduction_run_id': run_ids[1]}], chunk_size=1)
+        self.assertEqual([11, 12], keys)
+        run_variable = self.client.run_variables()
+        rows = self.client.get_connection().query(run_variable) \
+            .order_by(run_variable.variable_ptr_id).all()
+        self.assertEqual([(10, run_ids[0]), (11, run_ids[1]), (12, run_ids[1])],
+                         [(row.variable_ptr_id, row.reduction_run_id) for row in rows])
+
+    def test_upsert_statement_mysql(self):
+        table = self.client.run_variables().__table__
+        with patch.object(self.client._engine.dialect, 'name', 'mysql'):
+            statement = self.client._upsert_statement(table, ['variable_ptr_id',
+                                                              'reduction_run_id'])
+        sql = str(statement.compile(dialect=mysql.dialect()))
+        self.assertIn('ON DUPLICATE KEY UPDATE reduction_run_id = VALUES(reduction_run_id)', sql)
+
+    def test_upsert_statement_unsupported(self):
+        table = self.client.run_variables().__table__
+        with patch.object(self.client._engine.dialect, 'name', 'oracle'):
+            self.assertRaises(ValueError, self.client._upsert_statement, table,
+                              ['variable_ptr_id', 'reduction_run_id'])
+
+    def _insert_synthetic_runs(self, count):
+        runs = [{'run_number': number, 'run_name': 'run-{:0>200}'.format(number),
+                 'instrument_id': 1, 'experiment_id': 1, 'status_id': 1}
+                for number in range(count)]
+        self.client.bulk_insert_runs(runs, chunk_size=5000)
+
+    @staticmethod
+    def _peak_memory(function):
+        tracemalloc.start()
+        try:
+            function()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_stream_query(self):
+        self._insert_synthetic_runs(100)
+        reduction_run = self.client.reduction_run()
+        query = self.client.get_connection().query(reduction_run).order_by(reduction_run.id)
+        streamed = self.client.stream_query(query, batch_size=7)
+        self.assertIsInstance(streamed, types.GeneratorType)
+        self.assertEqual(list(range(100)), [run.run_number for run in streamed])
+
+    def test_stream_core_query(self):
+        self._insert_synthetic_runs(100)
+        table = self.client.reduction_run().__table__
+        query = select([table.c.id, table.c.run_number]).order_by(table.c.id)
+        checked_out = self.client._engine.pool.checkedout()
+        rows = list(self.client.stream_query(query, batch_size=7))
+        self.assertEqual(100, len(rows))
+        self.assertIsInstance(rows[0], tuple)
+        self.assertEqual(list(range(100)), [row[1] for row in rows])
+        self.assertEqual(checked_out, self.client._engine.pool.checkedout())
+
+    def test_stream_query_bounded_memory(self):
+        self._insert_synthetic_runs(10000)
+        reduction_run = self.client.reduction_run()
+        session = self.client.get_connection()
+
+        def load_all():
+            for _ in session.query(reduction_run).all():
+                pass
+
+        def stream():
+            for _ in self.client.stream_query(session.query(reduction_run), batch_size=500):
+                pass
+
+        all_peak = self._peak_memory(load_all)
+        session.expunge_all()
+        stream_peak = self._peak_memory(stream)
+        self.assertLess(stream_peak * 4, all_peak)
+
+    def _insert_related_rows(self, count):
+        run_ids = self.client.bulk_insert_runs(
+            [{'run_number': number, 'instrument_id': 1 + number % 2, 'experiment_id': 1,
+              'status_id': 1 + number % 5} for number in range(count)])
+        locations = [{'file_path': 'path/{}'.format(run_id), 'reduction_run_id': run_id}
+                     for run_id in run_ids]
+        with self.client._engine.begin() as connection:
+            connection.execute(self.client.reduction_data_location().__table__.insert(),
+                               locations)
+            connection.execute(self.client.reduction_location().__table__.insert(), locations)
+        self.client.bulk_upsert_run_variables([(run_id, run_id) for run_id in run_ids],
+                                              columns=['variable_ptr_id', 'reduction_run_id'])
+
+    def _assert_single_query(self, query_function, **kwargs):
+        with QueryCounter(self.client._engine) as counter:
+            rows = query_function(**kwargs).all()
+            for row in rows:
+                run = getattr(row, 'reduction_run', row)
+                self.assertIsNotNone(run.instrument.name)
+                self.assertIsNotNone(run.status.value)
+                self.assertIsNotNone(run.experiment.reference_number)
+        self.assertEqual(50, len(rows))
+        return counter.count
+
+    def test_lazy_loading_queries_per_row(self):
+        self._insert_related_rows(50)
+        reduction_run = self.client.reduction_run()
+        with QueryCounter(self.client._engine) as counter:
+            for run in self.client.get_connection().query(reduction_run).all():
+                _ = run.instrument.name, run.status.value
+        self.assertGreater(counter.count, 5)
+
+    def test_reduction_run_query(self):
+        self._insert_related_rows(50)
+        self.assertEqual(1, self._assert_single_query(self.client.reduction_run_query))
+
+    def test_reduction_run_query_selectin(self):
+        self._insert_related_rows(50)
+        self.assertEqual(4, self._assert_single_query(self.client.reduction_run_query,
+                                                      strategy='selectin'))
+
+    def test_run_child_queries(self):
+        self._insert_related_rows(50)
+        for query_function in [self.client.reduction_data_location_query,
+                               self.client.reduction_location_query,
+                               self.client.run_variable_query]:
+            self.client.get_connection().expunge_all()
+            self.assertEqual(1, self._assert_single_query(query_function))
+
+    def test_reduction_run_query_with_session(self):
+        with self.client.session_scope() as session:
+            query = self.client.reduction_run_query(session=session)
+            self.assertIs(session, query.session)
+
+    def test_lookup_id(self):
+        self.client.status()
+        self.client.instrument()
+        with QueryCounter(self.client._engine) as cold:
+            self.assertEqual(2, self.client.lookup_id('instrument', 'GEM'))
+            self.assertEqual(5, self.client.lookup_id('status', 'Error'))
+        self.assertEqual(2, cold.count)
+        with QueryCounter(self.client._engine) as warm:
+            self.assertEqual(1, self.client.lookup_id('instrument', 'WISH'))
+            self.assertEqual(1, self.client.lookup_id('status', 'Queued'))
+        self.assertEqual(0, warm.count)
+        self.assertEqual(2, self.client.lookup_stats()['hits'])
+        self.assertEqual(2, self.client.lookup_stats()['misses'])
+
+    def test_lookup_new_row(self):
+        self.assertIsNone(self.client.lookup_id('instrument', 'MARI'))
+        with self.client.session_scope() as session:
+            session.add(self.client.instrument()(name='MARI'))
+        self.assertEqual(3, self.client.lookup_id('instrument', 'MARI'))
+
+    def test_preload_and_invalidate_lookups(self):
+        self.client.preload_lookups()
+        self.assertEqual({'instrument': 2, 'status': 5, 'experiment': 1},
+                         self.client.lookup_stats()['rows'])
+        self.assertEqual(1, self.client.lookup_id('experiment', 1234567))
+        self.client.invalidate_lookups()
+        self.assertEqual({}, self.client.lookup_stats()['rows'])
+
+    def test_disconnect_invalidates_lookups(self):
+        self.client.lookup_id('status', 'Queued')
+        self.client.disconnect()
+        self.assertEqual({}, self.client.lookup_stats()['rows'])
+
+    def test_get_stats_disabled(self):
+        self.assertIsNone(self.client.get_stats())
+        self.assertFalse(self.client._engine.dispatch.after_cursor_execute)
+        self.assertNotIsInstance(self.client._engine.pool, TimedQueuePool)
+
+    def test_get_stats(self):
+        self.client.disconnect()
+        self.client = SQLDatabaseClient(SQLiteSettings(self.path, record_statistics=True))
+        self.client.connect()
+        self.client.lookup_id('instrument', 'WISH')
+        self.client.lookup_id('status', 'Queued')
+        stats = self.client.get_stats()
+        selects = [key for key in stats['statements'] if 'reduction_viewer_status' in key]
+        self.assertTrue(selects)
+        self.assertGreater(stats['pool_checkout']['count'], 0)
+
+    def _insert_hot_path_runs(self):
+        columns = ['run_number', 'run_version', 'instrument_id', 'experiment_id', 'status_id']
+        return self.client.bulk_insert_runs([(1, 0, 1, 1, 1), (1, 1, 1, 1, 1),
+                                             (1, 0, 2, 1, 1), (2, 0, 1, 1, 1)],
+                                            columns=columns)
+
+    def test_hot_path_run_by_instrument_run_number(self):
+        run_ids = self._insert_hot_path_runs()
+        rows = self.client.hot_path_query('run_by_instrument_run_number',
+                                          instrument='WISH', run_number=1)
+        self.assertEqual(run_ids[:2], [row.id for row in rows])
+
+    def test_hot_path_latest_run_version(self):
+        run_ids = self._insert_hot_path_runs()
+        rows = self.client.hot_path_query('latest_run_version', instrument='WISH', run_number=1)
+        self.assertEqual([run_ids[1]], [row.id for row in rows])
+        self.assertEqual([], self.client.hot_path_query('latest_run_version',
+                                                        instrument='WISH', run_number=3))
+
+    def test_hot_path_data_locations_for_run(self):
+        run_ids = self._insert_hot_path_runs()
+        location = self.client.reduction_data_location()
+        with self.client.session_scope() as session:
+            session.add_all([location(file_path='a', reduction_run_id=run_ids[0]),
+                             location(file_path='b', reduction_run_id=run_ids[0]),
+                             location(file_path='c', reduction_run_id=run_ids[1])])
+        rows = self.client.hot_path_query('data_locations_for_run', run_id=run_ids[0])
+        self.assertEqual(['a', 'b'], [row.file_path for row in rows])
+
+    def test_hot_path_statement_compiled_once(self):
+        self._insert_hot_path_runs()
+        for run_number in range(5):
+            self.client.hot_path_query('latest_run_version', instrument='WISH',
+                                       run_number=run_number)
+        self.assertEqual(1, len(self.client._compiled_cache))
+        self.client.disconnect()
+        self.assertEqual({}, self.client._compiled_cache)
+        self.assertEqual({}, self.client._statements)
+
+    def test_hot_path_unknown_query(self):
+        self.assertRaises(KeyError, self.client.hot_path_query, 'not-a-query')
+
+    def test_batched_writer_flushed_on_disconnect(self):
+        run_ids = self._insert_hot_path_runs()
+        writer = self.client.batched_writer(max_delay=60)
+        self.assertIs(writer, self.client.batched_writer())
+        for run_id in run_ids:
+            writer.update(self.client.reduction_run(), run_id, {'status_id': 3})
+        self.client.disconnect()
+        self.assertIsNone(self.client._batched_writer)
+        self.client.connect()
+        table = self.client.reduction_run().__table__
+        statuses = self.client._engine.execute(select([table.c.status_id])).fetchall()
+        self.assertEqual([(3,)] * 4, statuses)
+
+    def _run_statuses(self):
+        table = self.client.reduction_run().__table__
+        query = select([table.c.status_id, table.c.message]).order_by(table.c.id)
+        return self.client._engine.execute(query).fetchall()
+
+    def test_transition_runs_by_id(self):
+        run_ids = self._insert_hot_path_runs()
+        with QueryCounter(self.client._engine) as counter:
+            updated = self.client.transition_runs('Error', run_ids=run_ids[:3],
+                                                  message='failed', chunk_size=2)
+        self.assertEqual(3, updated)
+        updates = [statement for statement in counter.statements
+                   if statement.startswith('UPDATE')]
+        self.assertEqual(2, len(updates))
+        self.assertEqual([(5, 'failed')] * 3 + [(1, None)], self._run_statuses())
+
+    def test_transition_runs_by_criteria(self):
+        self._insert_hot_path_runs()
+        self.client.transition_runs(2, run_ids=[1])
+        finished = datetime.datetime(2020, 1, 1)
+        updated = self.client.transition_runs('Error', instrument='WISH',
+                                              current_status='Queued', finished=finished)
+        self.assertEqual(2, updated)
+        self.assertEqual([2, 5, 1, 5], [row.status_id for row in self._run_statuses()])
+        table = self.client.reduction_run().__table__
+        finish_times = self.client._engine.execute(select([table.c.finished])).fetchall()
+        self.assertEqual([None, finished, None, finished], [row[0] for row in finish_times])
+
+    def test_transition_runs_unknown_instrument(self):
+        self._insert_hot_path_runs()
+        self.assertEqual(0, self.client.transition_runs('Error', instrument='NOT-AN-INSTRUMENT'))
+
+    def test_transition_runs_invalid(self):
+        self.assertRaises(ValueError, self.client.transition_runs, 'Error')
+        self.assertRaises(ValueError, self.client.transition_runs, 'NOT-A-STATUS', run_ids=[1])
+
+    def test_transition_runs_bypasses_session(self):
+        run_ids = self._insert_hot_path_runs()
+        session = self.client.get_connection()
+        session.query(self.client.reduction_run()).all()
+        identity_map_size = len(session.identity_map)
+        self.client.transition_runs('Completed', run_ids=run_ids)
+        self.assertEqual(identity_map_size, len(session.identity_map))
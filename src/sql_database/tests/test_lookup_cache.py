@@ -0,0 +1,70 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for the lookup cache
+"""
+import unittest
+
+from mock import Mock
+
+from src.sql_database.lookup_cache import LookupCache
+
+
+# pylint:disable=missing-docstring
+class TestLookupCache(unittest.TestCase):
+
+    def setUp(self):
+        self.time = 0
+        self.load_table = Mock(return_value={'WISH': 1, 'GEM': 2})
+        self.load_key = Mock(return_value=None)
+        self.cache = LookupCache({'instrument': (self.load_table, self.load_key)},
+                                 ttl=10, clock=lambda: self.time)
+
+    def test_loads_table_once(self):
+        self.assertEqual(1, self.cache.get('instrument', 'WISH'))
+        self.assertEqual(2, self.cache.get('instrument', 'GEM'))
+        self.assertEqual(1, self.cache.get('instrument', 'WISH'))
+        self.load_table.assert_called_once()
+        self.assertEqual(2, self.cache.hits)
+        self.assertEqual(1, self.cache.misses)
+
+    def test_reloads_after_ttl(self):
+        self.cache.get('instrument', 'WISH')
+        self.time = 9
+        self.cache.get('instrument', 'WISH')
+        self.assertEqual(1, self.load_table.call_count)
+        self.time = 10
+        self.cache.get('instrument', 'WISH')
+        self.assertEqual(2, self.load_table.call_count)
+
+    def test_missing_key_is_loaded(self):
+        self.cache.get('instrument', 'WISH')
+        self.load_key.return_value = 3
+        self.assertEqual(3, self.cache.get('instrument', 'MARI'))
+        self.assertEqual(3, self.cache.get('instrument', 'MARI'))
+        self.load_key.assert_called_once_with('MARI')
+
+    def test_unknown_key(self):
+        self.cache.get('instrument', 'WISH')
+        self.assertIsNone(self.cache.get('instrument', 'NOT-AN-INSTRUMENT'))
+
+    def test_unknown_table(self):
+        self.assertRaises(KeyError, self.cache.get, 'not-a-table', 'WISH')
+
+    def test_preload(self):
+        self.cache.preload()
+        self.cache.get('instrument', 'WISH')
+        self.load_table.assert_called_once()
+        self.assertEqual({'hits': 1, 'misses': 0, 'rows': {'instrument': 2}},
+                         self.cache.stats())
+
+    def test_invalidate(self):
+        self.cache.get('instrument', 'WISH')
+        self.cache.invalidate('instrument')
+        self.cache.get('instrument', 'WISH')
+        self.cache.invalidate()
+        self.cache.get('instrument', 'WISH')
+        self.assertEqual(3, self.load_table.call_count)
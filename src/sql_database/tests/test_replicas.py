@@ -0,0 +1,112 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for read replica routing
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock, Mock
+from sqlalchemy.exc import OperationalError
+
+from src.sql_database import SQLDatabaseClient
+from src.sql_database.replicas import ReplicaRouter
+from src.sql_database.tests.sqlite_stand_in import create_stand_in_database, SQLiteSettings
+
+
+# pylint:disable=missing-docstring,protected-access
+class TestReplicaRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.time = 0
+        self.primary = Mock(name='primary')
+        self.replicas = [MagicMock(name='replica-1'), MagicMock(name='replica-2')]
+        self.router = ReplicaRouter(self.replicas, self.primary, retry_interval=10,
+                                    clock=lambda: self.time)
+
+    def test_round_robin(self):
+        self.assertEqual(self.replicas * 2, [self.router.choose() for _ in range(4)])
+
+    def test_unhealthy_replica_skipped(self):
+        self.router.mark_unhealthy(self.replicas[0])
+        self.assertEqual([self.replicas[1]] * 3, [self.router.choose() for _ in range(3)])
+        self.assertEqual([self.replicas[1]], self.router.healthy_replicas())
+
+    def test_falls_back_to_primary(self):
+        for replica in self.replicas:
+            self.router.mark_unhealthy(replica)
+        self.assertIs(self.primary, self.router.choose())
+
+    def test_replica_health_checked_after_retry_interval(self):
+        self.router.mark_unhealthy(self.replicas[0])
+        self.time = 10
+        self.assertIs(self.replicas[0], self.router.choose())
+        self.replicas[0].connect.assert_called_once()
+        self.assertEqual(self.replicas, self.router.healthy_replicas())
+
+    def test_failed_health_check(self):
+        self.router.mark_unhealthy(self.replicas[0])
+        self.replicas[0].connect.side_effect = OperationalError('SELECT 1', {}, None)
+        self.time = 10
+        self.assertIs(self.replicas[1], self.router.choose())
+        self.assertEqual([self.replicas[1]], self.router.healthy_replicas())
+
+    def test_no_replicas(self):
+        router = ReplicaRouter([], self.primary)
+        self.assertIs(self.primary, router.choose())
+
+
+class TestClientReplicas(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.primary = os.path.join(self.directory, 'primary.sqlite3')
+        self.replicas = [os.path.join(self.directory, 'replica-{}.sqlite3'.format(number))
+                         for number in range(2)]
+        create_stand_in_database(self.primary, instruments=['PRIMARY'])
+        for number, path in enumerate(self.replicas):
+            create_stand_in_database(path, instruments=['REPLICA-{}'.format(number)])
+        self.client = None
+
+    def tearDown(self):
+        self.client.disconnect()
+        shutil.rmtree(self.directory)
+
+    def connect(self, replicas):
+        self.client = SQLDatabaseClient(SQLiteSettings(self.primary, replica_hosts=replicas))
+        self.client.connect()
+
+    def read_instrument(self):
+        with self.client.read_session_scope() as session:
+            return session.query(self.client.instrument()).one().name
+
+    def test_reads_round_robin(self):
+        self.connect(self.replicas)
+        self.assertEqual(['REPLICA-0', 'REPLICA-1', 'REPLICA-0'],
+                         [self.read_instrument() for _ in range(3)])
+        self.assertEqual('PRIMARY', self.client.get_connection()
+                         .query(self.client.instrument()).one().name)
+
+    def test_reads_without_replicas_use_primary(self):
+        self.connect([])
+        self.assertEqual('PRIMARY', self.read_instrument())
+
+    def test_failed_replica_falls_back(self):
+        missing = os.path.join(self.directory, 'missing', 'replica.sqlite3')
+        self.connect([missing])
+        with self.assertRaises(OperationalError):
+            self.read_instrument()
+        self.assertEqual([], self.client._replicas.healthy_replicas())
+        self.assertEqual('PRIMARY', self.read_instrument())
+
+    def test_read_session_is_not_committed(self):
+        self.connect(self.replicas[:1])
+        with self.client.read_session_scope() as session:
+            session.add(self.client.instrument()(name='NEW'))
+            session.flush()
+        self.assertEqual('REPLICA-0', self.read_instrument())
@@ -0,0 +1,141 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for the schema snapshot
+"""
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from mock import patch
+import sqlalchemy
+from sqlalchemy import create_engine
+
+from src.sql_database import SQLDatabaseClient
+from src.sql_database.schema_snapshot import (main, read_snapshot, schema_checksum,
+                                              SNAPSHOT_VERSION, SnapshotError, TABLE_NAMES,
+                                              write_snapshot)
+from src.sql_database.tests.sqlite_stand_in import (create_stand_in_database,
+                                                    QueryCounter, SQLiteSettings)
+
+TABLE_FUNCTIONS = ['instrument', 'status', 'experiment', 'reduction_run',
+                   'reduction_data_location', 'reduction_location', 'run_variables']
+
+
+def describe_table(table):
+    """ :return: comparable description of the columns and keys of a Table """
+    columns = [(column.name, str(column.type), column.nullable, column.primary_key)
+               for column in table.columns]
+    foreign_keys = sorted(key.target_fullname for key in table.foreign_keys)
+    return columns, foreign_keys
+
+
+# pylint:disable=missing-docstring,protected-access
+class TestSchemaSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = os.path.join(self.directory, 'autoreduction.sqlite3')
+        self.snapshot = os.path.join(self.directory, 'schema.snapshot')
+        create_stand_in_database(self.database)
+        self.engine = create_engine('sqlite:///{}'.format(self.database))
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def test_write_and_read(self):
+        write_snapshot(self.engine, self.snapshot)
+        meta_data, checksum = read_snapshot(self.snapshot)
+        self.assertEqual(sorted(TABLE_NAMES), sorted(meta_data.tables))
+        self.assertEqual(schema_checksum(self.engine), checksum)
+
+    def test_read_wrong_version(self):
+        with open(self.snapshot, 'wb') as snapshot_file:
+            pickle.dump({'version': -1}, snapshot_file)
+        self.assertRaises(SnapshotError, read_snapshot, self.snapshot)
+
+    def test_read_missing_file(self):
+        self.assertRaises(SnapshotError, read_snapshot, self.snapshot)
+
+    def test_read_invalid_contents(self):
+        for contents in ([1, 2], {'version': SNAPSHOT_VERSION,
+                                  'sqlalchemy_version': sqlalchemy.__version__}):
+            with open(self.snapshot, 'wb') as snapshot_file:
+                pickle.dump(contents, snapshot_file)
+            self.assertRaises(SnapshotError, read_snapshot, self.snapshot)
+        # A pickle of a class that can no longer be imported
+        with open(self.snapshot, 'wb') as snapshot_file:
+            snapshot_file.write(b'cnot_a_module\nMissing\n.')
+        self.assertRaises(SnapshotError, read_snapshot, self.snapshot)
+
+    def test_client_reflects_when_snapshot_invalid(self):
+        with open(self.snapshot, 'wb') as snapshot_file:
+            pickle.dump([1, 2], snapshot_file)
+        client = SQLDatabaseClient(SQLiteSettings(self.database, schema_snapshot=self.snapshot))
+        client.connect()
+        self.assertIsNotNone(client.status().__table__)
+        client.disconnect()
+
+    def test_checksum_changes_with_schema(self):
+        checksum = schema_checksum(self.engine)
+        self.engine.execute('ALTER TABLE reduction_viewer_status ADD COLUMN colour TEXT')
+        self.assertNotEqual(checksum, schema_checksum(self.engine))
+
+    def test_snapshot_tables_match_reflection(self):
+        write_snapshot(self.engine, self.snapshot)
+        reflected = SQLDatabaseClient(SQLiteSettings(self.database))
+        from_snapshot = SQLDatabaseClient(SQLiteSettings(self.database,
+                                                         schema_snapshot=self.snapshot))
+        reflected.connect()
+        from_snapshot.connect()
+        for name in TABLE_FUNCTIONS:
+            reflected_table = getattr(reflected, name)()
+            snapshot_table = getattr(from_snapshot, name)()
+            self.assertEqual(describe_table(reflected_table.__table__),
+                             describe_table(snapshot_table.__table__))
+            self.assertEqual(sorted(reflected_table.__mapper__.relationships.keys()),
+                             sorted(snapshot_table.__mapper__.relationships.keys()))
+        reflected.disconnect()
+        from_snapshot.disconnect()
+
+    def test_client_does_not_reflect_with_snapshot(self):
+        write_snapshot(self.engine, self.snapshot)
+        client = SQLDatabaseClient(SQLiteSettings(self.database, schema_snapshot=self.snapshot))
+        client.connect()
+        with QueryCounter(client._engine) as counter:
+            for name in TABLE_FUNCTIONS:
+                getattr(client, name)()
+        self.assertEqual(0, counter.count)
+        client.disconnect()
+
+    def test_client_reflects_when_schema_changes(self):
+        write_snapshot(self.engine, self.snapshot)
+        connection = sqlite3.connect(self.database)
+        connection.execute('ALTER TABLE reduction_viewer_status ADD COLUMN colour TEXT')
+        connection.close()
+        client = SQLDatabaseClient(SQLiteSettings(self.database, schema_snapshot=self.snapshot))
+        client.connect()
+        self.assertIn('colour', client.status().__table__.columns)
+        client.disconnect()
+
+    def test_client_reflects_when_snapshot_missing(self):
+        client = SQLDatabaseClient(SQLiteSettings(self.database, schema_snapshot=self.snapshot))
+        client.connect()
+        self.assertIsNotNone(client.status().__table__)
+        client.disconnect()
+
+    @patch('src.sql_database.schema_snapshot.SQLSettings.get_full_connection_string')
+    def test_main(self, mock_connection_string):
+        mock_connection_string.return_value = 'sqlite:///{}'.format(self.database)
+        main([self.snapshot, '--username', 'user', '--password', 'pass', '--host', 'host',
+              '--port', '3307'])
+        mock_connection_string.assert_called_once_with(host='host:3307')
+        meta_data, _ = read_snapshot(self.snapshot)
+        self.assertEqual(sorted(TABLE_NAMES), sorted(meta_data.tables))
@@ -0,0 +1,93 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for the statement statistics
+"""
+import unittest
+
+from mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from src.sql_database.statistics import (normalise_statement, StatementStatistics,
+                                         TimedQueuePool)
+
+
+# pylint:disable=missing-docstring,protected-access
+class TestStatementStatistics(unittest.TestCase):
+
+    def test_normalise_statement(self):
+        self.assertEqual('SELECT * FROM run WHERE id = ? AND name = ?',
+                         normalise_statement("SELECT *\n  FROM run WHERE id = 12 AND "
+                                             "name = 'it''s'"))
+        self.assertEqual('SELECT * FROM run WHERE id IN (?)',
+                         normalise_statement('SELECT * FROM run WHERE id IN (%s, %s, %s)'))
+        self.assertEqual('INSERT INTO run (a, b) VALUES (?)',
+                         normalise_statement('INSERT INTO run (a, b) VALUES (?, ?), (?, ?)'))
+        self.assertEqual('SELECT a FROM table1 WHERE b = ?',
+                         normalise_statement('SELECT a FROM table1 WHERE b = %(b_1)s'))
+
+    def test_record_statement(self):
+        statistics = StatementStatistics()
+        statistics.record_statement('SELECT 1 FROM run WHERE id = 1', 0.002, 1)
+        statistics.record_statement('SELECT 1 FROM run WHERE id = 2', 0.02, 1)
+        snapshot = statistics.snapshot()
+        record = snapshot['statements']['SELECT ? FROM run WHERE id = ?']
+        self.assertEqual(2, record['count'])
+        self.assertEqual(2, record['rows'])
+        self.assertAlmostEqual(0.022, record['sum'])
+        self.assertEqual(0.02, record['max'])
+        self.assertIn((0.0025, 1), record['buckets'])
+        self.assertIn(('+Inf', 2), record['buckets'])
+        self.assertEqual(0, snapshot['slow_queries'])
+
+    @patch('src.sql_database.statistics.SLOW_QUERY_LOG')
+    def test_slow_query_log(self, mock_log):
+        statistics = StatementStatistics(slow_query_threshold=0.5)
+        statistics.record_statement('SELECT 1', 0.4)
+        mock_log.warning.assert_not_called()
+        statistics.record_statement('SELECT 1', 0.6)
+        mock_log.warning.assert_called_once()
+        self.assertEqual(1, statistics.snapshot()['slow_queries'])
+
+    def test_attach_to_engine(self):
+        engine = create_engine('sqlite://', poolclass=TimedQueuePool)
+        statistics = StatementStatistics()
+        statistics.attach(engine)
+        engine.execute('SELECT 1').fetchall()
+        snapshot = statistics.snapshot()
+        self.assertEqual(1, snapshot['statements']['SELECT ?']['count'])
+        self.assertEqual(1, snapshot['pool_checkout']['count'])
+        statistics.detach(engine)
+        engine.execute('SELECT 1').fetchall()
+        self.assertEqual(1, statistics.snapshot()['statements']['SELECT ?']['count'])
+
+    def test_failed_statements_not_kept(self):
+        engine = create_engine('sqlite://', poolclass=TimedQueuePool)
+        statistics = StatementStatistics()
+        statistics.attach(engine)
+        with engine.connect() as connection:
+            for _ in range(3):
+                self.assertRaises(OperationalError, connection.execute, 'SELECT * FROM missing')
+            self.assertEqual([], connection.info['statement_start'])
+            connection.execute('SELECT 1').fetchall()
+        self.assertEqual(1, statistics.snapshot()['statements']['SELECT ?']['count'])
+
+    def test_recreated_pool_keeps_statistics(self):
+        engine = create_engine('sqlite://', poolclass=TimedQueuePool)
+        statistics = StatementStatistics()
+        statistics.attach(engine)
+        engine.dispose()
+        self.assertIs(statistics, engine.pool.statistics)
+
+    def test_reset(self):
+        statistics = StatementStatistics()
+        statistics.record_statement('SELECT 1', 0.1)
+        statistics.record_checkout(0.1)
+        statistics.reset()
+        snapshot = statistics.snapshot()
+        self.assertEqual({}, snapshot['statements'])
+        self.assertEqual(0, snapshot['pool_checkout']['count'])
@@ -0,0 +1,25 @@
+# ################################################################################# #
+# ServiceClients Repository : https://github.com/ISISSoftwareServices/ServiceClients
+#
+# Copyright &copy; 2020 ISIS Rutherford Appleton Laboratory UKRI
+# ################################################################################# #
+"""
+Test cases for the latency histogram
+"""
+import unittest
+
+from src.histogram import Histogram
+
+
+# pylint:disable=missing-docstring
+class TestHistogram(unittest.TestCase):
+
+    def test_buckets(self):
+        histogram = Histogram(buckets=(1.0, 2.0))
+        for value in (0.5, 1.0, 1.5, 2.0, 3.0):
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual([(1.0, 2), (2.0, 4), ('+Inf', 5)], snapshot['buckets'])
+        self.assertEqual(5, snapshot['count'])
+        self.assertEqual(8.0, snapshot['sum'])
+        self.assertEqual(3.0, snapshot['max'])